@@ -3,87 +3,162 @@ import sys
 from src.scrape_hazards import scrape_hazards
 from src.ingest_universal import ingest_universal
 from src.process_pdfs import process_pdfs
-from src.export import export_to_hf_dataset
-from src.verify_data import verify_sqlite, verify_lancedb
-from src.store import init_db as init_sqlite, save_document as save_sqlite
-from src.store_lancedb import init_db as init_lancedb, save_document as save_lancedb
-
-def process_url(url, use_lancedb=False):
-    print(f"Processing {url}...")
-    content, content_type = fetch_url(url)
-    if not content:
-        print(f"Failed to fetch {url}")
-        return
-
-    print(f"  Type: {content_type}")
-    text = extract_content(content, content_type)
-    if not text:
-        print(f"  No text extracted from {url}")
-        return
-    
-    print(f"  Extracted {len(text)} characters.")
-    embedding = generate_embedding(text)
-    
-    metadata = {"original_url": url}
-    
-    if use_lancedb:
-        save_lancedb(url, content_type, text, embedding, metadata)
-        print(f"  Saved to LanceDB.")
-    else:
-        save_sqlite(url, content_type, text, embedding, metadata)
-        print(f"  Saved to SQLite.")
+from src.ingest import process_url
+from src.export import export_to_hf_dataset, export_delta, export_sharded
+from src.replay_cache import CACHE_DIR
+from src.query import facet_counts, parse_where, print_facets, hazards_citing
+from src.memory import set_budget, get_budget
+from src.reembed import reembed
+from src.work_queue import WorkQueue, run_worker, enqueue_pdfs, enqueue_urls, print_counts, QUEUE_DB
+from src.verify_data import verify, print_report
+from src.store import init_db as init_sqlite, normalize_links
+from src.store_lancedb import init_db as init_lancedb, maintain
+from src.post_write import after_writes
 
 def main():
     parser = argparse.ArgumentParser(description="Hazards Dataset Builder")
     parser.add_argument("--urls", nargs="+", help="List of URLs to process")
     parser.add_argument("--file", help="File containing URLs (one per line)")
     parser.add_argument("--export", action="store_true", help="Export DB to HF Dataset")
-    parser.add_argument("--use-lancedb", action="store_true", help="Use LanceDB instead of SQLite")
+    parser.add_argument("--use-lancedb", action="store_true", help="Export from LanceDB instead of SQLite")
     parser.add_argument("--push-to-hub", action="store_true", help="Push exported dataset to Hugging Face Hub")
     parser.add_argument("--repo-id", help="Hugging Face Repository ID (e.g. username/dataset)")
     parser.add_argument("--structured", action="store_true", help="Export structured dataset")
+    parser.add_argument("--delta", action="store_true", help="Export only rows added, changed or deleted since the last export as Parquet shards")
+    parser.add_argument("--sharded", action="store_true", help="Export SQLite as zstd Parquet shards written in parallel under sharded/, published to the Hub in one commit")
+    parser.add_argument("--partition-by", choices=["rows", "hazard_type"], default="rows", help="Shard split for --sharded")
+    parser.add_argument("--export-workers", type=int, help="Shard writer processes for --sharded")
+    parser.add_argument("--where", action="append", help="Export filter column=value[,value] (repeatable)")
+    parser.add_argument("--columns", nargs="+", help="Columns to export")
+    parser.add_argument("--facets", action="store_true", help="Print hazard/phase/audience counts for structured_hazards")
+    parser.add_argument("--cites", metavar="DOMAIN", help="Print hazards whose pages cite a source on DOMAIN (e.g. ready.gov)")
     
     parser.add_argument("--scrape", action="store_true", help="Scrape hazards")
     parser.add_argument("--ingest", action="store_true", help="Ingest universal data")
-    parser.add_argument("--process", action="store_true", help="Process PDFs")
+    parser.add_argument("--crawl", nargs="+", help="Seed URLs to crawl and ingest")
+    parser.add_argument("--crawl-depth", type=int, default=2, help="Link depth for --crawl")
+    parser.add_argument("--max-pages", type=int, default=100, help="Page budget for --crawl")
+    parser.add_argument("--process", action="store_true", help="Process PDFs (skips content already processed, unless extract_metadata changed since)")
     parser.add_argument("--limit", type=int, help="Limit for scraper")
+    parser.add_argument("--scrape-cache", help="Record/replay HTTP cache directory for the scraper")
+    parser.add_argument("--offline", action="store_true", help="Scrape from the replay cache only")
+    parser.add_argument("--force-scrape", action="store_true", help="Re-store every hazard, ignoring scrape checkpoints")
+    parser.add_argument("--embed-pool", action="store_true", help="Embed processed PDFs with a multi-process pool")
+    parser.add_argument("--force-process", action="store_true", help="Reprocess PDFs whose content was already processed with the current extract_metadata")
+    parser.add_argument("--sync", action="store_true", help="Sync SQLite changes into LanceDB")
+    parser.add_argument("--full-sync", action="store_true", help="Rebuild LanceDB tables from a full SQLite snapshot")
+    parser.add_argument("--no-sync", action="store_true", help="Don't sync new rows to LanceDB after scraping/ingesting/processing")
+    parser.add_argument("--verify", action="store_true", help="Check both stores and write data/verify_report.json")
+    parser.add_argument("--maintain", action="store_true", help="Compact, prune and index LanceDB tables; normalize older SQLite rows")
+    parser.add_argument("--reembed", metavar="MODEL", help="Re-embed stored text with a new model and switch to it")
+    parser.add_argument("--enqueue", action="store_true", help="Queue --process/--urls/--file work for workers instead of running it")
+    parser.add_argument("--worker", action="store_true", help="Run queued jobs until the queue is empty")
+    parser.add_argument("--queue-db", default=QUEUE_DB, help="Work queue database (on a shared filesystem for several nodes)")
+    parser.add_argument("--memory-budget", help="Adapt batch sizes to stay under this much RSS and report peaks (e.g. 2G)")
     
     args = parser.parse_args()
 
+    if args.memory_budget:
+        try:
+            set_budget(args.memory_budget)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+
     if args.use_lancedb:
         init_lancedb()
     else:
         init_sqlite()
 
     if args.scrape:
-        scrape_hazards(limit=args.limit)
+        cache_dir = args.scrape_cache or (CACHE_DIR if args.offline else None)
+        scrape_hazards(limit=args.limit, cache_dir=cache_dir, cache_mode="offline" if args.offline else "record",
+                       force=args.force_scrape)
         
     if args.ingest:
         ingest_universal()
+
+    if args.crawl:
+        for seed in args.crawl:
+            ingest_universal(seed, crawl_depth=args.crawl_depth, max_pages=args.max_pages)
         
-    if args.process:
-        process_pdfs(limit=args.limit)
+    if args.process and args.enqueue:
+        enqueue_pdfs(force=args.force_process, db_name=args.queue_db)
+    elif args.process:
+        process_pdfs(limit=args.limit, force=args.force_process, embed_pool=args.embed_pool)
 
-    if args.urls:
-        for url in args.urls:
-            process_url(url, use_lancedb=args.use_lancedb)
-            
+    urls = list(args.urls or [])
     if args.file:
         try:
             with open(args.file, 'r') as f:
-                urls = [line.strip() for line in f if line.strip()]
-            for url in urls:
-                process_url(url, use_lancedb=args.use_lancedb)
+                urls += [line.strip() for line in f if line.strip()]
         except FileNotFoundError:
             print(f"File not found: {args.file}")
 
-    if args.export:
+    if urls and args.enqueue:
+        enqueue_urls(urls, db_name=args.queue_db)
+    else:
+        for url in urls:
+            process_url(url)
+
+    if args.worker:
+        queue = WorkQueue(args.queue_db)
+        # The post-write hook below runs once for the worker's jobs and the writers above
+        run_worker(queue, exit_when_empty=True, sync=False)
+        print_counts(queue)
+
+    # Writers above only touch SQLite; one sync carries their rows to LanceDB in bulk
+    wrote = args.scrape or args.ingest or args.crawl or args.worker or ((args.process or urls) and not args.enqueue)
+    if wrote or args.sync or args.full_sync:
+        after_writes(sync=args.sync or not args.no_sync, full_sync=args.full_sync)
+
+    if args.facets:
+        try:
+            print_facets(facet_counts(filters=parse_where(args.where)))
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    if args.cites:
+        print_facets({f"hazards citing {args.cites}": hazards_citing(args.cites)})
+
+    if args.reembed:
+        reembed(args.reembed, embed_pool=args.embed_pool)
+
+    if args.maintain:
+        maintain()
+        migrated = normalize_links()
+        if migrated:
+            print(f"Moved inline action items and sources of {migrated} rows into link tables.")
+
+    if args.verify:
+        print_report(verify())
+
+    if args.export and args.delta:
+        export_delta(
+            use_lancedb=args.use_lancedb,
+            structured=args.structured,
+            push_to_hub=args.push_to_hub,
+            repo_id=args.repo_id
+        )
+    elif args.export and args.sharded:
+        export_sharded(
+            structured=args.structured,
+            partition_by=args.partition_by,
+            push_to_hub=args.push_to_hub,
+            repo_id=args.repo_id,
+            workers=args.export_workers
+        )
+    elif args.export:
         export_to_hf_dataset(
             use_lancedb=args.use_lancedb,
             push_to_hub=args.push_to_hub,
             repo_id=args.repo_id,
-            structured=args.structured
+            structured=args.structured,
+            where=args.where,
+            columns=args.columns
         )
 
+    get_budget().report()
+
 if __name__ == "__main__":
     main()
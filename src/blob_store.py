@@ -0,0 +1,207 @@
+import os
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+from .store import DB_NAME
+
+BLOB_DIR = "data/blobs"
+
+def hash_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def init_blob_store(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+
+    # One row per unique content
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER,
+            ext TEXT,
+            refcount INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Names pointing at content: source URLs, raw/<file> names, hazard PDFs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blob_refs (
+            ref TEXT PRIMARY KEY,
+            hash TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_blob_refs_hash
+        ON blob_refs (hash)
+    ''')
+
+    # Pipeline stages already run on a blob, so each content is processed once
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blob_stages (
+            hash TEXT,
+            stage TEXT,
+            ref TEXT,
+            done_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (hash, stage)
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+
+def blob_path(content_hash, ext=".pdf", blob_dir=BLOB_DIR):
+    return os.path.join(blob_dir, content_hash[:2], content_hash + ext)
+
+def _link_or_copy(src, dest):
+    """
+    Hard-links src to dest when possible (same filesystem), otherwise copies.
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = dest + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+def _register(conn, content_hash, size, ext):
+    """
+    Records a blob and returns the extension its file is stored under: the
+    first one registered, so the same content arriving under another
+    extension shares one file.
+    """
+    conn.execute('''
+        INSERT OR IGNORE INTO blobs (hash, size, ext) VALUES (?, ?, ?)
+    ''', (content_hash, size, ext))
+    return conn.execute("SELECT ext FROM blobs WHERE hash = ?", (content_hash,)).fetchone()[0]
+
+def _release(conn, content_hash, blob_dir):
+    conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (content_hash,))
+    row = conn.execute("SELECT refcount, ext FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+    if row and row[0] <= 0:
+        conn.execute("DELETE FROM blobs WHERE hash = ?", (content_hash,))
+        conn.execute("DELETE FROM blob_stages WHERE hash = ?", (content_hash,))
+        path = blob_path(content_hash, row[1], blob_dir)
+        if os.path.exists(path):
+            os.remove(path)
+
+def set_ref(conn, ref, content_hash, blob_dir=BLOB_DIR):
+    """
+    Points `ref` at a blob, adjusting reference counts. Returns the previous hash.
+    """
+    row = conn.execute("SELECT hash FROM blob_refs WHERE ref = ?", (ref,)).fetchone()
+    previous = row[0] if row else None
+    if previous == content_hash:
+        return previous
+
+    conn.execute('''
+        INSERT INTO blob_refs (ref, hash, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(ref) DO UPDATE SET hash = excluded.hash, updated_at = excluded.updated_at
+    ''', (ref, content_hash))
+    conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (content_hash,))
+    if previous:
+        _release(conn, previous, blob_dir)
+    return previous
+
+def put_file(path, ref=None, move=False, db_name=DB_NAME, blob_dir=BLOB_DIR):
+    """
+    Adds a file to the store (moving it if `move`, else hard-linking or copying)
+    and optionally points `ref` at it. Returns (hash, blob path).
+    """
+    content_hash = hash_file(path)
+    size = os.path.getsize(path)
+    conn = sqlite3.connect(db_name)
+    with conn:
+        ext = _register(conn, content_hash, size, os.path.splitext(path)[1].lower() or ".bin")
+    dest = blob_path(content_hash, ext, blob_dir)
+
+    if os.path.exists(dest):
+        if move:
+            os.remove(path)
+    elif move:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(path, dest)
+    else:
+        _link_or_copy(path, dest)
+
+    if ref:
+        with conn:
+            set_ref(conn, ref, content_hash, blob_dir)
+    conn.close()
+    return content_hash, dest
+
+def put_stream(chunks, ref=None, ext=".pdf", db_name=DB_NAME, blob_dir=BLOB_DIR):
+    """
+    Streams chunks into the store, hashing while writing. Returns (hash, blob path).
+    """
+    tmp_dir = os.path.join(blob_dir, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=ext)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return put_file(tmp_path, ref=ref, move=True, db_name=db_name, blob_dir=blob_dir)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def lookup(ref, db_name=DB_NAME):
+    """
+    Returns the hash a ref (e.g. a URL) points at, or None.
+    """
+    conn = sqlite3.connect(db_name)
+    row = conn.execute("SELECT hash FROM blob_refs WHERE ref = ?", (ref,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def release_ref(ref, db_name=DB_NAME, blob_dir=BLOB_DIR):
+    """
+    Drops a ref; the blob is deleted once nothing references it.
+    """
+    conn = sqlite3.connect(db_name)
+    with conn:
+        row = conn.execute("SELECT hash FROM blob_refs WHERE ref = ?", (ref,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM blob_refs WHERE ref = ?", (ref,))
+            _release(conn, row[0], blob_dir)
+    conn.close()
+
+def stage_done(content_hash, stage, db_name=DB_NAME):
+    """
+    Returns the ref a blob was processed under for `stage`, or None if not yet processed.
+    """
+    conn = sqlite3.connect(db_name)
+    row = conn.execute("SELECT ref FROM blob_stages WHERE hash = ? AND stage = ?", (content_hash, stage)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def mark_stage_done(content_hash, stage, ref=None, db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO blob_stages (hash, stage, ref) VALUES (?, ?, ?)
+        ''', (content_hash, stage, ref))
+    conn.close()
+
+def materialize(content_hash, dest, db_name=DB_NAME, blob_dir=BLOB_DIR):
+    """
+    Exposes a blob under a human-readable path (hard link, or copy across filesystems).
+    """
+    conn = sqlite3.connect(db_name)
+    row = conn.execute("SELECT ext FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+    conn.close()
+    src = blob_path(content_hash, row[0], blob_dir)
+    if os.path.exists(dest) and os.path.samefile(src, dest):
+        return dest
+    _link_or_copy(src, dest)
+    return dest
@@ -0,0 +1,265 @@
+import sqlite3
+import hashlib
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from bs4 import BeautifulSoup
+from .fetch import get_scheduler
+from .store import DB_NAME
+
+MAX_DEPTH = 2
+MAX_PAGES = 100
+CRAWL_WORKERS = 4
+# Pages fetched longer ago than this are queued again when a crawl links to them
+REVISIT_SECONDS = 7 * 24 * 3600
+
+# Query parameters that never change the document
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "_ga"}
+
+def init_crawl(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+
+    # Seen-set: one 64-bit URL hash per row (rowid table, no URL text)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_seen (
+            url_hash INTEGER PRIMARY KEY,
+            fetched_at INTEGER
+        )
+    ''')
+
+    # Frontier: URLs discovered but not fetched yet, kept across runs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_frontier (
+            url_hash INTEGER PRIMARY KEY,
+            url TEXT,
+            depth INTEGER,
+            site TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_crawl_frontier_depth
+        ON crawl_frontier (depth)
+    ''')
+
+    # PDFs found but not ingested yet; reported again by later crawls of their site
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_pdfs (
+            url_hash INTEGER PRIMARY KEY,
+            url TEXT,
+            site TEXT,
+            found_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+
+def canonicalize_url(url, base=None):
+    """
+    Normalizes a URL so trivially different spellings dedupe to one entry:
+    lowercase scheme/host, no default port, no fragment, resolved dot segments,
+    sorted query without tracking parameters. Returns None for non-HTTP URLs.
+    """
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https"):
+        return None
+
+    host = (parts.hostname or "").lower()
+    if not host:
+        return None
+    port = parts.port
+    netloc = host
+    if port and not (scheme == "http" and port == 80) and not (scheme == "https" and port == 443):
+        netloc = f"{host}:{port}"
+
+    path = parts.path or "/"
+    trailing = path.endswith("/")
+    path = posixpath.normpath(path)
+    if trailing and path != "/":
+        path += "/"
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS]
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(query)), ""))
+
+def url_key(url):
+    """
+    Signed 64-bit hash of a canonical URL, used as the seen-set key.
+    """
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def site_of(url):
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+def is_pdf_url(url):
+    return urlsplit(url).path.lower().endswith(".pdf")
+
+def extract_links(html, base_url):
+    soup = BeautifulSoup(html, "html.parser")
+    links = []
+    for a in soup.find_all("a", href=True):
+        url = canonicalize_url(a["href"], base_url)
+        if url:
+            links.append(url)
+    return links
+
+def _fetch_page(scheduler, url):
+    try:
+        response = scheduler.get(url)
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        text = response.text if "html" in content_type or not content_type else ""
+        return url, content_type, text, None
+    except Exception as e:
+        return url, None, None, e
+
+class Crawler:
+    """
+    Bounded breadth-first crawl of same-site HTML pages.
+    Pages are fetched concurrently through the shared fetch scheduler,
+    so per-host limits apply. PDFs linked from crawled pages are reported
+    once per run through `on_pdf`, and again by later crawls of the same
+    site until they are marked done. Pages are fetched again once their
+    last fetch is older than `revisit_seconds`.
+    """
+
+    def __init__(self, max_depth=MAX_DEPTH, max_pages=MAX_PAGES, workers=CRAWL_WORKERS,
+                 on_pdf=None, scheduler=None, db_name=DB_NAME, revisit_seconds=REVISIT_SECONDS):
+        self.max_depth = max_depth
+        self.revisit_seconds = revisit_seconds
+        self.sites = set()
+        self.max_pages = max_pages
+        self.workers = workers
+        self.on_pdf = on_pdf
+        self.scheduler = scheduler or get_scheduler()
+        self.db_name = db_name
+        self.pages = []
+        self.pdfs = []
+        init_crawl(db_name)
+
+    def _mark_seen(self, conn, url):
+        """
+        Adds the URL to the seen-set; returns False if it was already there,
+        unless its last fetch is older than `revisit_seconds` and it is due again.
+        """
+        cursor = conn.execute("INSERT OR IGNORE INTO crawl_seen (url_hash) VALUES (?)", (url_key(url),))
+        if cursor.rowcount == 1:
+            return True
+        # Cleared until the refetch, so the page is queued once per crawl
+        cursor = conn.execute("UPDATE crawl_seen SET fetched_at = NULL WHERE url_hash = ? AND fetched_at < ?",
+                              (url_key(url), int(time.time()) - self.revisit_seconds))
+        return cursor.rowcount == 1
+
+    def add_seed(self, conn, url):
+        url = canonicalize_url(url)
+        if not url:
+            return
+        # Seeds are always refetched so new links on them are found on recrawls
+        conn.execute("INSERT OR IGNORE INTO crawl_seen (url_hash) VALUES (?)", (url_key(url),))
+        conn.execute('''
+            INSERT OR REPLACE INTO crawl_frontier (url_hash, url, depth, site)
+            VALUES (?, ?, 0, ?)
+        ''', (url_key(url), url, site_of(url)))
+
+    def _next_batch(self, conn, size):
+        # Only the seeds' sites: entries left by an interrupted crawl of
+        # another site wait for a crawl of that site (or one without seeds)
+        sites = sorted(self.sites)
+        site_filter = f"AND site IN ({', '.join('?' * len(sites))})" if sites else ""
+        cursor = conn.execute(f'''
+            SELECT url_hash, url, depth, site FROM crawl_frontier
+            WHERE depth <= ? {site_filter}
+            ORDER BY depth, added_at LIMIT ?
+        ''', (self.max_depth, *sites, size))
+        return cursor.fetchall()
+
+    def _discover(self, conn, page_url, depth, site, html):
+        for link in extract_links(html, page_url):
+            if site_of(link) != site:
+                continue
+            if is_pdf_url(link):
+                if self._mark_seen(conn, link):
+                    self._found_pdf(conn, link, site)
+            elif depth + 1 <= self.max_depth and self._mark_seen(conn, link):
+                conn.execute('''
+                    INSERT OR IGNORE INTO crawl_frontier (url_hash, url, depth, site)
+                    VALUES (?, ?, ?, ?)
+                ''', (url_key(link), link, depth + 1, site))
+
+    def _found_pdf(self, conn, url, site):
+        # Pending until mark_pdf_done, so a failed ingest is retried next crawl
+        conn.execute("INSERT OR IGNORE INTO crawl_pdfs (url_hash, url, site) VALUES (?, ?, ?)", (url_key(url), url, site))
+        if url in self.pdfs:
+            return
+        self.pdfs.append(url)
+        if self.on_pdf:
+            self.on_pdf(url)
+
+    def _pending_pdfs(self, conn, sites):
+        for url, site in conn.execute("SELECT url, site FROM crawl_pdfs ORDER BY found_at, url_hash").fetchall():
+            if not sites or site in sites:
+                self._found_pdf(conn, url, site)
+
+    def crawl(self, seeds):
+        conn = sqlite3.connect(self.db_name)
+        for seed in seeds:
+            self.add_seed(conn, seed)
+        self.sites = {site_of(canonicalize_url(seed)) for seed in seeds if canonicalize_url(seed)}
+        self._pending_pdfs(conn, self.sites)
+        conn.commit()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while len(self.pages) < self.max_pages:
+                batch = self._next_batch(conn, min(self.workers * 2, self.max_pages - len(self.pages)))
+                if not batch:
+                    break
+                entries = {url: (url_hash, depth, site) for url_hash, url, depth, site in batch}
+                results = executor.map(lambda url: _fetch_page(self.scheduler, url), list(entries))
+
+                # All database writes stay on this thread
+                for url, content_type, text, error in results:
+                    url_hash, depth, site = entries[url]
+                    conn.execute("DELETE FROM crawl_frontier WHERE url_hash = ?", (url_hash,))
+                    conn.execute("UPDATE crawl_seen SET fetched_at = ? WHERE url_hash = ?", (int(time.time()), url_hash))
+                    if error:
+                        print(f"Crawl error for {url}: {error}")
+                        continue
+                    if "pdf" in (content_type or ""):
+                        self._found_pdf(conn, url, site)
+                        continue
+                    self.pages.append(url)
+                    if text:
+                        self._discover(conn, url, depth, site, text)
+                conn.commit()
+
+        conn.close()
+        print(f"Crawled {len(self.pages)} pages, found {len(self.pdfs)} new PDFs.")
+        return {"pages": self.pages, "pdfs": self.pdfs}
+
+def mark_pdf_done(url, db_name=DB_NAME):
+    """
+    Records a crawled PDF as ingested; until then later crawls report it again.
+    """
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute("DELETE FROM crawl_pdfs WHERE url_hash = ?", (url_key(canonicalize_url(url) or url),))
+    conn.close()
+
+def crawl(seeds, max_depth=MAX_DEPTH, max_pages=MAX_PAGES, workers=CRAWL_WORKERS, on_pdf=None, scheduler=None, db_name=DB_NAME,
+          revisit_seconds=REVISIT_SECONDS):
+    """
+    Crawls same-site links from `seeds` up to `max_depth` and `max_pages`.
+    Pages fetched by earlier crawls are skipped until `revisit_seconds` old.
+    Returns {"pages": [...], "pdfs": [...]}, where pdfs are PDF URLs found in
+    this crawl or earlier ones and not yet marked done with mark_pdf_done.
+    """
+    crawler = Crawler(max_depth, max_pages, workers, on_pdf, scheduler, db_name, revisit_seconds)
+    return crawler.crawl(seeds)
@@ -1,15 +1,49 @@
-from sentence_transformers import SentenceTransformer
+import os
 import numpy as np
+from .memory import get_budget
+from .model_config import MODEL_CONFIG_PATH, load_model_config
 
-# Global model instance to avoid reloading
-_model = None
+# Texts encoded per model call; shrunk under memory pressure
+EMBED_BATCH_SIZE = 32
 
-def get_model():
-    global _model
-    if _model is None:
-        print("Loading embedding model...")
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
-    return _model
+# Loaded models by name, to avoid reloading
+_models = {}
+# Active model name, re-read only when the config file's mtime changes
+_active = {}
+
+def active_model_name(path=MODEL_CONFIG_PATH):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _active.get("key") != (path, mtime):
+        _active["model"] = load_model_config(path)["model"]
+        _active["key"] = (path, mtime)
+    return _active["model"]
+
+def get_model(model_name=None):
+    """
+    Returns the given model, or the active one from data/embedding_model.json.
+    """
+    model_name = model_name or active_model_name()
+    if model_name not in _models:
+        # Imported here so commands that never embed don't pay for torch
+        from sentence_transformers import SentenceTransformer
+        print(f"Loading embedding model {model_name}...")
+        _models[model_name] = SentenceTransformer(model_name)
+    return _models[model_name]
+
+def structured_embedding_text(hazard_type, phase, topic, text):
+    """
+    Text embedded for a structured_hazards page: key fields plus the page content.
+    """
+    return f"{hazard_type} {phase} {topic} {text}"
+
+def section_embedding_text(hazard_name, section, text):
+    """
+    Text embedded for one scraped hazard section.
+    """
+    return f"{hazard_name} {section}\n{text}"
 
 def generate_embedding(text):
     """
@@ -22,3 +56,34 @@ def generate_embedding(text):
     model = get_model()
     embedding = model.encode(text)
     return embedding
+
+def generate_embeddings(texts, batch_size=EMBED_BATCH_SIZE, pool=None, model_name=None):
+    """
+    Embeds a list of texts in batches, returning one array (or None for empty text) per input.
+    The batch size adapts to the memory budget. With an EmbeddingPool the
+    batches are sharded across its worker processes instead.
+    `model_name` overrides the active model (used when re-embedding).
+    """
+    results = [None] * len(texts)
+    todo = [i for i, text in enumerate(texts) if text and text.strip()]
+    if not todo:
+        return results
+
+    if pool is not None:
+        with get_budget().stage("embed"):
+            for i, vector in zip(todo, pool.encode([texts[i] for i in todo])):
+                results[i] = vector
+        return results
+
+    model = get_model(model_name)
+    budget = get_budget()
+    with budget.stage("embed"):
+        start = 0
+        while start < len(todo):
+            size = budget.adapt("embed", batch_size)
+            chunk = todo[start:start + size]
+            vectors = model.encode([texts[i] for i in chunk], batch_size=size)
+            for i, vector in zip(chunk, vectors):
+                results[i] = vector
+            start += len(chunk)
+    return results
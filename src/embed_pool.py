@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Texts sent to a worker per task
+POOL_CHUNK_SIZE = 64
+DEFAULT_THREADS = 2
+
+BENCHMARK_PATH = "data/embed_pool.json"
+BENCHMARK_TEXTS = 512
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+def load_default_model(model_name=None):
+    """
+    Worker-side loader: the given sentence-transformers model, or the active one.
+    """
+    from .embed import get_model
+    return get_model(model_name)
+
+# Per-worker state, set by _init_worker
+_worker_model = None
+
+def _init_worker(loader, threads):
+    """
+    Pins the intra-op thread count before torch is imported, then loads the model once.
+    """
+    global _worker_model
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    # Tokenizer threads would compete with the pinned torch threads
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    _worker_model = loader()
+
+def _encode_chunk(texts, batch_size):
+    vectors = _worker_model.encode(texts, batch_size=batch_size)
+    return np.asarray(vectors, dtype=np.float32)
+
+def default_layout(cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    threads = min(DEFAULT_THREADS, cpu_count)
+    return max(1, cpu_count // threads), threads
+
+class EmbeddingPool:
+    """
+    Shards embedding work across worker processes, each with its own model
+    copy and a fixed number of torch threads. Many small single-threaded
+    models scale with cores where one model's intra-op threading plateaus.
+    Results come back in input order.
+    """
+
+    def __init__(self, workers=None, threads=None, chunk_size=POOL_CHUNK_SIZE, loader=load_default_model):
+        if workers is None or threads is None:
+            best_workers, best_threads = best_layout()
+            workers = workers or best_workers
+            threads = threads or best_threads
+        self.workers = workers
+        self.threads = threads
+        self.chunk_size = chunk_size
+        self.loader = loader
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            print(f"Starting embedding pool: {self.workers} workers x {self.threads} threads")
+            # spawn: lance and torch are not fork-safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.loader, self.threads)
+            )
+        return self
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def warm_up(self):
+        """
+        Blocks until every worker has loaded its model.
+        """
+        self.start()
+        futures = [self._executor.submit(_encode_chunk, ["warm up"], 1) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def encode(self, texts, batch_size=None):
+        """
+        Embeds `texts`, returning an array with one row per text, in input order.
+        At most 2 * workers chunks are in flight, so memory stays bounded.
+        """
+        self.start()
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Small inputs are split evenly so every worker gets a share
+        size = max(1, min(self.chunk_size, -(-len(texts) // self.workers)))
+        batch_size = batch_size or size
+        chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+
+        results = []
+        pending = deque()
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < 2 * self.workers:
+                pending.append(self._executor.submit(_encode_chunk, chunks[next_chunk], batch_size))
+                next_chunk += 1
+            results.append(pending.popleft().result())
+        return np.vstack(results)
+
+def candidate_layouts(cpu_count=None):
+    """
+    workers x threads layouts using all cores, from one big model to one thread per worker.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    layouts = []
+    threads = cpu_count
+    while threads >= 1:
+        layout = (max(1, cpu_count // threads), threads)
+        if layout not in layouts:
+            layouts.append(layout)
+        threads //= 2
+    return layouts
+
+def benchmark(texts, layouts=None, chunk_size=POOL_CHUNK_SIZE, loader=load_default_model, save_path=BENCHMARK_PATH):
+    """
+    Times each layout on `texts` (after warming up every worker) and returns
+    the results sorted fastest first. The best layout is saved for EmbeddingPool defaults.
+    """
+    cpu_count = os.cpu_count() or 1
+    results = []
+    for workers, threads in layouts or candidate_layouts(cpu_count):
+        with EmbeddingPool(workers, threads, chunk_size, loader) as pool:
+            pool.warm_up()
+            start = time.perf_counter()
+            pool.encode(texts)
+            elapsed = time.perf_counter() - start
+        rate = len(texts) / elapsed if elapsed > 0 else float("inf")
+        print(f"  {workers} workers x {threads} threads: {rate:.1f} texts/s")
+        results.append({"workers": workers, "threads": threads, "texts_per_second": round(rate, 1)})
+
+    results.sort(key=lambda r: r["texts_per_second"], reverse=True)
+    if save_path and results:
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+        with open(save_path, "w") as f:
+            json.dump({"cpu_count": cpu_count, "chunk_size": chunk_size, "results": results}, f, indent=2)
+    return results
+
+def best_layout(path=BENCHMARK_PATH):
+    """
+    Fastest benchmarked (workers, threads) for this machine, else a default layout.
+    """
+    cpu_count = os.cpu_count() or 1
+    try:
+        with open(path, "r") as f:
+            saved = json.load(f)
+        if saved.get("cpu_count") == cpu_count and saved.get("results"):
+            best = saved["results"][0]
+            return best["workers"], best["threads"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return default_layout(cpu_count)
+
+def _sample_texts(n=BENCHMARK_TEXTS):
+    """
+    Benchmark input: stored page texts if there are any, else synthetic sentences.
+    """
+    from .store import DB_NAME
+    texts = []
+    if os.path.exists(DB_NAME):
+        conn = sqlite3.connect(DB_NAME)
+        try:
+            rows = conn.execute("SELECT content_raw FROM structured_hazards WHERE content_raw != '' LIMIT ?", (n,)).fetchall()
+            texts = [row[0] for row in rows]
+        except sqlite3.Error:
+            pass
+        conn.close()
+    while len(texts) < n:
+        texts.append(f"Flood safety step {len(texts)}: move to higher ground and avoid walking through moving water.")
+    return texts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding pool layouts")
+    parser.add_argument("--texts", type=int, default=BENCHMARK_TEXTS, help="Number of texts to embed per layout")
+    parser.add_argument("--chunk-size", type=int, default=POOL_CHUNK_SIZE, help="Texts per worker task")
+    args = parser.parse_args()
+
+    results = benchmark(_sample_texts(args.texts), chunk_size=args.chunk_size)
+    best = results[0]
+    print(f"Best layout: {best['workers']} workers x {best['threads']} threads ({best['texts_per_second']} texts/s)")
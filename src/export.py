@@ -2,70 +2,228 @@ import sqlite3
 import pandas as pd
 import json
 import os
+import time
+import shutil
+import tempfile
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import lancedb
-from datasets import Dataset, DatasetDict
-from huggingface_hub import HfApi
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datasets import Dataset, DatasetDict, Features
+from huggingface_hub import HfApi, CommitOperationAdd, CommitOperationDelete
 import numpy as np
 
-from .store import DB_NAME
+from .store import DB_NAME, fill_link_columns
 from .store_lancedb import LANCEDB_URI
-def export_to_hf_dataset(output_path="hf_dataset", use_lancedb=False, push_to_hub=False, repo_id=None, structured=False):
-    if use_lancedb:
-        print("Exporting from LanceDB...")
-        table_name = "structured_hazards" if structured else "documents"
-        try:
-            db = lancedb.connect(LANCEDB_URI)
-            tbl = db.open_table(table_name)
-            df = tbl.to_pandas()
-        except Exception as e:
-            print(f"Error reading from LanceDB table {table_name}: {e}")
-            return
+from .query import parse_where, build_select, build_lance_where, LINK_FIELDS
+from .memory import get_budget, tracked
+from .model_config import MODEL_CONFIG_PATH, load_model_config, lancedb_table
+from .sync_lancedb import init_sync, ID_CHUNK
 
-        # LanceDB returns pandas df with vector as numpy array usually
-        # We might need to ensure metadata/json fields are dicts if they are strings
-        json_fields = ['metadata', 'hazard_prepare', 'hazard_react', 'hazard_recover', 'hazard_filters', 'hazard_sources']
-        for field in json_fields:
-            if field in df.columns:
-                 df[field] = df[field].apply(lambda x: json.loads(x) if isinstance(x, str) else x)
-             
-        # Rename vector to embedding to match previous schema if needed, or keep as vector
-        if 'vector' in df.columns:
-            df = df.rename(columns={'vector': 'embedding'})
-            
-    else:
-        print("Exporting from SQLite...")
-        conn = sqlite3.connect(DB_NAME)
-        table_name = "structured_hazards" if structured else "documents"
-        query = f"SELECT * FROM {table_name}"
-        try:
-            df = pd.read_sql_query(query, conn)
-        except Exception as e:
-             print(f"Error reading from SQLite table {table_name}: {e}")
-             conn.close()
-             return
-        conn.close()
-        
-        # Convert embedding blob back to list for HF dataset
-        def blob_to_list(blob):
-            if blob:
-                return np.frombuffer(blob, dtype=np.float32).tolist() # Assuming float32 from sentence-transformers
-            return None
+MANIFEST_NAME = "manifest.json"
+# export_sharded publishes full snapshots next to the delta files, never over them
+SHARDED_PREFIX = "sharded"
+SHARDED_MANIFEST_NAME = "sharded_manifest.json"
+
+def sharded_manifest_path(table_name):
+    """
+    Repo-relative path of a table's sharded export manifest, kept next to its
+    shards so exports of different tables don't overwrite each other's.
+    """
+    return f"{SHARDED_PREFIX}/{table_name}/{SHARDED_MANIFEST_NAME}"
+SHARD_ROWS = 50000
+# Rows read per SQLite fetch during a full export; shrunk under memory pressure
+EXPORT_CHUNK_ROWS = 10000
 
+# Sharded export: ~10k rows of 384-dim vectors is ~15MB per row group, small
+# enough for the Hub dataset viewer and large enough for zstd to compress well
+ROW_GROUP_ROWS = 10000
+PARQUET_COMPRESSION = "zstd"
+UPLOAD_WORKERS = 4
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF = 2.0 # seconds, doubled after each failed attempt
+
+# Columns holding JSON text, exported as structs by export_to_hf_dataset
+JSON_FIELDS = ('metadata', 'hazard_prepare', 'hazard_react', 'hazard_recover', 'hazard_filters', 'hazard_sources')
+
+def blob_to_list(blob):
+    if blob:
+        return np.frombuffer(blob, dtype=np.float32).tolist() # Assuming float32 from sentence-transformers
+    return None
+
+def _read_sqlite_frames(conn, query, params, chunk_rows):
+    """
+    Yields DataFrames of at most `chunk_rows` rows (fewer under memory pressure),
+    with embedding blobs already decoded and linked action items/sources filled in.
+    """
+    cursor = conn.execute(query, params)
+    columns = [d[0] for d in cursor.description]
+    budget = get_budget()
+    while True:
+        rows = cursor.fetchmany(budget.adapt("export", chunk_rows))
+        if not rows:
+            break
+        if 'id' in columns and any(c in columns for c in LINK_FIELDS):
+            rows = [tuple(row[c] for c in columns) for row in fill_link_columns(conn, [dict(zip(columns, row)) for row in rows])]
+        df = pd.DataFrame.from_records(rows, columns=columns)
         if 'embedding' in df.columns:
             df['embedding'] = df['embedding'].apply(blob_to_list)
-        
-        # Convert JSON strings to dicts
-        json_fields = ['metadata', 'hazard_prepare', 'hazard_react', 'hazard_recover', 'hazard_filters', 'hazard_sources']
-        for field in json_fields:
-            if field in df.columns:
+        yield df
+
+def _json_types(chunks, json_fields):
+    """
+    Arrow types of the decoded JSON columns over every matching row: keys can
+    differ between rows, so the struct type is the union of all of them.
+    `chunks` yields, per chunk of rows, the values of each JSON column.
+    """
+    schema = pa.schema([])
+    for columns in chunks:
+        chunk = pa.schema([(field, pa.array([json.loads(x) if x else {} for x in values]).type)
+                           for field, values in zip(json_fields, columns)])
+        schema = pa.unify_schemas([schema, chunk], promote_options="permissive")
+    return {field: schema.field(field).type for field in schema.names}
+
+def _sqlite_columns(conn, query, params, chunk_rows):
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield list(zip(*rows))
+
+def _sqlite_examples(db_name, query, params, json_fields, drop_id):
+    conn = sqlite3.connect(db_name)
+    try:
+        for df in _read_sqlite_frames(conn, query, params, EXPORT_CHUNK_ROWS):
+            for field in json_fields:
                 df[field] = df[field].apply(lambda x: json.loads(x) if x else {})
+            if drop_id:
+                df = df.drop(columns=["id"])
+            yield from df.to_dict("records")
+    finally:
+        conn.close()
 
-    if df.empty:
-        print("No data to export.")
+def _sqlite_dataset(db_name, table_name, filters, columns, cache_dir):
+    """
+    Streams the matching rows of a SQLite table into a Dataset cached under
+    `cache_dir`. Column types come from the SQLite schema, and a first pass
+    over the JSON columns alone settles their struct types.
+    Returns None when no row matches.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        # Linked action items and sources are rebuilt by page id
+        extra_id = bool(table_name == "structured_hazards" and columns and "id" not in columns
+                        and any(c in LINK_FIELDS for c in columns))
+        select = list(columns) + ["id"] if extra_id else columns
+        query, params = build_select(table_name, conn, filters, select)
+        if not conn.execute(f"SELECT EXISTS ({query})", params).fetchone()[0]:
+            return None
+        schema = _arrow_schema(conn, table_name)
+        names = [c for c in select or schema.names if not (extra_id and c == "id")]
+        json_fields = [c for c in names if c in JSON_FIELDS]
+        types = {name: schema.field(name).type for name in names}
+        if json_fields:
+            json_query, json_params = build_select(table_name, conn, filters, json_fields)
+            types.update(_json_types(_sqlite_columns(conn, json_query, json_params, EXPORT_CHUNK_ROWS), json_fields))
+    finally:
+        conn.close()
+
+    features = Features.from_arrow_schema(pa.schema([(name, types[name]) for name in names]))
+    return Dataset.from_generator(
+        _sqlite_examples,
+        features=features,
+        cache_dir=cache_dir,
+        # Tuples, since from_generator would treat lists as shards to split
+        gen_kwargs={"db_name": db_name, "query": query, "params": tuple(params),
+                    "json_fields": tuple(json_fields), "drop_id": extra_id},
+    )
+
+def _lancedb_query(tbl, where, select):
+    query = tbl.search()
+    if where:
+        query = query.where(where)
+    if select:
+        query = query.select(list(select))
+    return query.limit(None)
+
+def _lancedb_examples(lancedb_uri, physical, where, select, json_fields):
+    tbl = lancedb.connect(lancedb_uri).open_table(physical)
+    batches = _lancedb_query(tbl, where, select).to_batches(get_budget().adapt("export", EXPORT_CHUNK_ROWS))
+    for batch in batches:
+        for row in batch.to_pylist():
+            for field in json_fields:
+                row[field] = json.loads(row[field]) if row[field] else {}
+            if "vector" in row:
+                row["embedding"] = row.pop("vector")
+            yield row
+
+def _lancedb_dataset(lancedb_uri, table_name, filters, columns, cache_dir, config_path):
+    """
+    Streams the matching rows of a LanceDB table into a Dataset cached under
+    `cache_dir`, batch by batch, as _sqlite_dataset does for SQLite.
+    Returns None when no row matches.
+    """
+    physical = lancedb_table(table_name, config_path)
+    tbl = lancedb.connect(lancedb_uri).open_table(physical)
+    where = build_lance_where(filters) if filters else None
+    if not tbl.count_rows(where):
+        return None
+    # Exported 'embedding' is stored as 'vector' in LanceDB
+    select = tuple('vector' if c == 'embedding' else c for c in columns) if columns else None
+    names = list(select or tbl.schema.names)
+    json_fields = tuple(c for c in names if c in JSON_FIELDS)
+    types = {name: tbl.schema.field(name).type for name in names}
+    types["vector"] = pa.list_(pa.float32())
+    if json_fields:
+        batches = _lancedb_query(tbl, where, json_fields).to_batches(EXPORT_CHUNK_ROWS)
+        types.update(_json_types(([batch.column(f).to_pylist() for f in json_fields] for batch in batches), json_fields))
+
+    features = Features.from_arrow_schema(pa.schema([("embedding" if name == "vector" else name, types[name])
+                                                     for name in names]))
+    return Dataset.from_generator(
+        _lancedb_examples,
+        features=features,
+        cache_dir=cache_dir,
+        gen_kwargs={"lancedb_uri": lancedb_uri, "physical": physical, "where": where, "select": select,
+                    "json_fields": json_fields},
+    )
+
+@tracked("export")
+def export_to_hf_dataset(output_path="hf_dataset", use_lancedb=False, push_to_hub=False, repo_id=None, structured=False, where=None, columns=None, db_name=DB_NAME,
+                         lancedb_uri=LANCEDB_URI, config_path=MODEL_CONFIG_PATH):
+    """
+    Exports a table to a HF Dataset.
+    `where` takes --where style clauses ("hazard_type=Flood", "phase=Prepare,React")
+    and `columns` restricts the exported columns.
+    """
+    try:
+        filters = parse_where(where)
+    except ValueError as e:
+        print(f"Error: {e}")
         return
 
-    ds = Dataset.from_pandas(df)
-    ds.save_to_disk(output_path)
+    table_name = "structured_hazards" if structured else "documents"
+    source = "LanceDB" if use_lancedb else "SQLite"
+    print(f"Exporting from {source}...")
+    # Rows are written to the dataset's Arrow cache chunk by chunk, then saved
+    with tempfile.TemporaryDirectory() as cache_dir:
+        try:
+            if use_lancedb:
+                ds = _lancedb_dataset(lancedb_uri, table_name, filters, columns, cache_dir, config_path)
+            else:
+                ds = _sqlite_dataset(db_name, table_name, filters, columns, cache_dir)
+        except Exception as e:
+            print(f"Error reading from {source} table {table_name}: {e}")
+            return
+        if ds is None:
+            print("No data to export.")
+            return
+        ds.save_to_disk(output_path)
+    ds = Dataset.load_from_disk(output_path)
+
     print(f"Dataset saved to {output_path}")
     
     if push_to_hub:
@@ -81,3 +239,466 @@ def export_to_hf_dataset(output_path="hf_dataset", use_lancedb=False, push_to_hu
             print(f"Error pushing to Hub: {e}")
             
     return ds
+
+def load_manifest(output_path):
+    path = os.path.join(output_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"tables": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_manifest(output_path, manifest, name=MANIFEST_NAME):
+    path = os.path.join(output_path, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _write_shard(df, output_path, table_name, prefix, index):
+    """
+    Writes one Parquet shard and returns its manifest entry.
+    """
+    rel_path = f"data/{table_name}/{prefix}-{index:05d}.parquet"
+    path = os.path.join(output_path, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(path, index=False)
+    return {"path": rel_path, "rows": len(df), "pushed": False}
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _change_window(conn, table_name, after_seq, until_seq):
+    """
+    Latest change per row id in (after_seq, until_seq] of the change log:
+    (ids to upsert, ids deleted).
+    """
+    latest = {}
+    cursor = conn.execute('''
+        SELECT row_id, op FROM lancedb_changes
+        WHERE table_name = ? AND seq > ? AND seq <= ? ORDER BY seq
+    ''', (table_name, after_seq, until_seq))
+    for row_id, op in cursor:
+        latest[row_id] = op
+    return sorted(i for i, op in latest.items() if op != "D"), sorted(i for i, op in latest.items() if op == "D")
+
+def _sqlite_delta_frames(conn, table_name, ids, shard_rows):
+    """
+    Yields DataFrames of the whole table (ids=None) or of the given row ids, in id order.
+    """
+    if ids is None:
+        yield from _read_sqlite_frames(conn, f"SELECT * FROM {table_name} ORDER BY id", (), shard_rows)
+        return
+    for group in _chunks(ids, shard_rows):
+        frames = []
+        for chunk in _chunks(group, ID_CHUNK):
+            query = f"SELECT * FROM {table_name} WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY id"
+            frames.extend(_read_sqlite_frames(conn, query, chunk, shard_rows))
+        if frames:
+            yield pd.concat(frames, ignore_index=True)
+
+def _lancedb_frame(df):
+    if 'vector' in df.columns:
+        df['vector'] = df['vector'].apply(lambda v: np.asarray(v, dtype=np.float32).tolist())
+        df = df.rename(columns={'vector': 'embedding'})
+    return df
+
+def _lancedb_delta_frames(tbl, ids, shard_rows):
+    """
+    Yields DataFrames of the whole table (ids=None) or of the given row ids.
+    """
+    budget = get_budget()
+    if ids is None:
+        pending = []
+        for batch in tbl.search().limit(None).to_batches(budget.adapt("export", shard_rows)):
+            pending.append(batch)
+            if sum(b.num_rows for b in pending) >= shard_rows:
+                yield _lancedb_frame(pa.Table.from_batches(pending).to_pandas())
+                pending = []
+        if pending:
+            yield _lancedb_frame(pa.Table.from_batches(pending).to_pandas())
+        return
+    for group in _chunks(ids, shard_rows):
+        frames = [tbl.search().where(f"id IN ({', '.join(str(i) for i in chunk)})").limit(None).to_pandas()
+                  for chunk in _chunks(group, ID_CHUNK)]
+        df = pd.concat(frames, ignore_index=True)
+        if not df.empty:
+            yield _lancedb_frame(df.sort_values("id", ignore_index=True))
+
+@tracked("export")
+def export_delta(output_path="hf_dataset_delta", use_lancedb=False, structured=False, push_to_hub=False,
+                 repo_id=None, api=None, db_name=DB_NAME, lancedb_uri=LANCEDB_URI, shard_rows=SHARD_ROWS,
+                 config_path=MODEL_CONFIG_PATH):
+    """
+    Writes rows inserted or changed since the last export as new Parquet shards,
+    and ids deleted since then as tombstones in manifest.json. Changes come
+    from the SQLite change log (lancedb_changes); for LanceDB only changes
+    sync_lancedb has already applied are exported. The first export, and any
+    export after a model change or after the log was pruned past the
+    watermark, writes a full base snapshot instead.
+    Shard and tombstone entries carry the change seq they cover: readers keep,
+    per id, the entry with the highest seq. JSON columns are kept as strings
+    so shard schemas stay stable across deltas.
+    Returns the list of new shard entries.
+    """
+    table_name = "structured_hazards" if structured else "documents"
+    source = "lancedb" if use_lancedb else "sqlite"
+    key = f"{source}/{table_name}"
+
+    init_sync(db_name)
+    conn = sqlite3.connect(db_name)
+    try:
+        synced = conn.execute("SELECT physical_table, last_seq, pruned_seq FROM lancedb_sync WHERE table_name = ?",
+                              (table_name,)).fetchone()
+        pruned_seq = synced[2] if synced else 0
+        if use_lancedb:
+            physical = lancedb_table(table_name, config_path)
+            if not synced or synced[0] != physical:
+                print(f"LanceDB table {table_name} is not synced yet, run python -m src.sync_lancedb first.")
+                return []
+            until_seq = synced[1]
+            try:
+                tbl = lancedb.connect(lancedb_uri).open_table(physical)
+            except Exception as e:
+                print(f"Error reading from LanceDB table {table_name}: {e}")
+                return []
+        else:
+            until_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM lancedb_changes WHERE table_name = ?",
+                                     (table_name,)).fetchone()[0]
+            until_seq = max(until_seq, pruned_seq)
+
+        os.makedirs(output_path, exist_ok=True)
+        manifest = load_manifest(output_path)
+        state = manifest["tables"].setdefault(key, {"watermark": {}, "shards": [], "deletes": []})
+        watermark = state["watermark"]
+        model_version = load_model_config(config_path)["version"]
+
+        removed = []
+        base = "seq" not in watermark
+        if state["shards"] and not base:
+            if watermark["model_version"] != model_version:
+                print("Embedding model changed since the last export, writing a new base snapshot.")
+                base = True
+            elif watermark["seq"] < pruned_seq:
+                print("Change log was pruned past the last export, writing a new base snapshot.")
+                base = True
+        if base:
+            # Old shards no longer describe the table
+            removed = [shard["path"] for shard in state["shards"]]
+            state["shards"] = []
+            state["deletes"] = []
+            upserts, deleted = None, []
+        else:
+            upserts, deleted = _change_window(conn, table_name, watermark["seq"], until_seq)
+
+        if use_lancedb:
+            frames = _lancedb_delta_frames(tbl, upserts, shard_rows)
+        else:
+            frames = _sqlite_delta_frames(conn, table_name, upserts, shard_rows)
+
+        prefix = f"{source}-{datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S')}"
+        new_shards = []
+        found = set()
+        for df in frames:
+            shard = _write_shard(df, output_path, table_name, prefix, len(state["shards"]) + len(new_shards))
+            shard["seq"] = until_seq
+            new_shards.append(shard)
+            found.update(int(i) for i in df["id"])
+    finally:
+        conn.close()
+
+    # Rows upserted in the window but gone by the time they were read were deleted since
+    deleted = sorted(set(deleted) | {i for i in upserts or [] if i not in found})
+    if deleted:
+        state["deletes"].append({"seq": until_seq, "ids": deleted})
+
+    for path in removed:
+        local_path = os.path.join(output_path, path)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+    state["watermark"] = {"seq": until_seq, "model_version": model_version}
+    state["shards"].extend(new_shards)
+    state.setdefault("removed", []).extend(removed)
+    save_manifest(output_path, manifest)
+
+    rows = sum(shard["rows"] for shard in new_shards)
+    print(f"Exported {rows} new or changed rows and {len(deleted)} deletions from {key} "
+          f"in {len(new_shards)} shard(s) to {output_path}")
+
+    if push_to_hub:
+        if not repo_id:
+            print("Error: --repo-id is required when pushing to Hub.")
+        else:
+            push_delta(output_path, repo_id, api=api)
+
+    return new_shards
+
+def push_delta(output_path, repo_id, api=None):
+    """
+    Uploads shards not yet pushed, deletes shards dropped by a new base snapshot,
+    then uploads the updated manifest.
+    """
+    api = api or HfApi()
+    manifest = load_manifest(output_path)
+    print(f"Pushing delta to Hugging Face Hub: {repo_id}...")
+    api.create_repo(repo_id, repo_type="dataset", exist_ok=True)
+
+    uploaded = 0
+    for state in manifest["tables"].values():
+        for path in state.get("removed", []):
+            try:
+                api.delete_file(path_in_repo=path, repo_id=repo_id, repo_type="dataset")
+            except Exception as e:
+                print(f"Could not delete {path} from Hub: {e}")
+        state["removed"] = []
+
+        for shard in state["shards"]:
+            if shard.get("pushed"):
+                continue
+            try:
+                api.upload_file(
+                    path_or_fileobj=os.path.join(output_path, shard["path"]),
+                    path_in_repo=shard["path"],
+                    repo_id=repo_id,
+                    repo_type="dataset"
+                )
+                shard["pushed"] = True
+                uploaded += 1
+            except Exception as e:
+                # Left unpushed; the next push retries it
+                print(f"Error uploading {shard['path']}: {e}")
+        # Persist progress after each table so an interrupted push resumes
+        save_manifest(output_path, manifest)
+
+    api.upload_file(
+        path_or_fileobj=os.path.join(output_path, MANIFEST_NAME),
+        path_in_repo=MANIFEST_NAME,
+        repo_id=repo_id,
+        repo_type="dataset"
+    )
+    print(f"Uploaded {uploaded} shard(s) and manifest.")
+    return uploaded
+
+def _arrow_schema(conn, table_name):
+    """
+    Parquet schema from the SQLite column types, so every shard has the same
+    schema even when a column is entirely NULL in some shard.
+    """
+    fields = []
+    for _, name, decl_type, _, _, _ in conn.execute(f"PRAGMA table_info({table_name})"):
+        if name == "embedding":
+            fields.append(pa.field(name, pa.list_(pa.float32())))
+        elif decl_type.upper() == "INTEGER":
+            fields.append(pa.field(name, pa.int64()))
+        elif decl_type.upper() == "REAL":
+            fields.append(pa.field(name, pa.float64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+def _embedding_array(blobs):
+    """
+    list<float32> embeddings straight from the blobs, without going through Python floats.
+    """
+    lengths = np.fromiter((len(b) // 4 if b else 0 for b in blobs), dtype=np.int32, count=len(blobs))
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.frombuffer(b"".join(b for b in blobs if b), dtype=np.float32)
+    mask = pa.array([b is None for b in blobs])
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.array(values), mask=mask)
+
+def _write_sharded(db_name, table_name, shard, output_path, row_group_rows):
+    """
+    Worker: writes rows with ids in [first_id, last_id] (of one hazard_type
+    when partitioned by it) to a zstd Parquet file, one row group at a time.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        schema = _arrow_schema(conn, table_name)
+        query = f"SELECT {', '.join(schema.names)} FROM {table_name} WHERE id BETWEEN ? AND ?"
+        params = [shard["first_id"], shard["last_id"]]
+        if "hazard_type" in shard:
+            query += " AND hazard_type IS ?"
+            params.append(shard["hazard_type"])
+        cursor = conn.execute(query + " ORDER BY id", params)
+
+        path = os.path.join(output_path, shard["path"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        rows = 0
+        with pq.ParquetWriter(tmp_path, schema, compression=PARQUET_COMPRESSION) as writer:
+            while True:
+                batch = cursor.fetchmany(row_group_rows)
+                if not batch:
+                    break
+                if any(c in schema.names for c in LINK_FIELDS):
+                    batch = [tuple(row[c] for c in schema.names)
+                             for row in fill_link_columns(conn, [dict(zip(schema.names, row)) for row in batch])]
+                columns = list(zip(*batch))
+                arrays = [_embedding_array(values) if field.name == "embedding" else pa.array(values, type=field.type)
+                          for field, values in zip(schema, columns)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=row_group_rows)
+                rows += len(batch)
+        os.replace(tmp_path, path)
+    finally:
+        conn.close()
+    return {**shard, "rows": rows, "bytes": os.path.getsize(path)}
+
+def _plan_shards(conn, table_name, partition_by, shard_rows):
+    """
+    Id ranges of at most `shard_rows` rows, over the whole table or per hazard_type.
+    Only ids are read here; workers fetch the rows themselves.
+    """
+    if partition_by == "hazard_type":
+        groups = [row[0] for row in conn.execute(f"SELECT DISTINCT hazard_type FROM {table_name} ORDER BY hazard_type")]
+    else:
+        groups = [None]
+    shards = []
+    for group in groups:
+        if partition_by == "hazard_type":
+            cursor = conn.execute(f"SELECT id FROM {table_name} WHERE hazard_type IS ? ORDER BY id", (group,))
+            slug = "".join(c if c.isalnum() else "_" for c in str(group)).strip("_").lower() or "unknown"
+            prefix = f"{SHARDED_PREFIX}/{table_name}/hazard_type={slug}/part"
+        else:
+            cursor = conn.execute(f"SELECT id FROM {table_name} ORDER BY id")
+            prefix = f"{SHARDED_PREFIX}/{table_name}/part"
+        ids = np.fromiter((row[0] for row in cursor), dtype=np.int64)
+        for index, start in enumerate(range(0, len(ids), shard_rows)):
+            chunk = ids[start:start + shard_rows]
+            shard = {"path": f"{prefix}-{index:05d}.parquet", "first_id": int(chunk[0]), "last_id": int(chunk[-1])}
+            if partition_by == "hazard_type":
+                shard["hazard_type"] = group
+            shards.append(shard)
+    return shards
+
+def _with_retry(action, label, retries, backoff):
+    for attempt in range(retries):
+        try:
+            action()
+            return True
+        except Exception as e:
+            print(f"Error {label} (attempt {attempt + 1}/{retries}): {e}")
+            if attempt + 1 < retries:
+                time.sleep(backoff * 2 ** attempt)
+    return False
+
+def _preupload(api, operation, repo_id, retries, backoff):
+    """
+    Uploads a shard's content ahead of the commit that adds it.
+    """
+    return _with_retry(lambda: api.preupload_lfs_files(repo_id, additions=[operation], repo_type="dataset"),
+                       f"uploading {operation.path_in_repo}", retries, backoff)
+
+def _publish_sharded(api, output_path, table_name, operations, repo_id, retries, backoff):
+    """
+    One Hub commit adding the (pre-uploaded) shards and the manifest and
+    deleting remote shards of earlier exports that the manifest no longer lists.
+    """
+    manifest_path = sharded_manifest_path(table_name)
+    manifest_op = CommitOperationAdd(path_in_repo=manifest_path, path_or_fileobj=os.path.join(output_path, manifest_path))
+    keep = {op.path_in_repo for op in operations} | {manifest_path}
+    remote_prefix = f"{SHARDED_PREFIX}/{table_name}/"
+    try:
+        remote = api.list_repo_files(repo_id, repo_type="dataset")
+    except Exception as e:
+        print(f"Error listing files in {repo_id}: {e}")
+        return False
+    stale = [CommitOperationDelete(path_in_repo=path) for path in remote
+             if path.startswith(remote_prefix) and path not in keep]
+    message = f"Export {table_name}: {len(operations)} shard(s), {len(stale)} removed"
+    published = _with_retry(lambda: api.create_commit(repo_id, operations=[*operations, manifest_op, *stale],
+                                                      commit_message=message, repo_type="dataset"),
+                            f"committing to {repo_id}", retries, backoff)
+    if published:
+        print(f"Uploaded {len(operations)} shard(s) and {manifest_path} to {repo_id}, removed {len(stale)} stale shard(s).")
+    return published
+
+@tracked("export")
+def export_sharded(output_path="hf_dataset_sharded", structured=False, partition_by="rows", push_to_hub=False,
+                   repo_id=None, api=None, db_name=DB_NAME, shard_rows=SHARD_ROWS, row_group_rows=ROW_GROUP_ROWS,
+                   workers=None, upload_workers=UPLOAD_WORKERS, retries=UPLOAD_RETRIES, backoff=UPLOAD_BACKOFF):
+    """
+    Full export from SQLite as zstd Parquet shards, split by id range
+    (`partition_by="rows"`) or by hazard_type. Shards are written by worker
+    processes and, with `push_to_hub`, each finished shard is uploaded on a
+    thread pool while the others are still being written; failed uploads
+    are retried with backoff. Shards and their sharded_manifest.json go
+    under sharded/<table>/, apart from export_delta's data/ and
+    manifest.json. The Hub only sees one commit per export, adding the
+    shards and manifest and deleting shards the manifest no longer lists.
+    JSON columns are kept as strings, as in export_delta.
+    Returns the list of shard entries.
+    """
+    table_name = "structured_hazards" if structured else "documents"
+    if partition_by not in ("rows", "hazard_type"):
+        print(f"Error: unknown partitioning '{partition_by}', expected rows or hazard_type.")
+        return []
+    if partition_by == "hazard_type" and not structured:
+        print("Error: only structured_hazards can be partitioned by hazard_type.")
+        return []
+    if push_to_hub and not repo_id:
+        print("Error: --repo-id is required when pushing to Hub.")
+        return []
+
+    conn = sqlite3.connect(db_name)
+    try:
+        planned = _plan_shards(conn, table_name, partition_by, shard_rows)
+    finally:
+        conn.close()
+    if not planned:
+        print("No data to export.")
+        return []
+
+    # Shards of an earlier export would be mixed into this one
+    shutil.rmtree(os.path.join(output_path, SHARDED_PREFIX, table_name), ignore_errors=True)
+    os.makedirs(output_path, exist_ok=True)
+    workers = workers or min(len(planned), os.cpu_count() or 1)
+    print(f"Exporting {table_name} in {len(planned)} shard(s) on {workers} worker(s)...")
+
+    if push_to_hub:
+        api = api or HfApi()
+        api.create_repo(repo_id, repo_type="dataset", exist_ok=True)
+    shards = []
+    operations = {}
+    uploads = {}
+    # spawn: lance is not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as writers, \
+            ThreadPoolExecutor(max_workers=upload_workers) as uploaders:
+        futures = [writers.submit(_write_sharded, db_name, table_name, shard, output_path, row_group_rows) for shard in planned]
+        for future in as_completed(futures):
+            shard = future.result()
+            shards.append(shard)
+            if push_to_hub:
+                operation = CommitOperationAdd(path_in_repo=shard["path"],
+                                               path_or_fileobj=os.path.join(output_path, shard["path"]))
+                operations[shard["path"]] = operation
+                uploads[shard["path"]] = uploaders.submit(_preupload, api, operation, repo_id, retries, backoff)
+        uploaded = {path: upload.result() for path, upload in uploads.items()}
+
+    shards.sort(key=lambda shard: shard["path"])
+    manifest = {
+        "table": table_name,
+        "partition_by": partition_by,
+        "compression": PARQUET_COMPRESSION,
+        "row_group_rows": row_group_rows,
+        "rows": sum(shard["rows"] for shard in shards),
+        "shards": shards,
+    }
+    # Written before publishing, as it is committed with the shards: upload
+    # status is only in the returned entries, not in the manifest
+    save_manifest(output_path, manifest, sharded_manifest_path(table_name))
+    print(f"Exported {manifest['rows']} rows in {len(shards)} shard(s) to {output_path}")
+
+    if push_to_hub:
+        failed = [path for path, ok in uploaded.items() if not ok]
+        if failed:
+            # Nothing is committed: the Hub keeps the previous export as a whole
+            print(f"Error: {len(failed)} shard(s) failed to upload, nothing committed.")
+            pushed = False
+        else:
+            pushed = _publish_sharded(api, output_path, table_name, [operations[s["path"]] for s in shards],
+                                      repo_id, retries, backoff)
+        for shard in shards:
+            shard["pushed"] = pushed
+    return shards
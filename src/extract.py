@@ -1,9 +1,10 @@
-import io
+import os
+import tempfile
 import trafilatura
-from pypdf import PdfReader
 import sqlite3
 import pandas as pd
 from .store import DB_NAME
+from .extract_router import extract_pdf_text
 
 def extract_from_html(content_bytes):
     """
@@ -32,18 +33,19 @@ def extract_from_html(content_bytes):
 
 def extract_from_pdf(content_bytes):
     """
-    Extracts text from PDF bytes using pypdf.
+    Extracts text from PDF bytes through the routed extractor (text layer
+    or layout conversion, cached by content hash).
     """
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
     try:
-        pdf_file = io.BytesIO(content_bytes)
-        reader = PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        with os.fdopen(fd, "wb") as f:
+            f.write(content_bytes)
+        return extract_pdf_text(tmp_path)
     except Exception as e:
         print(f"Error extracting PDF: {e}")
         return ""
+    finally:
+        os.remove(tmp_path)
 
 def extract_content(content_bytes, content_type):
     """
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import datetime
+import statistics
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pymupdf
+import pymupdf4llm
+from .markdown_cache import iter_cached_pages, has_pages
+from .blob_store import hash_file
+
+# Documents with more pages than this are converted in parallel page ranges
+LARGE_PDF_PAGES = 200
+PAGE_RANGE_SIZE = 25
+
+# Part of the markdown cache key: bump when conversion output changes
+CONVERTER_VERSION = f"pymupdf4llm-{getattr(pymupdf4llm, '__version__', 'unknown')}"
+TEXT_EXTRACTOR_VERSION = f"textlayer-1-pymupdf-{pymupdf.VersionBind}"
+
+ROUTE_LOG = "data/extract_routes.jsonl"
+
+# Probe thresholds: a PDF takes the text-layer path only if it passes all of them
+PROBE_PAGES = 5
+MIN_CHARS_PER_PAGE = 200
+MAX_IMAGE_COVERAGE = 0.3
+MAX_MULTI_COLUMN_PAGES = 0.2 # fraction of sampled pages
+MAX_TABLE_PAGES = 0.2
+TABLE_MIN_DRAWINGS = 30 # ruled tables show up as many line/rect drawings
+HEADER_SIZE_RATIO = 1.2 # lines this much larger than body text become headers
+
+def _normalize_page(page):
+    """
+    Keeps only what the pipeline uses. Older pymupdf4llm releases report the
+    page as 'page', newer ones as 'page_number'.
+    """
+    meta = page['metadata']
+    return {"text": page['text'], "metadata": {"page": meta.get('page', meta.get('page_number'))}}
+
+def _convert_range(pdf_path, pages):
+    chunks = pymupdf4llm.to_markdown(pdf_path, pages=pages, page_chunks=True)
+    return [_normalize_page(page) for page in chunks]
+
+def iter_markdown_pages(pdf_path, split_threshold=LARGE_PDF_PAGES, range_size=PAGE_RANGE_SIZE, workers=None):
+    """
+    Yields markdown page chunks in page order.
+    Documents above `split_threshold` pages are split into ranges converted in
+    worker processes; at most 2 * workers ranges are in flight, so results
+    stream back while later ranges are still converting.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+
+    if page_count <= split_threshold:
+        yield from _convert_range(pdf_path, None)
+        return
+
+    ranges = [list(range(start, min(start + range_size, page_count)))
+              for start in range(0, page_count, range_size)]
+    workers = workers or os.cpu_count() or 1
+    print(f"  Converting {page_count} pages in {len(ranges)} ranges on {workers} workers...")
+
+    # spawn: lance is not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < 2 * workers:
+                pending.append(executor.submit(_convert_range, pdf_path, ranges[next_range]))
+                next_range += 1
+            yield from pending.popleft().result()
+
+def _is_multi_column(blocks, page_width):
+    """
+    A page is multi-column when narrow text blocks sit in both halves of the page.
+    """
+    left = right = 0
+    for x0, y0, x1, y1, text, block_no, block_type in blocks:
+        if block_type != 0 or len(text.strip()) < 40:
+            continue
+        if x1 - x0 > page_width * 0.55:
+            continue
+        if x1 <= page_width * 0.55:
+            left += 1
+        elif x0 >= page_width * 0.45:
+            right += 1
+    return left >= 2 and right >= 2
+
+def probe_pdf(pdf_path, sample_pages=PROBE_PAGES):
+    """
+    Cheaply inspects up to `sample_pages` pages spread over the document:
+    text-layer density, column layout, ruled tables and image coverage.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+        if page_count == 0:
+            return {"page_count": 0, "sampled": 0}
+
+        step = max(1, page_count // sample_pages)
+        indices = list(range(0, page_count, step))[:sample_pages]
+
+        chars = []
+        multi_column = 0
+        table_pages = 0
+        image_coverage = []
+        for i in indices:
+            page = doc[i]
+            area = abs(page.rect) or 1
+            blocks = page.get_text("blocks")
+            chars.append(sum(len(b[4].strip()) for b in blocks if b[6] == 0))
+            if _is_multi_column(blocks, page.rect.width):
+                multi_column += 1
+            if len(page.get_drawings()) >= TABLE_MIN_DRAWINGS:
+                table_pages += 1
+            covered = sum(abs(pymupdf.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+            image_coverage.append(min(1.0, covered / area))
+
+    sampled = len(indices)
+    return {
+        "page_count": page_count,
+        "sampled": sampled,
+        "chars_per_page": sum(chars) / sampled,
+        "multi_column_pages": multi_column / sampled,
+        "table_pages": table_pages / sampled,
+        "image_coverage": sum(image_coverage) / sampled,
+    }
+
+def choose_route(probe):
+    """
+    Returns ("text", reason) when the text layer is good enough, else ("layout", reason).
+    """
+    if not probe.get("sampled"):
+        return "layout", "empty document"
+    if probe["chars_per_page"] < MIN_CHARS_PER_PAGE:
+        return "layout", f"sparse text layer ({probe['chars_per_page']:.0f} chars/page)"
+    if probe["multi_column_pages"] > MAX_MULTI_COLUMN_PAGES:
+        return "layout", "multi-column layout"
+    if probe["table_pages"] > MAX_TABLE_PAGES:
+        return "layout", "tables"
+    if probe["image_coverage"] > MAX_IMAGE_COVERAGE:
+        return "layout", f"image heavy ({probe['image_coverage']:.0%} coverage)"
+    return "text", "plain text layer"
+
+def _page_to_markdown(page):
+    """
+    Text-layer extraction that marks lines set noticeably larger than the
+    body text as '#' headers, so topic detection keeps working.
+    """
+    lines = []
+    sizes = []
+    for block in page.get_text("dict", sort=True)["blocks"]:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if not text:
+                continue
+            size = max(span["size"] for span in line["spans"])
+            lines.append((text, size))
+            sizes.append(round(size))
+        lines.append(("", 0)) # paragraph break between blocks
+
+    body_size = statistics.mode(sizes) if sizes else 0
+    out = []
+    for text, size in lines:
+        if text and body_size and size >= body_size * HEADER_SIZE_RATIO and len(text) < 120:
+            out.append(f"# {text}")
+        else:
+            out.append(text)
+    return "\n".join(out).strip() + "\n"
+
+def iter_text_pages(pdf_path):
+    """
+    Fast path: yields pages straight from the PDF text layer.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        for page in doc:
+            yield {"text": _page_to_markdown(page), "metadata": {"page": page.number + 1}}
+
+def log_route(record, log_path=ROUTE_LOG):
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with open(log_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def _timed(pages, record, log_path):
+    """
+    Passes pages through, then logs the routing decision with the time spent
+    producing pages (excluding the consumer's own work between pages).
+    """
+    it = iter(pages)
+    elapsed = 0.0
+    count = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            page = next(it)
+        except StopIteration:
+            break
+        finally:
+            elapsed += time.perf_counter() - start
+        count += 1
+        yield page
+    record["pages"] = count
+    record["convert_seconds"] = round(elapsed, 3)
+    log_route(record, log_path)
+
+def load_markdown_pages(pdf_path, split_threshold=LARGE_PDF_PAGES, workers=None, use_cache=True, log_path=ROUTE_LOG):
+    """
+    Yields markdown pages for a PDF. A cheap probe decides between the
+    text-layer fast path and full layout conversion; results are cached by
+    content hash and extractor version, and each decision is logged.
+    """
+    start = time.perf_counter()
+    probe = probe_pdf(pdf_path)
+    route, reason = choose_route(probe)
+    record = {
+        "file": pdf_path,
+        "route": route,
+        "reason": reason,
+        "probe": probe,
+        "probe_seconds": round(time.perf_counter() - start, 3),
+        "at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    print(f"  Extractor: {route} ({reason})")
+
+    if route == "text":
+        version = TEXT_EXTRACTOR_VERSION
+        def convert():
+            return iter_text_pages(pdf_path)
+    else:
+        version = CONVERTER_VERSION
+        def convert():
+            return iter_markdown_pages(pdf_path, split_threshold=split_threshold, workers=workers)
+
+    if not use_cache:
+        return _timed(convert(), record, log_path)
+
+    content_hash = hash_file(pdf_path)
+    record["hash"] = content_hash
+    record["cached"] = has_pages(content_hash, version)
+    return _timed(iter_cached_pages(content_hash, version, convert), record, log_path)
+
+def extract_pdf_text(pdf_path, use_cache=True):
+    """
+    Returns the whole document as text via the routed extractor.
+    """
+    return "\n".join(page["text"] for page in load_markdown_pages(pdf_path, use_cache=use_cache))
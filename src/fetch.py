@@ -0,0 +1,211 @@
+import time
+import random
+import threading
+import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+
+DEFAULT_TIMEOUT = 10
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0 # seconds
+BACKOFF_MAX = 60.0
+# Longer Retry-After waits are not slept through: the response is returned instead
+RETRY_AFTER_MAX = 300.0 # seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Per-host politeness: token bucket rate and concurrency, adapted at runtime
+DEFAULT_RATE = 2.0 # requests per second
+MIN_RATE = 0.1
+MAX_RATE = 8.0
+DEFAULT_BURST = 4
+DEFAULT_CONCURRENCY = 2
+MAX_CONCURRENCY = 8
+TARGET_LATENCY = 2.0 # seconds; slower responses stop concurrency from growing
+
+USER_AGENT = "hazards-dataset-builder/0.1 (+https://github.com/udapy/hazards-dataset-builder)"
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header (seconds or HTTP date) into seconds to wait.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """
+    Exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class HostState:
+    """
+    Token bucket plus an AIMD concurrency limit for one host.
+    Successes with acceptable latency grow the limit and rate; throttling,
+    server errors and timeouts halve them.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, concurrency=DEFAULT_CONCURRENCY, clock=time.monotonic):
+        self.clock = clock
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = clock()
+        self.limit = float(concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency = None # EWMA of response latency
+        self.successes = 0
+        self.failures = 0
+        self.cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _wait_time(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return None # wait for a release
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                now = self.clock()
+                self._refill(now)
+                wait = self._wait_time(now)
+                if wait == 0:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                self.cond.wait(wait)
+
+    def block(self, seconds):
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+    def release(self, latency=None, ok=True):
+        with self.cond:
+            self.in_flight -= 1
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+            if ok:
+                self.successes += 1
+                if self.latency is None or self.latency < TARGET_LATENCY:
+                    self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+                    self.rate = min(MAX_RATE, self.rate * 1.05)
+            else:
+                self.failures += 1
+                self.limit = max(1.0, self.limit / 2)
+                self.rate = max(MIN_RATE, self.rate / 2)
+            self.cond.notify_all()
+
+class FetchScheduler:
+    """
+    Shared HTTP client with per-host rate limiting, retries with backoff and
+    jitter, Retry-After support (up to `retry_after_max`) and adaptive
+    per-host concurrency.
+    """
+
+    def __init__(self, session=None, max_retries=MAX_RETRIES, timeout=DEFAULT_TIMEOUT, sleep=time.sleep,
+                 retry_after_max=RETRY_AFTER_MAX, **host_defaults):
+        if session is None:
+            session = requests.Session()
+            session.headers["User-Agent"] = USER_AGENT
+        self.session = session
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.sleep = sleep
+        self.retry_after_max = retry_after_max
+        self.host_defaults = host_defaults
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, url):
+        netloc = urlparse(url).netloc.lower()
+        with self.lock:
+            if netloc not in self.hosts:
+                self.hosts[netloc] = HostState(**self.host_defaults)
+            return self.hosts[netloc]
+
+    def request(self, method, url, **kwargs):
+        """
+        Issues a request, retrying timeouts, connection errors and retryable statuses.
+        Returns the last response (callers still call raise_for_status), or raises
+        the last network error once retries are exhausted.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host = self.host(url)
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            host.acquire()
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                host.release(time.monotonic() - start, ok=False)
+                if last_attempt:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"Fetch error for {url} ({e}), retrying in {delay:.1f}s...")
+                self.sleep(delay)
+                continue
+
+            latency = time.monotonic() - start
+            if response.status_code not in RETRY_STATUSES:
+                host.release(latency, ok=True)
+                return response
+
+            host.release(latency, ok=False)
+            if last_attempt:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None and retry_after > self.retry_after_max:
+                # Not worth holding the host (and the caller) that long
+                print(f"HTTP {response.status_code} for {url}, Retry-After {retry_after:.0f}s is too long, giving up.")
+                return response
+            delay = backoff_delay(attempt)
+            if retry_after is not None:
+                # The server told us how long to back off: hold the whole host
+                host.block(retry_after)
+                delay = max(delay, retry_after)
+            response.close()
+            print(f"HTTP {response.status_code} for {url}, retrying in {delay:.1f}s...")
+            self.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+# Shared scheduler so every fetcher respects the same per-host limits
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FetchScheduler()
+        return _scheduler
+
+def fetch(url, **kwargs):
+    """
+    GET through the shared scheduler.
+    """
+    return get_scheduler().get(url, **kwargs)
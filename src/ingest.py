@@ -1,7 +1,11 @@
+import mimetypes
 import requests
 from bs4 import BeautifulSoup
+from .fetch import fetch
+from .extract import extract_content
 from .embed import generate_embedding
-from .store import save_document, init_db
+from .store import upsert_document, init_db
+from .sync_lancedb import LanceDBSync
 
 # Initialize DB
 init_db()
@@ -12,7 +16,7 @@ def fetch_url(url):
     Returns a tuple (content_bytes, content_type).
     """
     try:
-        response = requests.get(url, timeout=10)
+        response = fetch(url)
         response.raise_for_status()
         
         content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
@@ -28,3 +32,32 @@ def fetch_url(url):
     except requests.RequestException as e:
         print(f"Error fetching {url}: {e}")
         return None, None
+
+def process_url(url, use_lancedb=False):
+    """
+    Fetches, extracts and stores one URL. Returns True once it is stored,
+    False if nothing could be fetched or extracted.
+    """
+    print(f"Processing {url}...")
+    content, content_type = fetch_url(url)
+    if not content:
+        print(f"Failed to fetch {url}")
+        return False
+
+    print(f"  Type: {content_type}")
+    text = extract_content(content, content_type)
+    if not text:
+        print(f"  No text extracted from {url}")
+        return False
+    
+    print(f"  Extracted {len(text)} characters.")
+    embedding = generate_embedding(text)
+    
+    metadata = {"original_url": url}
+    
+    # Re-processing a URL (a retried or re-enqueued job) replaces its row
+    upsert_document(url, content_type, text, embedding, metadata)
+    print(f"  Saved to SQLite.")
+    if use_lancedb:
+        LanceDBSync().sync(("documents",), maintain=False)
+    return True
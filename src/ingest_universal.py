@@ -1,48 +1,41 @@
 import argparse
 import os
-import requests
 import re
 from urllib.parse import urljoin, urlparse
 import time
 from bs4 import BeautifulSoup
 import trafilatura
-from pypdf import PdfReader
 from .embed import generate_embedding
-from .store import init_db, save_document
-from .store_lancedb import init_db as init_lancedb, save_document as save_lancedb
+from .fetch import fetch
+from .extract_router import extract_pdf_text
+from .crawl import crawl, mark_pdf_done, MAX_PAGES
+from .store import init_db, save_document as save_sqlite
+from .blob_store import init_blob_store, put_stream, stage_done, mark_stage_done, hash_file
+from .post_write import after_writes
 
 # Ensure DBs are initialized
 init_db()
-init_lancedb()
+init_blob_store()
 
-DATA_DIR = "data/universal_downloads"
-os.makedirs(DATA_DIR, exist_ok=True)
-
-def download_file(url, dest_folder):
+def download_file(url):
+    """
+    Streams a URL into the blob store, keyed by content hash and indexed by URL,
+    so the same document linked from several places is stored once.
+    Returns (content_hash, blob_path), or (None, None) on failure.
+    """
     try:
-        response = requests.get(url, stream=True, timeout=10)
+        response = fetch(url, stream=True)
         response.raise_for_status()
-        
-        filename = os.path.basename(urlparse(url).path)
-        if not filename:
-            filename = "downloaded_file.pdf" # Fallback
-            
-        filepath = os.path.join(dest_folder, filename)
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return filepath
+        ext = os.path.splitext(urlparse(url).path)[1].lower() or ".pdf"
+        return put_stream(response.iter_content(chunk_size=8192), ref=url, ext=ext)
     except Exception as e:
         print(f"Error downloading {url}: {e}")
-        return None
+        return None, None
 
 def extract_text_from_pdf(pdf_path):
     try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        # Text-layer fast path, escalating to layout conversion when the probe asks for it
+        return extract_pdf_text(pdf_path)
     except Exception as e:
         print(f"Error reading PDF {pdf_path}: {e}")
         return ""
@@ -91,30 +84,49 @@ def structure_text(text):
             
     return formatted_text
 
-def ingest_universal(input_path=None):
+def ingest_universal(input_path=None, crawl_depth=0, max_pages=MAX_PAGES):
+    """
+    Ingests a URL or local file. With `crawl_depth` > 0, a URL is also used as
+    a crawl seed: same-site pages are followed up to that depth and every PDF
+    not ingested by earlier crawls is ingested as its own document.
+    Returns True once the input is stored (or its content already was),
+    False otherwise.
+    """
     if not input_path:
         print("No input path provided for ingestion.")
-        return
+        return False
+
+    if crawl_depth and input_path.startswith("http"):
+        found = crawl([input_path], max_depth=crawl_depth, max_pages=max_pages)
+        for pdf_url in found["pdfs"]:
+            if ingest_universal(pdf_url):
+                mark_pdf_done(pdf_url)
 
     print(f"Processing {input_path}...")
     
     extracted_text = ""
     content_type = ""
+    content_hash = None
     metadata = {"original_source": input_path, "attachments": []}
     
     if input_path.startswith("http"):
         # URL Processing
         try:
-            response = requests.get(input_path, timeout=10)
+            response = fetch(input_path)
             response.raise_for_status()
             content_type = response.headers.get('Content-Type', '').split(';')[0]
             
             if 'pdf' in content_type:
                 # It's a PDF URL
-                pdf_path = download_file(input_path, DATA_DIR)
+                content_hash, pdf_path = download_file(input_path)
                 if pdf_path:
+                    done_as = stage_done(content_hash, "ingest")
+                    if done_as:
+                        print(f"Same content already ingested as {done_as}, skipping.")
+                        return True
                     extracted_text = extract_text_from_pdf(pdf_path)
                     metadata["local_path"] = pdf_path
+                    metadata["content_hash"] = content_hash
             else:
                 # It's likely HTML
                 extracted_text = trafilatura.extract(response.text)
@@ -126,23 +138,29 @@ def ingest_universal(input_path=None):
                     if href.lower().endswith('.pdf'):
                         abs_url = urljoin(input_path, href)
                         print(f"Found attachment: {abs_url}")
-                        att_path = download_file(abs_url, DATA_DIR)
+                        _, att_path = download_file(abs_url)
                         if att_path:
                             metadata["attachments"].append(att_path)
                             
         except Exception as e:
             print(f"Error fetching URL: {e}")
-            return
+            return False
 
     else:
         # Local File Processing
         if not os.path.exists(input_path):
             print(f"File not found: {input_path}")
-            return
+            return False
             
         if input_path.lower().endswith('.pdf'):
             content_type = "application/pdf"
+            content_hash = hash_file(input_path)
+            done_as = stage_done(content_hash, "ingest")
+            if done_as:
+                print(f"Same content already ingested as {done_as}, skipping.")
+                return True
             extracted_text = extract_text_from_pdf(input_path)
+            metadata["content_hash"] = content_hash
         else:
             # Assume text or html file
             content_type = "text/plain"
@@ -151,7 +169,7 @@ def ingest_universal(input_path=None):
 
     if not extracted_text:
         print("No text extracted.")
-        return
+        return False
 
     # Structure the text
     structured_text = structure_text(extracted_text)
@@ -159,15 +177,22 @@ def ingest_universal(input_path=None):
     # Generate Embedding
     embedding = generate_embedding(structured_text)
     
-    # Save to DBs
+    # SQLite only; sync_lancedb carries the row over to LanceDB
     save_sqlite(input_path, content_type, structured_text, embedding, metadata)
-    save_lancedb(input_path, content_type, structured_text, embedding, metadata)
     
-    print("Saved to SQLite and LanceDB.")
+    print("Saved to SQLite.")
+
+    if content_hash:
+        mark_stage_done(content_hash, "ingest", ref=input_path)
+    return True
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Universal Ingestion Script")
     parser.add_argument("--input", required=True, help="URL or file path to ingest")
+    parser.add_argument("--crawl-depth", type=int, default=0, help="Follow same-site links up to this depth")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES, help="Page budget for crawling")
+    parser.add_argument("--no-sync", action="store_true", help="Leave syncing new rows to LanceDB for later (python -m src.sync_lancedb)")
     args = parser.parse_args()
     
-    ingest_universal(args.input)
+    ingest_universal(args.input, crawl_depth=args.crawl_depth, max_pages=args.max_pages)
+    after_writes(sync=not args.no_sync)
@@ -0,0 +1,39 @@
+import os
+import gzip
+import json
+
+CACHE_DIR = "data/cache/markdown"
+
+def cache_path(content_hash, converter_version, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, content_hash[:2], f"{content_hash}-{converter_version}.jsonl.gz")
+
+def has_pages(content_hash, converter_version, cache_dir=CACHE_DIR):
+    return os.path.exists(cache_path(content_hash, converter_version, cache_dir))
+
+def iter_cached_pages(content_hash, converter_version, convert, cache_dir=CACHE_DIR):
+    """
+    Yields per-page markdown for a PDF, keyed by its content hash and converter version.
+    On a miss, pages come from `convert()` and are written through to a
+    gzipped JSON-lines file, which is only published once conversion completes.
+    """
+    path = cache_path(content_hash, converter_version, cache_dir)
+    if os.path.exists(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    complete = False
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for page in convert():
+                f.write(json.dumps(page) + "\n")
+                yield page
+        os.replace(tmp_path, path)
+        complete = True
+    finally:
+        # Interrupted or failed conversions never leave a partial cache entry
+        if not complete and os.path.exists(tmp_path):
+            os.remove(tmp_path)
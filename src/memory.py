@@ -0,0 +1,196 @@
+import gc
+import os
+import re
+import sys
+import time
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SAMPLE_INTERVAL = 0.05 # seconds between background RSS samples
+
+# Fractions of the budget: above HIGH batch sizes halve, below LOW they grow back
+HIGH_WATERMARK = 0.8
+LOW_WATERMARK = 0.5
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+def parse_size(value):
+    """
+    Parses sizes like "512M", "2G" or "1.5GB" into bytes.
+    """
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)i?B?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size '{value}', expected e.g. 512M or 2G")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+def format_size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+
+def rss_bytes():
+    """
+    Current resident set size of this process.
+    """
+    if psutil:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak instead of current, but the best available without /proc
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class MemoryBudget:
+    """
+    Tracks memory per pipeline stage and sizes batches to stay under a limit.
+    With no limit only stage peaks are recorded and batch sizes are left alone.
+    With a limit, a background thread samples RSS and tracemalloc follows
+    Python allocations, so short spikes inside a stage are caught too.
+    """
+
+    def __init__(self, limit=None, sample_interval=SAMPLE_INTERVAL):
+        self.limit = parse_size(limit) if isinstance(limit, str) else limit
+        self.sample_interval = sample_interval
+        self.stages = {}
+        self.sizes = {}
+        self._current = []
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+
+    def start(self):
+        if not self.limit or self._thread:
+            return self
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Records current RSS against every open stage and returns it.
+        """
+        rss = rss_bytes()
+        with self._lock:
+            for name in self._current:
+                stats = self.stages[name]
+                stats["peak_rss"] = max(stats["peak_rss"], rss)
+        return rss
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager recording peak RSS and peak traced Python allocations for a stage.
+        """
+        with self._lock:
+            stats = self.stages.setdefault(name, {"peak_rss": 0, "peak_traced": 0, "seconds": 0.0, "runs": 0})
+            self._current.append(name)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        self.sample()
+        try:
+            yield stats
+        finally:
+            self.sample()
+            with self._lock:
+                if tracemalloc.is_tracing():
+                    # Enclosing stages share the peak, since entering this stage reset it
+                    peak = tracemalloc.get_traced_memory()[1]
+                    for open_name in self._current:
+                        open_stats = self.stages[open_name]
+                        open_stats["peak_traced"] = max(open_stats["peak_traced"], peak)
+                stats["seconds"] += time.perf_counter() - start
+                stats["runs"] += 1
+                self._current.remove(name)
+
+    def pressure(self):
+        """
+        Current RSS as a fraction of the budget (0 when unlimited).
+        """
+        if not self.limit:
+            return 0.0
+        return self.sample() / self.limit
+
+    def adapt(self, name, default, minimum=1):
+        """
+        Returns the batch size to use next for `name`: halved while memory is
+        above the high watermark, doubled back towards `default` once it drops
+        below the low watermark.
+        """
+        if not self.limit:
+            return default
+        size = self.sizes.get(name, default)
+        pressure = self.pressure()
+        if pressure > HIGH_WATERMARK:
+            gc.collect()
+            new_size = max(minimum, size // 2)
+            if new_size != size:
+                print(f"  Memory at {pressure:.0%} of budget, {name} batch {size} -> {new_size}")
+            size = new_size
+        elif pressure < LOW_WATERMARK:
+            size = min(default, size * 2)
+        self.sizes[name] = size
+        return size
+
+    def report(self):
+        if not self.stages:
+            return
+        budget = f" (budget {format_size(self.limit)})" if self.limit else ""
+        print(f"Peak memory per stage{budget}:")
+        for name, stats in self.stages.items():
+            traced = f", python {format_size(stats['peak_traced'])}" if stats["peak_traced"] else ""
+            print(f"  {name}: rss {format_size(stats['peak_rss'])}{traced}, "
+                  f"{stats['seconds']:.1f}s over {stats['runs']} run(s)")
+
+# Process-wide budget, configured once from --memory-budget
+_budget = MemoryBudget()
+
+def get_budget():
+    return _budget
+
+def set_budget(limit):
+    """
+    Replaces the process-wide budget (e.g. "2G") and starts sampling.
+    """
+    global _budget
+    _budget.stop()
+    _budget = MemoryBudget(limit).start()
+    return _budget
+
+def tracked(stage_name):
+    """
+    Decorator running a function inside a stage of the process-wide budget.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_budget().stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
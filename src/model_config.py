@@ -0,0 +1,37 @@
+import os
+import json
+
+MODEL_CONFIG_PATH = "data/embedding_model.json"
+
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_DIM = 384
+
+def load_model_config(path=MODEL_CONFIG_PATH):
+    """
+    The active embedding model: {"model", "dim", "version", "tables"}, where
+    "tables" maps logical LanceDB table names to the physical table holding
+    vectors of this model. Without a config file the defaults apply.
+    """
+    config = {"model": DEFAULT_MODEL, "dim": DEFAULT_DIM, "version": 0, "tables": {}}
+    try:
+        with open(path, "r") as f:
+            config.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return config
+
+def save_model_config(config, path=MODEL_CONFIG_PATH):
+    """
+    Writes the config with an atomic rename, so readers see the old or the new model, never a mix.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+
+def lancedb_table(name, path=MODEL_CONFIG_PATH):
+    """
+    Physical LanceDB table currently serving the logical table `name`.
+    """
+    return load_model_config(path)["tables"].get(name, name)
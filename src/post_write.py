@@ -0,0 +1,13 @@
+from .sync_lancedb import LanceDBSync
+from .routing_index import update_routing_index
+
+def after_writes(sync=True, full_sync=False):
+    """
+    Run once after a command (or a drained queue worker) wrote to SQLite,
+    including runs that only deleted rows: carries the logged changes to
+    LanceDB unless `sync` is off, and rebuilds the routing index
+    partitions whose rows changed.
+    """
+    if sync or full_sync:
+        LanceDBSync().sync(full=full_sync)
+    update_routing_index()
@@ -2,18 +2,26 @@ import os
 import json
 import re
 import datetime
-import pymupdf4llm
 import pathlib
-from .embed import generate_embedding
-from .store import init_db as init_sqlite, save_structured_document as save_sqlite_struct
-from .store_lancedb import init_db as init_lancedb, save_structured_document as save_lancedb_struct
+import hashlib
+import inspect
+from .embed import generate_embeddings, structured_embedding_text
+from .embed_pool import EmbeddingPool
+from .memory import get_budget, set_budget
+from .extract_router import load_markdown_pages, LARGE_PDF_PAGES
+from .store import init_db as init_sqlite, save_structured_documents as save_sqlite_structs, delete_structured_by_source as delete_sqlite_struct
+from .blob_store import init_blob_store, put_file, stage_done, mark_stage_done
+from .post_write import after_writes
 
 # Ensure DBs are initialized
 init_sqlite()
-init_lancedb()
+init_blob_store()
 
 PDF_DIR = "data/raw"
 
+# Pages embedded and written per batch; shrunk under memory pressure
+WRITE_BUFFER_ROWS = 64
+
 def extract_metadata(text, hazard_name):
     """
     Extracts Phase, Audience, Topic, and Action Items from text chunk.
@@ -101,7 +109,108 @@ def extract_metadata(text, hazard_name):
     
     return meta
 
-def process_pdfs(limit=None):
+# Stage key in the blob store: content is processed again once the page
+# structuring changes (the markdown cache still skips the conversion)
+PROCESS_STAGE = "process_pdfs-" + hashlib.sha256(inspect.getsource(extract_metadata).encode("utf-8")).hexdigest()[:12]
+
+def _flush(buffer, pool=None):
+    """
+    Embeds buffered pages in batches and writes them to SQLite in bulk
+    (sync_lancedb carries them over to LanceDB).
+    """
+    if not buffer:
+        return 0
+    records = [record for record, _ in buffer]
+    embeddings = generate_embeddings([embed_text for _, embed_text in buffer], pool=pool)
+    save_sqlite_structs(records, embeddings)
+    count = len(buffer)
+    buffer.clear()
+    return count
+
+def process_pdf(pdf_path, workers=None, split_threshold=LARGE_PDF_PAGES, use_cache=True, force=False, pool=None):
+    """
+    Converts, structures and embeds one PDF, replacing rows from an earlier
+    version of the file. Returns the number of pages saved, or None when the
+    content was already processed by the current extract_metadata and `force`
+    is not set.
+    """
+    f = os.path.basename(pdf_path)
+    budget = get_budget()
+    content_hash, _ = put_file(pdf_path, ref=f"raw/{f}")
+    done_as = stage_done(content_hash, PROCESS_STAGE)
+    if done_as and not force:
+        if done_as != f:
+            # This file now holds content already processed as another file:
+            # rows from its earlier content would otherwise be left behind
+            delete_sqlite_struct(f)
+        print(f"  Unchanged content (processed as {done_as}), skipping.")
+        return None
+
+    # Replace rows from an earlier version of this file
+    delete_sqlite_struct(f)
+
+    # Get last updated date from file
+    fname = pathlib.Path(pdf_path)
+    mtime = datetime.datetime.fromtimestamp(fname.stat().st_mtime)
+    last_updated = mtime.strftime("%Y-%m-%d")
+
+    # Convert PDF to Markdown pages (or load a cached conversion), streamed in page order
+    pages = load_markdown_pages(pdf_path, split_threshold, workers, use_cache)
+
+    hazard_type = f.replace(".pdf", "").replace("_", " ").replace("-", " ").title()
+
+    current_topic = "General Safety"
+    pages_saved = 0
+    buffer = []
+
+    for page in pages:
+        text = page['text']
+        page_num = page['metadata']['page']
+
+        # Extract metadata
+        meta = extract_metadata(text, hazard_type)
+
+        # Update topic if found, else keep previous
+        if meta["topic"] != "General Safety":
+            current_topic = meta["topic"]
+        else:
+            meta["topic"] = current_topic
+
+        # Prepare data record
+        record = {
+            "hazard_type": hazard_type,
+            "phase": meta["phase"],
+            "audience": meta["audience"],
+            "topic": meta["topic"],
+            "content_raw": text,
+            "action_items": meta["action_items"],
+            "sources": meta.get("sources", []),
+            "source_file": f,
+            "page_ref": page_num,
+            "last_updated": last_updated
+        }
+
+        # Combine important fields for semantic search
+        embed_text = structured_embedding_text(hazard_type, meta['phase'], meta['topic'], text)
+        buffer.append((record, embed_text))
+
+        # Embed and save in batches; smaller batches as memory fills up
+        if len(buffer) >= budget.adapt("writer", WRITE_BUFFER_ROWS):
+            pages_saved += _flush(buffer, pool)
+
+    pages_saved += _flush(buffer, pool)
+    mark_stage_done(content_hash, PROCESS_STAGE, ref=f)
+    return pages_saved
+
+def process_pdfs(limit=None, workers=None, split_threshold=LARGE_PDF_PAGES, use_cache=True, force=False, embed_pool=False):
+    """
+    Converts, structures and embeds every PDF in PDF_DIR. Files are tracked in
+    the blob store by content hash, so content already processed (under this
+    or any other file name) with the current extract_metadata is skipped
+    unless `force` is set.
+    With `embed_pool`, embeddings are computed by an EmbeddingPool using the
+    benchmarked workers x threads layout.
+    """
     if not os.path.exists(PDF_DIR):
         print(f"Directory not found: {PDF_DIR}")
         return
@@ -110,76 +219,47 @@ def process_pdfs(limit=None):
     total_files = len(files)
     print(f"Found {total_files} PDFs.")
     
+    pool = EmbeddingPool().start() if embed_pool else None
     count = 0
-    for i, f in enumerate(files):
-        if limit and count >= limit:
-            break
-            
-        pdf_path = os.path.join(PDF_DIR, f)
-        print(f"[{i+1}/{total_files}] Processing {f}...")
-        
-        try:
-            # Get last updated date from file
-            fname = pathlib.Path(pdf_path)
-            mtime = datetime.datetime.fromtimestamp(fname.stat().st_mtime)
-            last_updated = mtime.strftime("%Y-%m-%d")
-            
-            # Convert PDF to Markdown pages
-            # page_chunks=True returns a list of dictionaries
-            pages = pymupdf4llm.to_markdown(pdf_path, page_chunks=True)
-            
-            hazard_type = f.replace(".pdf", "").replace("_", " ").replace("-", " ").title()
-            
-            current_topic = "General Safety"
-            
-            for page in pages:
-                text = page['text']
-                page_num = page['metadata']['page']
-                
-                # Extract metadata
-                meta = extract_metadata(text, hazard_type)
-                
-                # Update topic if found, else keep previous
-                if meta["topic"] != "General Safety":
-                    current_topic = meta["topic"]
-                else:
-                    meta["topic"] = current_topic
-                
-                # Prepare data record
-                record = {
-                    "hazard_type": hazard_type,
-                    "phase": meta["phase"],
-                    "audience": meta["audience"],
-                    "topic": meta["topic"],
-                    "content_raw": text,
-                    "action_items": meta["action_items"],
-                    "sources": meta.get("sources", []),
-                    "source_file": f,
-                    "page_ref": page_num,
-                    "last_updated": last_updated
-                }
-                
-                # Generate embedding for the chunk
-                # Combine important fields for semantic search
-                embed_text = f"{hazard_type} {meta['phase']} {meta['topic']} {text}"
-                embedding = generate_embedding(embed_text)
-                
-                # Save to DBs
-                save_sqlite_struct(record, embedding)
-                save_lancedb_struct(record, embedding)
-            
-            count += 1
-            
-        except Exception as e:
-            print(f"Error processing {f}: {e}")
-            continue
-        
-    print("Finished processing PDFs.")
+    pages_saved = 0
+    try:
+        with get_budget().stage("process_pdfs"):
+            for i, f in enumerate(files):
+                if limit and count >= limit:
+                    break
+
+                print(f"[{i+1}/{total_files}] Processing {f}...")
+
+                try:
+                    saved = process_pdf(os.path.join(PDF_DIR, f), workers, split_threshold, use_cache, force, pool)
+                except Exception as e:
+                    print(f"Error processing {f}: {e}")
+                    continue
+                if saved is not None:
+                    pages_saved += saved
+                    count += 1
+    finally:
+        # Worker processes are shut down on errors and Ctrl-C too
+        if pool:
+            pool.close()
+    print(f"Finished processing PDFs ({pages_saved} pages saved).")
 
 import argparse
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process PDFs")
     parser.add_argument("--limit", type=int, help="Limit number of PDFs to process")
+    parser.add_argument("--workers", type=int, help="Worker processes for large PDFs")
+    parser.add_argument("--split-pages", type=int, default=LARGE_PDF_PAGES, help="Page count above which PDFs are split")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-run PDF to markdown conversion")
+    parser.add_argument("--force", action="store_true", help="Reprocess PDFs whose content was already processed with the current extract_metadata")
+    parser.add_argument("--memory-budget", help="Adapt batch sizes to stay under this much RSS (e.g. 2G)")
+    parser.add_argument("--embed-pool", action="store_true", help="Embed with a multi-process pool (see python -m src.embed_pool)")
+    parser.add_argument("--no-sync", action="store_true", help="Leave syncing new rows to LanceDB for later (python -m src.sync_lancedb)")
     args = parser.parse_args()
-    process_pdfs(limit=args.limit)
+    if args.memory_budget:
+        set_budget(args.memory_budget)
+    process_pdfs(limit=args.limit, workers=args.workers, split_threshold=args.split_pages, use_cache=not args.no_cache, force=args.force,
+                 embed_pool=args.embed_pool)
+    after_writes(sync=not args.no_sync)
+    get_budget().report()
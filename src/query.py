@@ -0,0 +1,184 @@
+import re
+import sqlite3
+from .store import DB_NAME, fill_link_columns, reverse_domain
+
+FACET_FIELDS = ("hazard_type", "phase", "audience")
+LINK_FIELDS = ("action_items", "sources")
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def parse_where(clauses):
+    """
+    Parses --where style clauses into a filter dict.
+    "hazard_type=Flood" -> {"hazard_type": ["Flood"]}
+    "phase=Prepare,React" -> {"phase": ["Prepare", "React"]}
+    """
+    filters = {}
+    for clause in clauses or []:
+        if '=' not in clause:
+            raise ValueError(f"Invalid filter '{clause}', expected column=value")
+        column, value = clause.split('=', 1)
+        column = column.strip()
+        if not _IDENTIFIER.match(column):
+            raise ValueError(f"Invalid column name '{column}'")
+        values = [v.strip() for v in value.split(',') if v.strip()]
+        filters.setdefault(column, []).extend(values)
+    return filters
+
+def get_columns(conn, table_name):
+    cursor = conn.execute(f"PRAGMA table_info({table_name})")
+    return [row[1] for row in cursor.fetchall()]
+
+def _check_columns(columns, allowed, table_name):
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown column(s) for {table_name}: {', '.join(unknown)}")
+
+def build_where(filters):
+    """
+    Builds a parameterized SQL WHERE clause from a filter dict.
+    Returns (sql, params); sql is empty when there are no filters.
+    """
+    if not filters:
+        return "", []
+
+    parts = []
+    params = []
+    for column, values in filters.items():
+        if isinstance(values, str):
+            values = [values]
+        if len(values) == 1:
+            parts.append(f"{column} = ?")
+        else:
+            parts.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    return " WHERE " + " AND ".join(parts), params
+
+def build_lance_where(filters):
+    """
+    Builds a LanceDB filter expression from a filter dict.
+    """
+    parts = []
+    for column, values in (filters or {}).items():
+        if isinstance(values, str):
+            values = [values]
+        quoted = ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+        parts.append(f"{column} IN ({quoted})")
+    return " AND ".join(parts)
+
+def build_select(table_name, conn, filters=None, columns=None):
+    """
+    Builds a validated SELECT statement for a table.
+    Returns (sql, params).
+    """
+    allowed = get_columns(conn, table_name)
+    if not allowed:
+        raise ValueError(f"Table not found: {table_name}")
+    if filters:
+        _check_columns(filters.keys(), allowed, table_name)
+    if columns:
+        _check_columns(columns, allowed, table_name)
+
+    select = ", ".join(columns) if columns else "*"
+    where, params = build_where(filters)
+    return f"SELECT {select} FROM {table_name}{where}", params
+
+def facet_counts(fields=FACET_FIELDS, filters=None, table_name="structured_hazards", db_name=DB_NAME):
+    """
+    Returns row counts per value of each facet field, e.g.
+    {"hazard_type": {"Flood": 120, ...}, "phase": {...}, "audience": {...}}.
+    Counts honour `filters`, so facets can be drilled down.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        allowed = get_columns(conn, table_name)
+        _check_columns(fields, allowed, table_name)
+        if filters:
+            _check_columns(filters.keys(), allowed, table_name)
+
+        where, params = build_where(filters)
+        facets = {}
+        for field in fields:
+            cursor = conn.execute(
+                f"SELECT {field}, COUNT(*) FROM {table_name}{where} "
+                f"GROUP BY {field} ORDER BY COUNT(*) DESC",
+                params
+            )
+            facets[field] = {value: count for value, count in cursor.fetchall()}
+        return facets
+    finally:
+        conn.close()
+
+def iter_rows(filters=None, columns=None, table_name="structured_hazards", batch_size=1000, db_name=DB_NAME):
+    """
+    Streams matching rows as dicts, fetching `batch_size` rows at a time.
+    """
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    # Linked action items and sources are rebuilt by page id
+    links = table_name == "structured_hazards" and (not columns or any(c in LINK_FIELDS for c in columns))
+    extra_id = links and columns and "id" not in columns
+    try:
+        sql, params = build_select(table_name, conn, filters, list(columns) + ["id"] if extra_id else columns)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            rows = [dict(row) for row in rows]
+            if links:
+                fill_link_columns(conn, rows)
+            for row in rows:
+                if extra_id:
+                    del row["id"]
+                yield row
+    finally:
+        conn.close()
+
+def _domain_where(domain, include_subdomains):
+    rev = reverse_domain(domain.lower().removeprefix("www."))
+    if include_subdomains:
+        # "gov.ready" and everything under "gov.ready.": one range on idx_sources_domain_rev
+        return "(s.domain_rev = ? OR (s.domain_rev > ? AND s.domain_rev < ?))", [rev, rev + ".", rev + "/"]
+    return "s.domain_rev = ?", [rev]
+
+def hazards_citing(domain, include_subdomains=True, db_name=DB_NAME):
+    """
+    Pages per hazard type citing a source on `domain` (e.g. "ready.gov"),
+    most citing first.
+    """
+    where, params = _domain_where(domain, include_subdomains)
+    conn = sqlite3.connect(db_name)
+    try:
+        cursor = conn.execute(f'''
+            SELECT h.hazard_type, COUNT(DISTINCT h.id)
+            FROM sources s
+            JOIN page_sources l ON l.source_id = s.id
+            JOIN structured_hazards h ON h.id = l.page_id
+            WHERE {where}
+            GROUP BY h.hazard_type ORDER BY COUNT(DISTINCT h.id) DESC
+        ''', params)
+        return {hazard_type: pages for hazard_type, pages in cursor.fetchall()}
+    finally:
+        conn.close()
+
+def top_domains(limit=20, db_name=DB_NAME):
+    """
+    Most cited source domains with the number of citing pages.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        cursor = conn.execute('''
+            SELECT s.domain, COUNT(DISTINCT l.page_id)
+            FROM sources s JOIN page_sources l ON l.source_id = s.id
+            GROUP BY s.domain ORDER BY COUNT(DISTINCT l.page_id) DESC LIMIT ?
+        ''', (limit,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def print_facets(facets):
+    for field, counts in facets.items():
+        print(f"{field}:")
+        for value, count in counts.items():
+            print(f"  {value}: {count}")
@@ -0,0 +1,305 @@
+import json
+import time
+import sqlite3
+import argparse
+import functools
+import lancedb
+import numpy as np
+from .store import DB_NAME
+from .store_lancedb import LANCEDB_URI
+from .model_config import MODEL_CONFIG_PATH, load_model_config, save_model_config
+from .embed import generate_embeddings, structured_embedding_text, section_embedding_text
+from .embed_pool import EmbeddingPool, load_default_model
+from .sync_lancedb import LanceDBSync
+from .memory import get_budget
+
+# Rows read, embedded and written per batch; shrunk under memory pressure
+REEMBED_BATCH_ROWS = 256
+
+TABLES = ("documents", "structured_hazards")
+
+# Columns each table's embedding text is built from
+TEXT_COLUMNS = {
+    "documents": ["extracted_text", "metadata"],
+    "structured_hazards": ["hazard_type", "phase", "topic", "content_raw"],
+}
+
+def init_reembed(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+
+    # One row per table of a re-embedding pass; the staged rows themselves are the checkpoint
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reembed_jobs (
+            store TEXT,
+            table_name TEXT,
+            version INTEGER,
+            model TEXT,
+            dim INTEGER,
+            status TEXT,
+            rows_done INTEGER DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (store, table_name, version)
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+
+def embedding_text(table_name, row):
+    """
+    Rebuilds the text a row was embedded from, the same way the pipeline built it.
+    """
+    if table_name == "structured_hazards":
+        return structured_embedding_text(row.get("hazard_type"), row.get("phase"), row.get("topic"), row.get("content_raw") or "")
+
+    text = row.get("extracted_text") or ""
+    try:
+        metadata = json.loads(row.get("metadata") or "{}")
+    except ValueError:
+        metadata = {}
+    # Scraped hazard sections carry the hazard name and phase in their metadata
+    if metadata.get("hazard_type") and metadata.get("phase"):
+        return section_embedding_text(metadata["hazard_type"], metadata["phase"], text)
+    return text
+
+def sqlite_staging_table(table_name, version):
+    return f"{table_name}_embedding_v{version}"
+
+def lancedb_version_table(table_name, version):
+    return f"{table_name}_v{version}"
+
+class Reembedder:
+    """
+    Re-embeds stored text with a new model without re-crawling.
+    Vectors are staged in SQLite side tables (<table>_embedding_v<N>, keyed by
+    row id) and progress is read back from them, so an interrupted pass
+    resumes where it stopped. Nothing changes for readers until every table
+    is staged; then one SQLite transaction swaps all vectors and the model
+    config is renamed into place. LanceDB is not staged separately: the new
+    config points it at <table>_v<N>, which sync_lancedb snapshots from SQLite.
+    """
+
+    def __init__(self, model_name, tables=TABLES, batch_rows=REEMBED_BATCH_ROWS,
+                 embed_fn=None, pool=None, db_name=DB_NAME, lancedb_uri=LANCEDB_URI, config_path=MODEL_CONFIG_PATH):
+        self.model_name = model_name
+        self.tables = tables
+        self.batch_rows = batch_rows
+        self.pool = pool
+        self.embed_fn = embed_fn or self._embed
+        self.db_name = db_name
+        self.lancedb_uri = lancedb_uri
+        self.config_path = config_path
+        self.budget = get_budget()
+        init_reembed(db_name)
+
+        self.config = load_model_config(config_path)
+        self.version = self._resolve_version()
+        self.dim = None
+
+    def _embed(self, texts):
+        return generate_embeddings(texts, pool=self.pool, model_name=self.model_name)
+
+    def _resolve_version(self):
+        """
+        Resumes an unfinished pass for this model, else starts a new version.
+        Passes newer than the active config version have not been switched yet.
+        """
+        conn = sqlite3.connect(self.db_name)
+        row = conn.execute('''
+            SELECT version FROM reembed_jobs
+            WHERE model = ? AND version > ?
+            ORDER BY version DESC LIMIT 1
+        ''', (self.model_name, self.config["version"])).fetchone()
+        latest = conn.execute("SELECT MAX(version) FROM reembed_jobs").fetchone()[0] or 0
+        conn.close()
+        if row:
+            print(f"Resuming re-embedding pass v{row[0]} for {self.model_name}.")
+            return row[0]
+        return max(latest, self.config["version"]) + 1
+
+    def _vectors(self, table_name, rows):
+        """
+        Embeds rows (dicts) and returns float32 arrays (None for empty text).
+        """
+        vectors = self.embed_fn([embedding_text(table_name, row) for row in rows])
+        vectors = [None if v is None else np.asarray(v, dtype=np.float32) for v in vectors]
+        if self.dim is None:
+            self.dim = next((len(v) for v in vectors if v is not None), None)
+        return vectors
+
+    def _job(self, conn, table_name, status, rows_done):
+        conn.execute('''
+            INSERT INTO reembed_jobs (store, table_name, version, model, dim, status, rows_done)
+            VALUES ('sqlite', ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(store, table_name, version) DO UPDATE SET
+                dim = COALESCE(excluded.dim, dim),
+                status = excluded.status,
+                rows_done = excluded.rows_done,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (table_name, self.version, self.model_name, self.dim, status, rows_done))
+
+    def _job_status(self, table_name):
+        conn = sqlite3.connect(self.db_name)
+        row = conn.execute('''
+            SELECT status, dim FROM reembed_jobs WHERE store = 'sqlite' AND table_name = ? AND version = ?
+        ''', (table_name, self.version)).fetchone()
+        conn.close()
+        if row and row[1] and self.dim is None:
+            self.dim = row[1]
+        return row[0] if row else None
+
+    def _stage_sqlite_batch(self, conn, table_name, staging):
+        """
+        Embeds the next id range of rows not yet staged. Returns the number of rows staged.
+        """
+        size = self.budget.adapt("reembed", self.batch_rows)
+        last_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {staging}").fetchone()[0]
+        columns = ", ".join(["id"] + TEXT_COLUMNS[table_name])
+        cursor = conn.execute(f"SELECT {columns} FROM {table_name} WHERE id > ? ORDER BY id LIMIT ?", (last_id, size))
+        names = [d[0] for d in cursor.description]
+        rows = [dict(zip(names, r)) for r in cursor.fetchall()]
+        if not rows:
+            return 0
+
+        vectors = self._vectors(table_name, rows)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {staging} (id, embedding) VALUES (?, ?)",
+            [(row["id"], None if v is None else v.tobytes()) for row, v in zip(rows, vectors)]
+        )
+        return len(rows)
+
+    def stage_sqlite(self, table_name):
+        staging = sqlite_staging_table(table_name, self.version)
+        conn = sqlite3.connect(self.db_name)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {staging} (id INTEGER PRIMARY KEY, embedding BLOB)")
+        done = conn.execute(f"SELECT COUNT(*) FROM {staging}").fetchone()[0]
+        total = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        print(f"  {table_name}: {done}/{total} rows staged")
+
+        while True:
+            # Rows and job progress commit together, so a crash loses at most one batch
+            with conn:
+                staged = self._stage_sqlite_batch(conn, table_name, staging)
+                done += staged
+                self._job(conn, table_name, "staging" if staged else "staged", done)
+            if not staged:
+                break
+            print(f"  {table_name}: {done}/{total} rows staged")
+        conn.close()
+
+    def switch_sqlite(self):
+        """
+        Embeds rows written since staging finished, then swaps the vectors of
+        every table in one transaction.
+        """
+        conn = sqlite3.connect(self.db_name, isolation_level=None)
+        try:
+            # Blocks other writers until the swap commits
+            conn.execute("BEGIN IMMEDIATE")
+            for table_name in self.tables:
+                staging = sqlite_staging_table(table_name, self.version)
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {staging} (id INTEGER PRIMARY KEY, embedding BLOB)")
+                while self._stage_sqlite_batch(conn, table_name, staging):
+                    pass
+                conn.execute(f'''
+                    UPDATE {table_name}
+                    SET embedding = (SELECT s.embedding FROM {staging} s WHERE s.id = {table_name}.id)
+                    WHERE id IN (SELECT id FROM {staging})
+                ''')
+                conn.execute(f"DROP TABLE {staging}")
+                rows = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                self._job(conn, table_name, "switched", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def run(self, switch=True, keep_previous=False):
+        """
+        Stages every requested table, then (with `switch`) makes the new model active.
+        Returns True once switched.
+        """
+        start = time.perf_counter()
+        print(f"Re-embedding with {self.model_name} (pass v{self.version})...")
+        with self.budget.stage("reembed"):
+            if all(self._job_status(t) == "switched" for t in self.tables):
+                # Interrupted after the SQLite swap: only the config is left to write
+                print("Vectors already swapped, finishing the switch.")
+            else:
+                for table_name in self.tables:
+                    self.stage_sqlite(table_name)
+
+            if not switch:
+                print(f"Staged in {time.perf_counter() - start:.1f}s; run again without --no-switch to activate.")
+                return False
+            self.switch(keep_previous)
+
+        print(f"Re-embedding finished in {time.perf_counter() - start:.1f}s.")
+        return True
+
+    def switch(self, keep_previous=False):
+        """
+        Swaps the SQLite vectors (unless an interrupted pass already did),
+        then renames the model config into place as the last step.
+        """
+        if any(self._job_status(t) != "switched" for t in self.tables):
+            self.switch_sqlite()
+        if self.dim is None:
+            self.dim = len(self.embed_fn(["dimension probe"])[0])
+
+        tables = dict(self.config["tables"])
+        previous = [tables.get(t, t) for t in self.tables]
+        tables.update({t: lancedb_version_table(t, self.version) for t in self.tables})
+        save_model_config({
+            "model": self.model_name,
+            "dim": self.dim,
+            "version": self.version,
+            "tables": tables,
+        }, self.config_path)
+        self.config = load_model_config(self.config_path)
+        print(f"Active embedding model is now {self.model_name} ({self.dim} dims).")
+
+        # The new physical tables are written from SQLite by a full snapshot
+        LanceDBSync(self.db_name, self.lancedb_uri, self.config_path).sync(self.tables, maintain=False)
+        if not keep_previous:
+            db = lancedb.connect(self.lancedb_uri)
+            names = db.table_names()
+            for table_name, name in zip(self.tables, previous):
+                if tables[table_name] in names and name in names:
+                    db.drop_table(name)
+
+def reembed(model_name, tables=TABLES, batch_rows=REEMBED_BATCH_ROWS, switch=True,
+            keep_previous=False, embed_pool=False, force=False):
+    """
+    Re-embeds stored text with `model_name` and switches to it. Safe to re-run after an interruption.
+    """
+    if model_name == load_model_config()["model"] and not force:
+        print(f"{model_name} is already the active embedding model.")
+        return False
+    pool = None
+    if embed_pool:
+        pool = EmbeddingPool(loader=functools.partial(load_default_model, model_name)).start()
+    try:
+        return Reembedder(model_name, tables, batch_rows, pool=pool).run(switch, keep_previous)
+    finally:
+        if pool:
+            pool.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed stored text with a new model")
+    parser.add_argument("--model", required=True, help="sentence-transformers model name")
+    parser.add_argument("--table", choices=TABLES, action="append", help="Table(s) to re-embed (default: all)")
+    parser.add_argument("--batch-rows", type=int, default=REEMBED_BATCH_ROWS, help="Rows per batch")
+    parser.add_argument("--no-switch", action="store_true", help="Only stage vectors, keep the current model active")
+    parser.add_argument("--keep-previous", action="store_true", help="Keep the previous LanceDB tables after switching")
+    parser.add_argument("--embed-pool", action="store_true", help="Embed with a multi-process pool")
+    parser.add_argument("--force", action="store_true", help="Re-embed even if the model is already active")
+    args = parser.parse_args()
+
+    reembed(args.model, tuple(args.table or TABLES), args.batch_rows, not args.no_switch,
+            args.keep_previous, args.embed_pool, args.force)
+    get_budget().report()
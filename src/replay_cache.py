@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import hashlib
+
+CACHE_DIR = "data/scrape_cache"
+DEFAULT_TTL = 24 * 60 * 60 # seconds
+
+# record:  serve fresh entries from disk, revalidate/fetch stale or missing ones and store them
+# offline: serve everything from disk regardless of age, abort requests that were never recorded
+MODES = ("record", "offline")
+
+# Headers that no longer describe the body once Playwright has decoded it
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+def cache_key(method, url, post_data=None):
+    """
+    Key for a request: method + URL, plus a digest of the body for POSTs.
+    """
+    h = hashlib.sha256(f"{method.upper()} {url}".encode("utf-8"))
+    if post_data:
+        h.update(b"\0")
+        h.update(post_data if isinstance(post_data, bytes) else str(post_data).encode("utf-8"))
+    return h.hexdigest()
+
+class ReplayCache:
+    """
+    Record/replay layer for Playwright built on request routing.
+    Responses are stored on disk keyed by method and URL.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=DEFAULT_TTL, mode="record"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {MODES}")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.mode = mode
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "stored": 0,
+            "aborted": 0,
+            "errors": 0,
+            "bytes_from_cache": 0,
+            "bytes_from_network": 0,
+        }
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        folder = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(folder, f"{key}.json"), os.path.join(folder, f"{key}.body")
+
+    def load(self, key):
+        """
+        Returns (meta, body) for a cached entry, or (None, None).
+        """
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+            return meta, body
+        except (OSError, ValueError):
+            return None, None
+
+    def store(self, key, method, url, status, headers, body):
+        meta_path, body_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {
+            "method": method,
+            "url": url,
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS},
+            "stored_at": time.time(),
+        }
+        # Write body first and rename, so a crash never leaves meta without a body
+        tmp_body = body_path + ".tmp"
+        with open(tmp_body, "wb") as f:
+            f.write(body)
+        os.replace(tmp_body, body_path)
+        tmp_meta = meta_path + ".tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+        self.stats["stored"] += 1
+        return meta
+
+    def touch(self, key, meta):
+        meta_path, _ = self._paths(key)
+        meta["stored_at"] = time.time()
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def is_fresh(self, meta):
+        return time.time() - meta.get("stored_at", 0) < self.ttl
+
+    @staticmethod
+    def _validators(meta):
+        headers = {k.lower(): v for k, v in meta.get("headers", {}).items()}
+        validators = {}
+        if "etag" in headers:
+            validators["If-None-Match"] = headers["etag"]
+        if "last-modified" in headers:
+            validators["If-Modified-Since"] = headers["last-modified"]
+        return validators
+
+    async def _fulfill(self, route, meta, body):
+        self.stats["hits"] += 1
+        self.stats["bytes_from_cache"] += len(body)
+        await route.fulfill(status=meta["status"], headers=meta["headers"], body=body)
+
+    async def handle(self, route):
+        """
+        Route handler: serves from disk, revalidates stale entries, records misses.
+        """
+        request = route.request
+        method = request.method
+        url = request.url
+        key = cache_key(method, url, request.post_data_buffer)
+        meta, body = self.load(key)
+
+        if meta is not None and (self.mode == "offline" or self.is_fresh(meta)):
+            await self._fulfill(route, meta, body)
+            return
+
+        if self.mode == "offline":
+            self.stats["aborted"] += 1
+            await route.abort()
+            return
+
+        headers = dict(request.headers)
+        if meta is not None:
+            headers.update(self._validators(meta))
+
+        try:
+            response = await route.fetch(headers=headers)
+        except Exception as e:
+            self.stats["errors"] += 1
+            if meta is not None:
+                # Network failed: a stale copy is better than nothing
+                await self._fulfill(route, meta, body)
+            else:
+                print(f"Cache fetch failed for {url}: {e}")
+                await route.abort()
+            return
+
+        if response.status == 304 and meta is not None:
+            self.stats["revalidated"] += 1
+            self.touch(key, meta)
+            await self._fulfill(route, meta, body)
+            return
+
+        self.stats["misses"] += 1
+        new_body = await response.body()
+        self.stats["bytes_from_network"] += len(new_body)
+        if response.status < 400 and response.status != 206:
+            meta = self.store(key, method, url, response.status, response.headers, new_body)
+            await route.fulfill(status=meta["status"], headers=meta["headers"], body=new_body)
+        else:
+            await route.fulfill(response=response, body=new_body)
+
+    async def attach(self, context, pattern="**/*"):
+        """
+        Routes every request of a BrowserContext (or Page) through the cache.
+        """
+        await context.route(pattern, self.handle)
+
+    def summary(self):
+        s = self.stats
+        return (f"cache hits={s['hits']} misses={s['misses']} revalidated={s['revalidated']} "
+                f"aborted={s['aborted']} errors={s['errors']} "
+                f"cached={s['bytes_from_cache'] / 1e6:.1f}MB network={s['bytes_from_network'] / 1e6:.1f}MB")
@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+from .store import DB_NAME
+from .model_config import MODEL_CONFIG_PATH, load_model_config
+
+ROUTING_DIR = "data/routing_index"
+MANIFEST_NAME = "manifest.json"
+
+# Hazards searched per query, and phase partitions searched per hazard (None: all)
+FAN_OUT = 2
+PHASE_FAN_OUT = None
+RECALL_QUERIES = 100
+
+def _partition_file(hazard_type, phase):
+    key = f"{hazard_type}\x00{phase}".encode("utf-8")
+    return hashlib.sha1(key).hexdigest()[:16] + ".npz"
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def _top_k(scores, k):
+    """
+    Indices of the k highest scores, best first.
+    """
+    k = min(k, len(scores))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def partition_signatures(db_name=DB_NAME):
+    """
+    (count, max id, sum of ids) per (hazard_type, phase), read from the
+    facets index alone (no filter on embedding, which would need the table).
+    Any insert or delete in a partition changes its signature; rows without
+    embeddings are counted here and left out when the partition is loaded.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = conn.execute('''
+            SELECT hazard_type, phase, COUNT(*), MAX(id), TOTAL(id)
+            FROM structured_hazards
+            GROUP BY hazard_type, phase
+        ''').fetchall()
+    finally:
+        conn.close()
+    return {(h, p): [count, max_id, int(total)] for h, p, count, max_id, total in rows}
+
+def _load_partition(conn, hazard_type, phase, dim):
+    ids = []
+    blobs = []
+    cursor = conn.execute('''
+        SELECT id, embedding FROM structured_hazards
+        WHERE hazard_type IS ? AND phase IS ? AND embedding IS NOT NULL
+    ''', (hazard_type, phase))
+    for row_id, blob in cursor:
+        # Vectors of another model (mid re-embedding) are left out
+        if len(blob) == dim * 4:
+            ids.append(row_id)
+            blobs.append(blob)
+    vectors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(-1, dim)
+    return np.asarray(ids, dtype=np.int64), _normalize(vectors)
+
+class RoutingIndex:
+    """
+    Two-level routing over structured_hazards vectors. Each (hazard_type,
+    phase) partition keeps its normalized vectors in a block file and a
+    centroid; hazards get a centroid over their partitions. A query scores
+    hazard centroids, then the phase centroids of the best `fan_out`
+    hazards, and scans only the chosen blocks, so per-query work follows
+    partition size rather than corpus size.
+    """
+
+    def __init__(self, index_dir=ROUTING_DIR):
+        self.index_dir = index_dir
+        self.manifest = self._load_manifest()
+        self._blocks = {}
+        self._arrays()
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.index_dir, MANIFEST_NAME), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"model_version": None, "dim": None, "partitions": []}
+
+    def _arrays(self):
+        """
+        Centroid matrices for the current manifest.
+        """
+        partitions = self.manifest["partitions"]
+        self.hazards = sorted({p["hazard_type"] for p in partitions}, key=str)
+        dim = self.manifest["dim"] or 0
+        self.partition_centroids = np.asarray([p["centroid"] for p in partitions], dtype=np.float32).reshape(len(partitions), dim)
+        hazard_centroids = []
+        for hazard in self.hazards:
+            members = [i for i, p in enumerate(partitions) if p["hazard_type"] == hazard]
+            weights = np.asarray([partitions[i]["rows"] for i in members], dtype=np.float32)
+            hazard_centroids.append(weights @ self.partition_centroids[members])
+        self.hazard_centroids = _normalize(np.asarray(hazard_centroids, dtype=np.float32).reshape(len(self.hazards), dim))
+
+    def block(self, i):
+        """
+        (ids, vectors) of partition i, loaded on first use.
+        """
+        if i not in self._blocks:
+            path = os.path.join(self.index_dir, self.manifest["partitions"][i]["file"])
+            with np.load(path) as data:
+                self._blocks[i] = (data["ids"], data["vectors"])
+        return self._blocks[i]
+
+    def build(self, db_name=DB_NAME, config_path=MODEL_CONFIG_PATH, full=False):
+        """
+        Brings the index up to date with SQLite, rebuilding only partitions
+        whose rows changed (all of them after a model change or with `full`).
+        Returns {"rebuilt": n, "removed": n, "kept": n}.
+        """
+        config = load_model_config(config_path)
+        dim = config["dim"]
+        if self.manifest["model_version"] != config["version"] or self.manifest["dim"] != dim:
+            full = True
+        old = {} if full else {(p["hazard_type"], p["phase"]): p for p in self.manifest["partitions"]}
+        signatures = partition_signatures(db_name)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        partitions = []
+        rebuilt = 0
+        conn = sqlite3.connect(db_name)
+        try:
+            for (hazard_type, phase), signature in sorted(signatures.items(), key=lambda item: str(item[0])):
+                previous = old.get((hazard_type, phase))
+                if previous and previous["signature"] == signature:
+                    partitions.append(previous)
+                    continue
+                ids, vectors = _load_partition(conn, hazard_type, phase, dim)
+                if not len(ids):
+                    continue
+                name = _partition_file(hazard_type, phase)
+                tmp_path = os.path.join(self.index_dir, name + ".tmp.npz")
+                np.savez(tmp_path, ids=ids, vectors=vectors)
+                os.replace(tmp_path, os.path.join(self.index_dir, name))
+                partitions.append({
+                    "hazard_type": hazard_type,
+                    "phase": phase,
+                    "file": name,
+                    "rows": len(ids),
+                    "signature": signature,
+                    "centroid": _normalize(vectors.mean(axis=0)).tolist(),
+                })
+                rebuilt += 1
+        finally:
+            conn.close()
+
+        kept_files = {p["file"] for p in partitions}
+        removed = [p for p in self.manifest["partitions"] if p["file"] not in kept_files]
+        self.manifest = {"model_version": config["version"], "dim": dim, "partitions": partitions}
+        tmp_path = os.path.join(self.index_dir, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, MANIFEST_NAME))
+        for p in removed:
+            path = os.path.join(self.index_dir, p["file"])
+            if os.path.exists(path):
+                os.remove(path)
+
+        self._blocks = {}
+        self._arrays()
+        return {"rebuilt": rebuilt, "removed": len(removed), "kept": len(partitions) - rebuilt}
+
+    def route(self, query, fan_out=FAN_OUT, phase_fan_out=PHASE_FAN_OUT):
+        """
+        Indices of the partitions to search for a normalized query vector.
+        """
+        partitions = self.manifest["partitions"]
+        chosen = []
+        for h in _top_k(self.hazard_centroids @ query, fan_out):
+            members = [i for i, p in enumerate(partitions) if p["hazard_type"] == self.hazards[h]]
+            scores = self.partition_centroids[members] @ query
+            chosen.extend(members[j] for j in _top_k(scores, phase_fan_out or len(members)))
+        return chosen
+
+    def _scan(self, query, partition_ids, k):
+        best_ids = []
+        best_scores = []
+        for i in partition_ids:
+            ids, vectors = self.block(i)
+            scores = vectors @ query
+            top = _top_k(scores, k)
+            best_ids.append(ids[top])
+            best_scores.append(scores[top])
+        if not best_ids:
+            return []
+        ids = np.concatenate(best_ids)
+        scores = np.concatenate(best_scores)
+        top = _top_k(scores, k)
+        return [(int(ids[j]), float(scores[j])) for j in top]
+
+    def search(self, query, k=10, fan_out=FAN_OUT, phase_fan_out=PHASE_FAN_OUT):
+        """
+        Top-k (row id, cosine score) for `query`, searching only routed partitions.
+        """
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        return self._scan(query, self.route(query, fan_out, phase_fan_out), k)
+
+    def exhaustive_search(self, query, k=10):
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        return self._scan(query, range(len(self.manifest["partitions"])), k)
+
+    def recall(self, queries, k=10, fan_out=FAN_OUT, phase_fan_out=PHASE_FAN_OUT):
+        """
+        recall@k of routed search against exhaustive search, with mean latencies.
+        """
+        hits = 0
+        expected = 0
+        routed_seconds = 0.0
+        exhaustive_seconds = 0.0
+        for query in queries:
+            start = time.perf_counter()
+            routed = self.search(query, k, fan_out, phase_fan_out)
+            routed_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            exact = self.exhaustive_search(query, k)
+            exhaustive_seconds += time.perf_counter() - start
+            hits += len({i for i, _ in routed} & {i for i, _ in exact})
+            expected += len(exact)
+        n = max(1, len(queries))
+        return {
+            "queries": len(queries),
+            "k": k,
+            "fan_out": fan_out,
+            "phase_fan_out": phase_fan_out,
+            "recall": hits / expected if expected else None,
+            "routed_ms": routed_seconds / n * 1000,
+            "exhaustive_ms": exhaustive_seconds / n * 1000,
+        }
+
+    def rows(self):
+        return sum(p["rows"] for p in self.manifest["partitions"])
+
+    def sample_queries(self, n=RECALL_QUERIES, seed=0):
+        """
+        Stored vectors drawn across partitions, used as queries for recall checks.
+        """
+        rng = np.random.default_rng(seed)
+        partitions = self.manifest["partitions"]
+        if not partitions:
+            return []
+        weights = np.asarray([p["rows"] for p in partitions], dtype=np.float64)
+        queries = []
+        for i in rng.choice(len(partitions), size=n, p=weights / weights.sum()):
+            _, vectors = self.block(int(i))
+            queries.append(np.asarray(vectors[rng.integers(len(vectors))]))
+        return queries
+
+def update_routing_index(db_name=DB_NAME, index_dir=ROUTING_DIR, config_path=MODEL_CONFIG_PATH, full=False):
+    """
+    Incremental rebuild, run by the post-write hook after any SQLite writes.
+    """
+    result = RoutingIndex(index_dir).build(db_name, config_path, full=full)
+    if result["rebuilt"] or result["removed"]:
+        print(f"Routing index: rebuilt {result['rebuilt']} partition(s), removed {result['removed']}, "
+              f"kept {result['kept']}.")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hazard-routed vector index over structured_hazards")
+    parser.add_argument("command", choices=["build", "recall", "search"])
+    parser.add_argument("text", nargs="?", help="Query text for search")
+    parser.add_argument("--full", action="store_true", help="Rebuild every partition")
+    parser.add_argument("-k", type=int, default=10, help="Results per query")
+    parser.add_argument("--fan-out", type=int, default=FAN_OUT, help="Hazards searched per query")
+    parser.add_argument("--phase-fan-out", type=int, default=PHASE_FAN_OUT, help="Phase partitions searched per hazard")
+    parser.add_argument("--queries", type=int, default=RECALL_QUERIES, help="Sampled queries for recall")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        update_routing_index(full=args.full)
+        index = RoutingIndex()
+        print(f"{len(index.manifest['partitions'])} partitions over {len(index.hazards)} hazards, {index.rows()} rows.")
+    elif args.command == "recall":
+        index = RoutingIndex()
+        for fan_out in sorted({1, args.fan_out, len(index.hazards)}):
+            report = index.recall(index.sample_queries(args.queries), args.k, fan_out, args.phase_fan_out)
+            print(f"fan-out {fan_out}: recall@{args.k} {report['recall']:.3f}, "
+                  f"{report['routed_ms']:.2f} ms routed vs {report['exhaustive_ms']:.2f} ms exhaustive")
+    elif not args.text:
+        print("Error: search needs query text.")
+    else:
+        from .embed import generate_embedding
+        index = RoutingIndex()
+        results = index.search(generate_embedding(args.text), args.k, args.fan_out, args.phase_fan_out)
+        conn = sqlite3.connect(DB_NAME)
+        for row_id, score in results:
+            row = conn.execute("SELECT hazard_type, phase, topic, source_file, page_ref FROM structured_hazards WHERE id = ?",
+                               (row_id,)).fetchone()
+            print(f"{score:.3f}  {row}")
+        conn.close()
@@ -0,0 +1,106 @@
+import sqlite3
+import json
+import hashlib
+import datetime
+from .store import DB_NAME
+
+def init_checkpoints(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+
+    # One row per hazard: hashes of what was last stored for it
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_checkpoints (
+            hazard_url TEXT PRIMARY KEY,
+            hazard_name TEXT,
+            section_hashes TEXT,
+            pdf_hash TEXT,
+            run_id TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # A run is finished once every hazard was visited; unfinished runs are resumed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            run_id TEXT PRIMARY KEY,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+
+def hash_text(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def start_run(db_name=DB_NAME):
+    """
+    Resumes the last unfinished run, or starts a new one.
+    Returns (run_id, set of hazard URLs already completed in that run).
+    """
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT run_id FROM scrape_runs
+        WHERE finished_at IS NULL
+        ORDER BY started_at DESC LIMIT 1
+    ''')
+    row = cursor.fetchone()
+
+    if row:
+        run_id = row[0]
+        cursor.execute("SELECT hazard_url FROM scrape_checkpoints WHERE run_id = ?", (run_id,))
+        completed = {r[0] for r in cursor.fetchall()}
+    else:
+        run_id = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        cursor.execute("INSERT INTO scrape_runs (run_id) VALUES (?)", (run_id,))
+        completed = set()
+
+    conn.commit()
+    conn.close()
+    return run_id, completed
+
+def finish_run(run_id, db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    conn.execute("UPDATE scrape_runs SET finished_at = CURRENT_TIMESTAMP WHERE run_id = ?", (run_id,))
+    conn.commit()
+    conn.close()
+
+def get_checkpoint(hazard_url, db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM scrape_checkpoints WHERE hazard_url = ?", (hazard_url,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    checkpoint = dict(row)
+    checkpoint["section_hashes"] = json.loads(checkpoint["section_hashes"] or "{}")
+    return checkpoint
+
+def save_checkpoint(hazard_url, hazard_name, section_hashes, pdf_hash, run_id, db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    conn.execute('''
+        INSERT INTO scrape_checkpoints (hazard_url, hazard_name, section_hashes, pdf_hash, run_id, updated_at)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(hazard_url) DO UPDATE SET
+            hazard_name = excluded.hazard_name,
+            section_hashes = excluded.section_hashes,
+            pdf_hash = excluded.pdf_hash,
+            run_id = excluded.run_id,
+            updated_at = excluded.updated_at
+    ''', (hazard_url, hazard_name, json.dumps(section_hashes, sort_keys=True), pdf_hash, run_id))
+    conn.commit()
+    conn.close()
+
+def is_unchanged(checkpoint, section_hashes, pdf_hash):
+    if not checkpoint:
+        return False
+    return checkpoint["section_hashes"] == section_hashes and checkpoint["pdf_hash"] == pdf_hash
+
+def should_skip(checkpoint, section_hashes, pdf_hash, force=False):
+    """
+    A hazard is skipped when its content matches the checkpoint, unless `force` is set.
+    """
+    return not force and is_unchanged(checkpoint, section_hashes, pdf_hash)
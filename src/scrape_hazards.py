@@ -1,14 +1,28 @@
 import os
 import time
+import tempfile
 import requests
 from bs4 import BeautifulSoup
 from playwright.sync_api import sync_playwright
 from playwright.async_api import async_playwright
-from .store import save_document, init_db
-from .embed import generate_embedding
+from .store import replace_section_documents, init_db
+from .scrape_checkpoint import (
+    init_checkpoints, start_run, finish_run, get_checkpoint, save_checkpoint,
+    should_skip, hash_text
+)
+from .blob_store import init_blob_store, put_file, materialize, hash_file
+from .sections import (
+    init_sections, clean_sections, record_lines, learn_boilerplate, learned_boilerplate,
+    ACTIVE_PANEL_JS, BOILERPLATE_SAMPLE
+)
+from .embed import generate_embedding, section_embedding_text
+from .replay_cache import ReplayCache, DEFAULT_TTL
 
 # Ensure DB is initialized
 init_db()
+init_checkpoints()
+init_blob_store()
+init_sections()
 
 BASE_URL = "https://app.hazadapt.com"
 HAZARDS_URL = f"{BASE_URL}/hazards"
@@ -16,14 +30,17 @@ DATA_DIR = "data/raw"
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
-async def scrape_hazard(page, hazard_url, hazard_name):
-    print(f"Scraping {hazard_name} ({hazard_url})...")
+async def read_sections(page, hazard_url):
+    """
+    Raw text of each tab of a hazard page, and whether every tab panel was isolated.
+    """
     await page.goto(hazard_url)
     await page.wait_for_load_state("networkidle")
     
-    # Extract content from tabs
+    # Extract content from tabs: only the active tab panel, not the whole page
     sections = ["Prepare", "React", "Recover"]
-    full_text = ""
+    section_texts = {}
+    panel_scoped = True
     
     for section in sections:
         try:
@@ -33,20 +50,39 @@ async def scrape_hazard(page, hazard_url, hazard_name):
             await page.get_by_text(section, exact=True).click()
             await page.wait_for_timeout(1000) # Wait for content to render
             
-            # Extract text
-            # We assume content is in the main container. 
-            # A simple strategy is to get all text from the page after clicking the tab, 
-            # but that might be noisy. 
-            # Let's try to find the specific content container if possible.
-            # Based on subagent, content is in p tags.
-            content = await page.evaluate("() => document.body.innerText")
-            full_text += f"\n\n--- SECTION: {section} ---\n\n{content}"
+            panel = await page.evaluate(ACTIVE_PANEL_JS)
+            section_texts[section] = panel["text"]
+            panel_scoped = panel_scoped and panel["scope"] == "tabpanel"
             
         except Exception as e:
             print(f"Error scraping section {section}: {e}")
+    return section_texts, panel_scoped
+
+async def learn_page_chrome(page, hazard_urls):
+    """
+    Pre-pass: reads a fixed sample of hazards and freezes the lines they
+    share as page chrome, so every hazard (including the first ones stored)
+    is cleaned with the same set.
+    """
+    print(f"Learning page chrome from {len(hazard_urls)} hazards...")
+    for hazard_url in hazard_urls:
+        section_texts, _ = await read_sections(page, hazard_url)
+        record_lines(hazard_url, section_texts)
+    print(f"Learned {len(learn_boilerplate(hazard_urls))} chrome lines.")
+
+async def scrape_hazard(page, hazard_url, hazard_name, run_id=None, force=False):
+    """
+    Scrapes one hazard. Returns True if it was stored, False if unchanged since the last checkpoint.
+    """
+    print(f"Scraping {hazard_name} ({hazard_url})...")
+    section_texts, panel_scoped = await read_sections(page, hazard_url)
+
+    # Strip navigation, headers and footers repeated across tabs and hazards
+    section_texts = clean_sections(hazard_url, section_texts, panel_scoped)
 
     # Handle PDF Download
     pdf_path = None
+    pdf_hash = None
     try:
         print("Looking for PDF...")
         # Expect a download event
@@ -60,36 +96,72 @@ async def scrape_hazard(page, hazard_url, hazard_name):
         safe_name = hazard_name.lower().replace(" ", "_")
         pdf_filename = f"{safe_name}.pdf"
         pdf_path = os.path.join(DATA_DIR, pdf_filename)
-        await download.save_as(pdf_path)
-        print(f"Downloaded PDF to {pdf_path}")
+        # Store by content hash, then expose it under data/raw for process_pdfs.
+        # Unchanged PDFs keep the same blob (and mtime) and are not reprocessed.
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        await download.save_as(tmp_path)
+        pdf_hash, _ = put_file(tmp_path, ref=hazard_url + "#pdf", move=True)
+        if not (os.path.exists(pdf_path) and hash_file(pdf_path) == pdf_hash):
+            materialize(pdf_hash, pdf_path)
+            print(f"Downloaded PDF to {pdf_path}")
         
     except Exception as e:
         print(f"Could not download PDF for {hazard_name}: {e}")
 
-    # Save to LanceDB
-    # We use the full text as extracted_text
-    embedding = generate_embedding(full_text)
-    metadata = {
-        "original_url": hazard_url,
-        "pdf_path": pdf_path if pdf_path else ""
-    }
+    # Hashes cover the cleaned text, so a hazard is re-stored once newly detected chrome is stripped
+    section_hashes = {section: hash_text(content) for section, content in section_texts.items()}
+    checkpoint = get_checkpoint(hazard_url)
+
+    if should_skip(checkpoint, section_hashes, pdf_hash, force):
+        print(f"{hazard_name} unchanged since last scrape, skipping.")
+        save_checkpoint(hazard_url, hazard_name, section_hashes, pdf_hash, run_id)
+        return False
+
+    # One record per section, so each embedding covers a single phase
+    records = []
+    for section, content in section_texts.items():
+        embedding = generate_embedding(section_embedding_text(hazard_name, section, content))
+        metadata = {
+            "original_url": hazard_url,
+            "hazard_type": hazard_name,
+            "phase": section,
+            "pdf_path": pdf_path if pdf_path else "",
+            "pdf_hash": pdf_hash or ""
+        }
+        records.append((section, "text/html+section", content, embedding, metadata))
     
-    save_document(
-        source_url=hazard_url,
-        content_type="text/html+scraped",
-        extracted_text=full_text,
-        embedding=embedding,
-        metadata=metadata
-    )
-    print(f"Saved {hazard_name} to LanceDB.")
+    # Replace the previous rows for this hazard instead of appending duplicates
+    replace_section_documents(hazard_url, records)
+    save_checkpoint(hazard_url, hazard_name, section_hashes, pdf_hash, run_id)
+    print(f"Saved {len(records)} sections of {hazard_name} to SQLite.")
+    return True
 
 import argparse
 import asyncio
 
-async def scrape_hazards_async(limit=None):
+async def scrape_hazards_async(limit=None, cache_dir=None, cache_mode="record", cache_ttl=DEFAULT_TTL, force=False,
+                               relearn_chrome=False):
+    """
+    Scrapes all hazards. With `cache_dir`, every request goes through a
+    ReplayCache so repeated runs hit disk (cache_mode="offline" never touches the network).
+    Hazards unchanged since their checkpoint are skipped, and an interrupted
+    run resumes after the last completed hazard unless `force` is set.
+    Page chrome is learned once from a sample of hazards before any is
+    stored; `relearn_chrome` learns it again (changed hazards are re-stored).
+    """
+    run_id, completed = start_run()
+    if completed and not force:
+        print(f"Resuming scrape run {run_id}: {len(completed)} hazards already done.")
+    start = time.perf_counter()
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+        context = await browser.new_context(accept_downloads=True)
+        cache = None
+        if cache_dir:
+            cache = ReplayCache(cache_dir, ttl=cache_ttl, mode=cache_mode)
+            await cache.attach(context)
+        page = await context.new_page()
         
         print(f"Navigating to {HAZARDS_URL}...")
         await page.goto(HAZARDS_URL)
@@ -114,10 +186,18 @@ async def scrape_hazards_async(limit=None):
         unique_links = {link['href']: link['text'] for link in links}
         
         print(f"Found {len(unique_links)} hazards.")
+        if relearn_chrome or learned_boilerplate() is None:
+            await learn_page_chrome(page, list(unique_links)[:BOILERPLATE_SAMPLE])
         
         count = 0
+        changed = 0
+        finished = True
         for href, text in unique_links.items():
+            if href in completed and not force:
+                continue
+
             if limit and count >= limit:
+                finished = False
                 break
                 
             # Clean text
@@ -125,16 +205,31 @@ async def scrape_hazards_async(limit=None):
             if not name:
                 name = href.split('/')[-1]
                 
-            await scrape_hazard(page, href, name)
+            if await scrape_hazard(page, href, name, run_id=run_id, force=force):
+                changed += 1
             count += 1
             
         await browser.close()
 
-def scrape_hazards(limit=None):
-    asyncio.run(scrape_hazards_async(limit))
+    # Limited runs stay open so the next run resumes where this one stopped
+    if finished:
+        finish_run(run_id)
+
+    print(f"Scraped {count} hazards ({changed} changed) in {time.perf_counter() - start:.1f}s")
+    if cache:
+        print(cache.summary())
+
+def scrape_hazards(limit=None, cache_dir=None, cache_mode="record", cache_ttl=DEFAULT_TTL, force=False, relearn_chrome=False):
+    asyncio.run(scrape_hazards_async(limit, cache_dir, cache_mode, cache_ttl, force, relearn_chrome))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Scrape Hazadapt Hazards")
     parser.add_argument("--limit", type=int, default=None, help="Limit number of hazards to scrape")
+    parser.add_argument("--cache-dir", help="Record/replay HTTP cache directory")
+    parser.add_argument("--offline", action="store_true", help="Replay from the cache only")
+    parser.add_argument("--cache-ttl", type=int, default=DEFAULT_TTL, help="Cache TTL in seconds")
+    parser.add_argument("--force", action="store_true", help="Re-store every hazard, ignoring checkpoints")
+    parser.add_argument("--relearn-chrome", action="store_true", help="Learn repeated page chrome again from a sample of hazards")
     args = parser.parse_args()
-    scrape_hazards(args.limit)
+    scrape_hazards(args.limit, args.cache_dir, "offline" if args.offline else "record", args.cache_ttl, args.force,
+                   args.relearn_chrome)
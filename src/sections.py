@@ -0,0 +1,173 @@
+import re
+import json
+import sqlite3
+import hashlib
+from .store import DB_NAME
+
+# Text of the visible tab panel only, as {scope, text}. Falls back to <main>,
+# then <body>, when the page has no ARIA tab panels.
+ACTIVE_PANEL_JS = '''() => {
+    const visible = el => el && !el.hidden && el.offsetParent !== null && el.innerText.trim() !== '';
+    const panels = Array.from(document.querySelectorAll('[role="tabpanel"]')).filter(visible);
+    if (panels.length) {
+        return {scope: 'tabpanel', text: panels.map(p => p.innerText).join('\\n')};
+    }
+    const main = document.querySelector('main');
+    if (visible(main)) {
+        return {scope: 'main', text: main.innerText};
+    }
+    return {scope: 'body', text: document.body.innerText};
+}'''
+
+# A line is page chrome once it shows up in at least this many hazards
+# and in this fraction of the sampled hazards
+BOILERPLATE_MIN_HAZARDS = 5
+BOILERPLATE_RATIO = 0.6
+# Hazards read (not stored) in the pre-pass that learns page chrome
+BOILERPLATE_SAMPLE = 8
+# Longer lines are real content even when repeated (e.g. shared safety advice)
+BOILERPLATE_MAX_CHARS = 120
+
+def init_sections(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+
+    # Which normalized lines appeared on which hazard, to find cross-hazard chrome
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_lines (
+            line_hash TEXT,
+            hazard_url TEXT,
+            line TEXT,
+            PRIMARY KEY (line_hash, hazard_url)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_scrape_lines_hazard
+        ON scrape_lines (hazard_url)
+    ''')
+
+    # The learned chrome set is frozen between runs, so cleaned text (and the
+    # section hashes checkpoints compare) does not drift as hazards are added
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_boilerplate (
+            line_hash TEXT PRIMARY KEY,
+            line TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_boilerplate_learned (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            hazards INTEGER,
+            learned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+
+def normalize_line(line):
+    return re.sub(r"\s+", " ", line).strip()
+
+def line_hash(line):
+    return hashlib.sha1(normalize_line(line).lower().encode("utf-8")).hexdigest()
+
+def split_lines(text):
+    return [normalize_line(line) for line in (text or "").splitlines() if normalize_line(line)]
+
+def shared_lines(section_texts):
+    """
+    Hashes of lines present in every section of one hazard. When the tab panel
+    could not be isolated, these are the navigation, header and footer.
+    """
+    texts = [t for t in section_texts.values() if t]
+    if len(texts) < 2:
+        return set()
+    sets = [{line_hash(line) for line in split_lines(t)} for t in texts]
+    return set.intersection(*sets)
+
+def record_lines(hazard_url, section_texts, db_name=DB_NAME):
+    """
+    Replaces the set of short lines seen on this hazard.
+    """
+    lines = {}
+    for text in section_texts.values():
+        for line in split_lines(text):
+            if len(line) <= BOILERPLATE_MAX_CHARS:
+                lines[line_hash(line)] = line
+
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute("DELETE FROM scrape_lines WHERE hazard_url = ?", (hazard_url,))
+        conn.executemany(
+            "INSERT INTO scrape_lines (line_hash, hazard_url, line) VALUES (?, ?, ?)",
+            [(h, hazard_url, line) for h, line in lines.items()]
+        )
+    conn.close()
+
+def boilerplate_lines(hazard_urls, min_hazards=BOILERPLATE_MIN_HAZARDS, ratio=BOILERPLATE_RATIO, db_name=DB_NAME):
+    """
+    Hashes of lines repeated across enough of `hazard_urls` to count as page chrome.
+    """
+    conn = sqlite3.connect(db_name)
+    sample = json.dumps(sorted(hazard_urls))
+    total = conn.execute('''
+        SELECT COUNT(DISTINCT hazard_url) FROM scrape_lines
+        WHERE hazard_url IN (SELECT value FROM json_each(?))
+    ''', (sample,)).fetchone()[0]
+    threshold = max(min_hazards, total * ratio)
+    rows = conn.execute('''
+        SELECT line_hash FROM scrape_lines
+        WHERE hazard_url IN (SELECT value FROM json_each(?))
+        GROUP BY line_hash HAVING COUNT(*) >= ?
+    ''', (sample, threshold)).fetchall()
+    conn.close()
+    return {row[0] for row in rows}, total
+
+def learn_boilerplate(hazard_urls, db_name=DB_NAME):
+    """
+    Freezes the chrome set from the lines recorded for `hazard_urls` (the
+    pre-pass sample), ignoring hazards recorded by earlier scrapes.
+    Returns the set of line hashes.
+    """
+    drop, hazards = boilerplate_lines(hazard_urls, db_name=db_name)
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute("DELETE FROM scrape_boilerplate")
+        conn.execute('''
+            INSERT INTO scrape_boilerplate (line_hash, line)
+            SELECT line_hash, MIN(line) FROM scrape_lines WHERE line_hash IN (SELECT value FROM json_each(?))
+            GROUP BY line_hash
+        ''', (json.dumps(sorted(drop)),))
+        conn.execute("INSERT OR REPLACE INTO scrape_boilerplate_learned (id, hazards) VALUES (1, ?)", (hazards,))
+    conn.close()
+    return drop
+
+def learned_boilerplate(db_name=DB_NAME):
+    """
+    The frozen chrome set, or None if it was never learned.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        if not conn.execute("SELECT 1 FROM scrape_boilerplate_learned").fetchone():
+            return None
+        return {row[0] for row in conn.execute("SELECT line_hash FROM scrape_boilerplate")}
+    finally:
+        conn.close()
+
+def clean_sections(hazard_url, section_texts, panel_scoped=True, db_name=DB_NAME):
+    """
+    Records this hazard's lines, then strips the learned chrome lines and,
+    when the tab panel could not be isolated, lines shared by all of its
+    tabs. Returns {section: cleaned text}, dropping empty sections.
+    """
+    record_lines(hazard_url, section_texts, db_name)
+    drop = set(learned_boilerplate(db_name) or ())
+    if not panel_scoped:
+        drop |= shared_lines(section_texts)
+
+    cleaned = {}
+    for section, text in section_texts.items():
+        kept = [line for line in split_lines(text) if line_hash(line) not in drop]
+        if kept:
+            cleaned[section] = "\n".join(kept)
+    return cleaned
@@ -2,11 +2,12 @@ import sqlite3
 import json
 import numpy as np
 import os
+from urllib.parse import urlparse
 
 DB_NAME = "data/hazards.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+def init_db(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
     cursor = conn.cursor()
     
     # Create tables if they don't exist
@@ -40,7 +41,103 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
+
+    # Secondary indexes for faceted queries and per-file lookups
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_documents_source_url
+        ON documents (source_url)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_structured_hazards_facets
+        ON structured_hazards (hazard_type, phase, audience)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_structured_hazards_source
+        ON structured_hazards (source_file, page_ref)
+    ''')
+
+    # Sources and action items repeat across thousands of pages: each is stored
+    # once and pages link to it. structured_hazards.action_items/sources stay
+    # NULL for linked pages (older rows may still hold inline JSON).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sources (
+            id INTEGER PRIMARY KEY,
+            url TEXT UNIQUE NOT NULL,
+            domain TEXT,
+            domain_rev TEXT,
+            title TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS action_items (
+            id INTEGER PRIMARY KEY,
+            text TEXT UNIQUE NOT NULL
+        )
+    ''')
+    # title is only set when the page names the source differently
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS page_sources (
+            page_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            title TEXT,
+            PRIMARY KEY (page_id, position)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS page_action_items (
+            page_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            action_item_id INTEGER NOT NULL,
+            PRIMARY KEY (page_id, position)
+        ) WITHOUT ROWID
+    ''')
+    # Reverse lookups: pages citing a source (or domain), pages sharing an action item
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sources_domain_rev
+        ON sources (domain_rev)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_page_sources_source
+        ON page_sources (source_id, page_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_page_action_items_item
+        ON page_action_items (action_item_id, page_id)
+    ''')
+
+    # Change log replayed into LanceDB by sync_lancedb ('U' upsert, 'D' delete)
+    # and read by export_delta. Embedding-only updates are left out: reembed
+    # rebuilds LanceDB tables itself and a model change rebases delta exports.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lancedb_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lancedb_changes_table
+        ON lancedb_changes (table_name, seq)
+    ''')
+    synced_columns = {
+        "documents": "source_url, content_type, extracted_text, metadata",
+        "structured_hazards": "hazard_type, phase, audience, topic, content_raw, source_file, page_ref, last_updated",
+    }
+    triggers = [(table, event, row, op) for table in synced_columns
+                for event, row, op in (("INSERT", "NEW", "U"), (f"UPDATE OF {synced_columns[table]}", "NEW", "U"), ("DELETE", "OLD", "D"))]
+    for table, event, row, op in triggers:
+        name = f"{table}_cdc_{event.split()[0].lower()}"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO lancedb_changes (table_name, row_id, op, changed_at)
+                VALUES ('{table}', {row}.id, '{op}', CURRENT_TIMESTAMP);
+            END
+        ''')
+
     conn.commit()
     conn.close()
 
@@ -59,40 +156,237 @@ def save_document(source_url, content_type, extracted_text, embedding, metadata)
     conn.commit()
     conn.close()
 
-def save_structured_document(data, embedding):
-    conn = sqlite3.connect(DB_NAME)
+def upsert_document(source_url, content_type, extracted_text, embedding, metadata, db_name=DB_NAME):
+    """
+    Replaces any existing rows for source_url with a single new row.
+    """
+    conn = sqlite3.connect(db_name)
     cursor = conn.cursor()
-    
-    # Serialize embedding
-    embedding_blob = None
-    if embedding is not None:
-        if isinstance(embedding, np.ndarray):
-            embedding_blob = embedding.tobytes()
-        else:
-             # Assume list
-             embedding_blob = np.array(embedding, dtype=np.float32).tobytes()
 
-    cursor.execute('''
-        INSERT INTO structured_hazards (
-            hazard_type, phase, audience, topic, content_raw, 
-            action_items, sources, source_file, page_ref, last_updated, embedding
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        data.get('hazard_type'),
-        data.get('phase'),
-        data.get('audience'),
-        data.get('topic'),
-        data.get('content_raw'),
-        json.dumps(data.get('action_items', [])),
-        json.dumps(data.get('sources', [])),
-        data.get('source_file'),
-        data.get('page_ref'),
-        data.get('last_updated'),
-        embedding_blob
-    ))
-    
-    conn.commit()
+    embedding_blob = np.array(embedding, dtype=np.float32).tobytes()
+
+    with conn:
+        cursor.execute('DELETE FROM documents WHERE source_url = ?', (source_url,))
+        cursor.execute('''
+            INSERT INTO documents (source_url, content_type, extracted_text, embedding, metadata)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (source_url, content_type, extracted_text, embedding_blob, json.dumps(metadata)))
+
+    conn.close()
+
+def replace_section_documents(page_url, sections, db_name=DB_NAME):
+    """
+    Replaces every row stored for a page (the page itself and its
+    "<page_url>#<section>" rows) with one row per section.
+    `sections` is a list of (section, content_type, text, embedding, metadata).
+    """
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    prefix = page_url + "#"
+
+    with conn:
+        # Range on the source_url index: "#" sorts right before "$"
+        cursor.execute('''
+            DELETE FROM documents WHERE source_url = ? OR (source_url > ? AND source_url < ?)
+        ''', (page_url, prefix, page_url + "$"))
+        cursor.executemany('''
+            INSERT INTO documents (source_url, content_type, extracted_text, embedding, metadata)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (prefix + section.lower(), content_type, text,
+             np.array(embedding, dtype=np.float32).tobytes(), json.dumps(metadata))
+            for section, content_type, text, embedding, metadata in sections
+        ])
+
+    conn.close()
+
+def source_domain(url):
+    """
+    Host of a source URL without "www.", e.g. "ready.gov".
+    """
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def reverse_domain(domain):
+    # "www.fema.ready.gov" sorts under "gov.ready": subdomains become an index range
+    return ".".join(reversed(domain.split(".")))
+
+def _chunks(items, size=500):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def save_links(conn, page_links):
+    """
+    Links pages to deduplicated sources and action items, in bulk.
+    `page_links` is a list of (page_id, action_items, sources) with the
+    lists produced by extract_metadata. Runs inside the caller's transaction.
+    """
+    texts = set()
+    urls = {}
+    for _, action_items, sources in page_links:
+        texts.update(action_items)
+        for source in sources:
+            urls.setdefault(source["url"], source.get("title"))
+
+    conn.executemany('INSERT OR IGNORE INTO action_items (text) VALUES (?)', [(text,) for text in texts])
+    conn.executemany('''
+        INSERT OR IGNORE INTO sources (url, domain, domain_rev, title) VALUES (?, ?, ?, ?)
+    ''', [(url, source_domain(url), reverse_domain(source_domain(url)), title) for url, title in urls.items()])
+
+    item_ids = {}
+    for chunk in _chunks(texts):
+        item_ids.update(conn.execute(
+            f"SELECT text, id FROM action_items WHERE text IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall())
+    source_ids = {}
+    for chunk in _chunks(urls):
+        for url, source_id, title in conn.execute(
+            f"SELECT url, id, title FROM sources WHERE url IN ({', '.join('?' * len(chunk))})", chunk
+        ):
+            source_ids[url] = (source_id, title)
+
+    conn.executemany('INSERT INTO page_action_items (page_id, position, action_item_id) VALUES (?, ?, ?)', [
+        (page_id, position, item_ids[text])
+        for page_id, action_items, _ in page_links
+        for position, text in enumerate(action_items)
+    ])
+    rows = []
+    for page_id, _, sources in page_links:
+        for position, source in enumerate(sources):
+            source_id, title = source_ids[source["url"]]
+            rows.append((page_id, position, source_id, None if source.get("title") == title else source.get("title")))
+    conn.executemany('INSERT INTO page_sources (page_id, position, source_id, title) VALUES (?, ?, ?, ?)', rows)
+
+def delete_links(conn, where, params):
+    """
+    Removes the links of pages selected by a structured_hazards WHERE clause.
+    """
+    for table in ("page_sources", "page_action_items"):
+        conn.execute(f"DELETE FROM {table} WHERE page_id IN (SELECT id FROM structured_hazards WHERE {where})", params)
+
+def load_links(conn, page_ids):
+    """
+    Returns {page_id: {"action_items": [...], "sources": [...]}} in the
+    shape extract_metadata produced them.
+    """
+    links = {page_id: {"action_items": [], "sources": []} for page_id in page_ids}
+    for chunk in _chunks(links):
+        marks = ", ".join("?" * len(chunk))
+        for page_id, text in conn.execute(f'''
+            SELECT l.page_id, a.text FROM page_action_items l JOIN action_items a ON a.id = l.action_item_id
+            WHERE l.page_id IN ({marks}) ORDER BY l.page_id, l.position
+        ''', chunk):
+            links[page_id]["action_items"].append(text)
+        for page_id, url, title in conn.execute(f'''
+            SELECT l.page_id, s.url, COALESCE(l.title, s.title) FROM page_sources l JOIN sources s ON s.id = l.source_id
+            WHERE l.page_id IN ({marks}) ORDER BY l.page_id, l.position
+        ''', chunk):
+            links[page_id]["sources"].append({"title": title, "url": url})
+    return links
+
+def fill_link_columns(conn, rows):
+    """
+    Fills NULL action_items/sources of structured_hazards row dicts (which
+    must include "id") with JSON rebuilt from the link tables.
+    """
+    fields = [f for f in ("action_items", "sources") if rows and f in rows[0]]
+    missing = [row["id"] for row in rows if any(row[f] is None for f in fields)]
+    if not missing:
+        return rows
+    links = load_links(conn, missing)
+    for row in rows:
+        page = links.get(row["id"])
+        if page:
+            for field in fields:
+                if row[field] is None:
+                    row[field] = json.dumps(page[field])
+    return rows
+
+def save_structured_document(data, embedding, db_name=DB_NAME):
+    save_structured_documents([data], [embedding], db_name=db_name)
+
+def save_structured_documents(records, embeddings, db_name=DB_NAME):
+    """
+    Bulk insert of structured records in one transaction, with their action
+    items and sources stored once in the shared link tables.
+    """
+    rows = []
+    for data, embedding in zip(records, embeddings):
+        embedding_blob = None
+        if embedding is not None:
+            embedding_blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        rows.append((
+            data.get('hazard_type'),
+            data.get('phase'),
+            data.get('audience'),
+            data.get('topic'),
+            data.get('content_raw'),
+            data.get('source_file'),
+            data.get('page_ref'),
+            data.get('last_updated'),
+            embedding_blob
+        ))
+
+    conn = sqlite3.connect(db_name)
+    with conn:
+        page_links = []
+        for data, row in zip(records, rows):
+            cursor = conn.execute('''
+                INSERT INTO structured_hazards (
+                    hazard_type, phase, audience, topic, content_raw,
+                    source_file, page_ref, last_updated, embedding
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            page_links.append((cursor.lastrowid, data.get('action_items') or [], data.get('sources') or []))
+        save_links(conn, page_links)
+    conn.close()
+
+def delete_structured_by_source(source_file, db_name=DB_NAME):
+    """
+    Removes all page rows previously saved for a source file.
+    """
+    conn = sqlite3.connect(db_name)
+    with conn:
+        delete_links(conn, "source_file = ?", (source_file,))
+        cursor = conn.execute('DELETE FROM structured_hazards WHERE source_file = ?', (source_file,))
+    conn.close()
+    return cursor.rowcount
+
+def normalize_links(db_name=DB_NAME, batch_rows=1000):
+    """
+    Moves inline action_items/sources JSON of older rows into the link
+    tables, and drops sources and action items no page links to any more.
+    Returns the number of rows migrated.
+    """
+    conn = sqlite3.connect(db_name)
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, action_items, sources FROM structured_hazards
+            WHERE id > ? AND (action_items IS NOT NULL OR sources IS NOT NULL)
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_rows)).fetchall()
+        if not rows:
+            break
+        with conn:
+            ids = [row[0] for row in rows]
+            marks = ", ".join("?" * len(ids))
+            # Rows are migrated whole, replacing any partial links
+            conn.execute(f"DELETE FROM page_sources WHERE page_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM page_action_items WHERE page_id IN ({marks})", ids)
+            save_links(conn, [(page_id, json.loads(items or "[]"), json.loads(sources or "[]"))
+                              for page_id, items, sources in rows])
+            conn.execute(f"UPDATE structured_hazards SET action_items = NULL, sources = NULL WHERE id IN ({marks})", ids)
+        migrated += len(rows)
+        last_id = rows[-1][0]
+
+    with conn:
+        conn.execute("DELETE FROM sources WHERE id NOT IN (SELECT source_id FROM page_sources)")
+        conn.execute("DELETE FROM action_items WHERE id NOT IN (SELECT action_item_id FROM page_action_items)")
     conn.close()
+    return migrated
 
 def get_all_documents():
     conn = sqlite3.connect(DB_NAME)
@@ -1,31 +1,60 @@
 import lancedb
 import pyarrow as pa
 import numpy as np
-import json
 import os
+import time
+from datetime import timedelta
+from .model_config import load_model_config, lancedb_table
 
 LANCEDB_URI = "data/lancedb_data"
 
-def init_db():
-    os.makedirs(LANCEDB_URI, exist_ok=True)
-    db = lancedb.connect(LANCEDB_URI)
-    
-    # Define schema
-    schema = pa.schema([
-        pa.field("source_url", pa.string()),
-        pa.field("content_type", pa.string()),
-        pa.field("extracted_text", pa.string()),
-        pa.field("vector", pa.list_(pa.float32(), 384)), # Assuming 384 dim
-        pa.field("metadata", pa.string()) # JSON string
-    ])
-    
-    try:
-        db.create_table("documents", schema=schema, exist_ok=True)
-    except Exception as e:
-        print(f"Table documents might already exist: {e}")
+# Scalar indexes kept on each table. BITMAP suits low-cardinality columns,
+# BTREE suits columns with many distinct values.
+SCALAR_INDEXES = {
+    "documents": {
+        "id": "BTREE",
+        "source_url": "BTREE",
+        "content_type": "BITMAP",
+    },
+    "structured_hazards": {
+        "id": "BTREE",
+        "hazard_type": "BITMAP",
+        "phase": "BITMAP",
+        "audience": "BITMAP",
+        "source_file": "BTREE",
+    },
+}
+
+# Run maintenance automatically once a table has this many fragments
+MAINTAIN_FRAGMENT_THRESHOLD = 64
+# Versions older than this are pruned during maintenance
+CLEANUP_OLDER_THAN = timedelta(days=7)
+
+def open_table(db, name):
+    """
+    Opens the physical table currently serving logical table `name`
+    (a re-embedding pass switches it to a new versioned table).
+    """
+    return db.open_table(lancedb_table(name))
+
+def table_schema(table_name, dim):
+    """
+    Arrow schema of a LanceDB table. `id` is the SQLite row id, which
+    sync_lancedb uses to apply updates and deletes.
+    """
+    if table_name == "documents":
+        return pa.schema([
+            pa.field("id", pa.int64()),
+            pa.field("source_url", pa.string()),
+            pa.field("content_type", pa.string()),
+            pa.field("extracted_text", pa.string()),
+            pa.field("vector", pa.list_(pa.float32(), dim)), # Dimension of the active model
+            pa.field("metadata", pa.string()) # JSON string
+        ])
 
     # New Granular Schema
-    structured_schema = pa.schema([
+    return pa.schema([
+        pa.field("id", pa.int64()),
         pa.field("hazard_type", pa.string()),
         pa.field("phase", pa.string()),
         pa.field("audience", pa.string()),
@@ -36,61 +65,149 @@ def init_db():
         pa.field("source_file", pa.string()),
         pa.field("page_ref", pa.int32()),
         pa.field("last_updated", pa.string()),
-        pa.field("vector", pa.list_(pa.float32(), 384))
+        pa.field("vector", pa.list_(pa.float32(), dim))
     ])
 
-    try:
-        db.create_table("structured_hazards", schema=structured_schema, exist_ok=True)
-    except Exception as e:
-        print(f"Table structured_hazards might already exist: {e}")
-
-def save_document(source_url, content_type, extracted_text, embedding, metadata):
-    db = lancedb.connect(LANCEDB_URI)
-    table_name = "documents"
-    
-    tbl = db.open_table(table_name)
-    
-    data = [{
-        "source_url": source_url,
-        "content_type": content_type,
-        "extracted_text": extracted_text,
-        "vector": embedding,
-        "metadata": json.dumps(metadata)
-    }]
-    
-    tbl.add(data)
-
-def save_structured_document(data, embedding):
+def init_db():
+    os.makedirs(LANCEDB_URI, exist_ok=True)
     db = lancedb.connect(LANCEDB_URI)
-    
-    if embedding is not None:
-        if isinstance(embedding, np.ndarray):
-            embedding = embedding.tolist()
-    
-    # Ensure data matches schema
-    record = {
-        "hazard_type": data.get('hazard_type', ''),
-        "phase": data.get('phase', 'Prepare'),
-        "audience": data.get('audience', 'General'),
-        "topic": data.get('topic', ''),
-        "content_raw": data.get('content_raw', ''),
-        "action_items": json.dumps(data.get('action_items', [])),
-        "sources": json.dumps(data.get('sources', [])),
-        "source_file": data.get('source_file', ''),
-        "page_ref": int(data.get('page_ref', 0)),
-        "last_updated": data.get('last_updated', ''),
-        "vector": embedding
-    }
-    
-    try:
-        tbl = db.open_table("structured_hazards")
-        tbl.add([record])
-    except Exception as e:
-        print(f"Error saving to LanceDB: {e}")
-    tbl = db.open_table("documents")
-    return tbl.to_pandas()
+    dim = load_model_config()["dim"]
+
+    for table_name in ("documents", "structured_hazards"):
+        try:
+            db.create_table(lancedb_table(table_name), schema=table_schema(table_name, dim), exist_ok=True)
+        except Exception as e:
+            print(f"Table {table_name} might already exist: {e}")
 
 def get_all_documents():
     db = lancedb.connect(LANCEDB_URI)
-    tbl = db.open_table("documents")
+    tbl = open_table(db, "documents")
     return tbl.to_pandas()
+
+def count_fragments(tbl):
+    """
+    Returns the number of fragments in the current version of a table.
+    Uses pylance when available, otherwise derives fragment ids from row
+    addresses (fragment id in the upper 32 bits), so files of versions that
+    have not been pruned yet are not counted.
+    """
+    try:
+        return len(tbl.to_lance().get_fragments())
+    except Exception:
+        row_ids = tbl.search().select([]).with_row_id(True).limit(None).to_arrow()["_rowid"].to_numpy()
+        return len(np.unique(row_ids >> 32))
+
+def time_filtered_scans(tbl, columns):
+    """
+    Times a filtered count on each indexed column, using a value sampled from the table.
+    Returns {column: seconds}.
+    """
+    timings = {}
+    sample = tbl.search().select(columns).limit(1).to_list()
+    if not sample:
+        return timings
+
+    for col in columns:
+        value = sample[0].get(col)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = "'" + value.replace("'", "''") + "'"
+        start = time.perf_counter()
+        tbl.count_rows(f"{col} = {value}")
+        timings[col] = time.perf_counter() - start
+    return timings
+
+def ensure_scalar_indexes(tbl, indexes):
+    """
+    Builds missing scalar indexes. Existing ones are refreshed by optimize().
+    """
+    existing = set()
+    for idx in tbl.list_indices():
+        existing.update(idx.columns)
+
+    for col, index_type in indexes.items():
+        if col in existing:
+            continue
+        try:
+            tbl.create_scalar_index(col, index_type=index_type, replace=True)
+            print(f"  Created {index_type} index on {tbl.name}.{col}")
+        except Exception as e:
+            print(f"  Could not index {tbl.name}.{col}: {e}")
+
+def maintain_table(db, table_name, cleanup_older_than=CLEANUP_OLDER_THAN):
+    """
+    Compacts fragments, prunes old versions and builds/refreshes scalar indexes.
+    Returns a report dict with before/after fragment counts and scan timings.
+    """
+    tbl = open_table(db, table_name)
+    indexes = SCALAR_INDEXES.get(table_name, {})
+    columns = list(indexes)
+
+    report = {
+        "table": table_name,
+        "rows": tbl.count_rows(),
+        "fragments_before": count_fragments(tbl),
+        "scan_seconds_before": time_filtered_scans(tbl, columns),
+    }
+
+    if report["rows"] > 0:
+        ensure_scalar_indexes(tbl, indexes)
+
+    # optimize() compacts files, cleans up old versions and folds new rows into indexes
+    tbl.optimize(cleanup_older_than=cleanup_older_than)
+
+    report["fragments_after"] = count_fragments(tbl)
+    report["scan_seconds_after"] = time_filtered_scans(tbl, columns)
+    report["version"] = tbl.version
+    return report
+
+def print_maintenance_report(report):
+    print(f"  {report['table']}: {report['rows']} rows, "
+          f"fragments {report['fragments_before']} -> {report['fragments_after']}")
+    for col, before in report["scan_seconds_before"].items():
+        after = report["scan_seconds_after"].get(col)
+        if after is not None:
+            print(f"    {col}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+
+def maintain(tables=None, cleanup_older_than=CLEANUP_OLDER_THAN, lancedb_uri=LANCEDB_URI):
+    """
+    Runs maintenance on the given tables (default: all known tables).
+    """
+    db = lancedb.connect(lancedb_uri)
+    existing = db.table_names()
+    reports = []
+
+    print("Maintaining LanceDB tables...")
+    for table_name in tables or list(SCALAR_INDEXES):
+        if lancedb_table(table_name) not in existing:
+            continue
+        try:
+            report = maintain_table(db, table_name, cleanup_older_than)
+        except Exception as e:
+            print(f"  Error maintaining {table_name}: {e}")
+            continue
+        print_maintenance_report(report)
+        reports.append(report)
+    return reports
+
+def maybe_maintain(threshold=MAINTAIN_FRAGMENT_THRESHOLD, added_rows=0, lancedb_uri=LANCEDB_URI):
+    """
+    Runs maintenance on any table whose fragment count reached `threshold`,
+    or on all tables when `added_rows` (a large ingest) reaches it.
+    """
+    db = lancedb.connect(lancedb_uri)
+    if added_rows >= threshold:
+        return maintain(lancedb_uri=lancedb_uri)
+
+    existing = db.table_names()
+    due = []
+    for table_name in SCALAR_INDEXES:
+        if lancedb_table(table_name) not in existing:
+            continue
+        if count_fragments(open_table(db, table_name)) >= threshold:
+            due.append(table_name)
+
+    if due:
+        return maintain(tables=due, lancedb_uri=lancedb_uri)
+    return []
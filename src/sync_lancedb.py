@@ -0,0 +1,362 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import lancedb
+import numpy as np
+import pyarrow as pa
+from .store import DB_NAME, init_db as init_sqlite, fill_link_columns
+from .store_lancedb import LANCEDB_URI, table_schema, maybe_maintain
+from .model_config import MODEL_CONFIG_PATH, load_model_config
+
+# Changes applied per LanceDB write; each write becomes one fragment
+SYNC_BATCH_ROWS = 20000
+WATCH_INTERVAL = 5.0 # seconds between polls in --watch mode
+# Ids per LanceDB delete filter / SQLite IN list
+ID_CHUNK = 900
+# Applied changes stay in the log this long, for export_delta to pick up
+CHANGE_RETENTION_DAYS = 7
+# A table is synced by one syncer at a time; its lease is renewed per batch
+# and can be taken over once it expires (the holder crashed)
+SYNC_LEASE_SECONDS = 900
+LEASE_POLL = 0.5 # seconds between attempts to take a held lease
+
+TABLES = ("documents", "structured_hazards")
+
+SYNC_COLUMNS = {
+    "documents": ["id", "source_url", "content_type", "extracted_text", "metadata", "embedding"],
+    "structured_hazards": ["id", "hazard_type", "phase", "audience", "topic", "content_raw", "action_items",
+                           "sources", "source_file", "page_ref", "last_updated", "embedding"],
+}
+
+def init_sync(db_name=DB_NAME):
+    """
+    SQLite is the system of record. Triggers created by store.init_db log
+    every insert, update and delete to lancedb_changes; this table holds how
+    far each LanceDB table has caught up, up to which seq the log was
+    pruned (delta exports older than that start over), and which syncer
+    currently holds the table's lease.
+    """
+    init_sqlite(db_name)
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lancedb_sync (
+            table_name TEXT PRIMARY KEY,
+            physical_table TEXT,
+            last_seq INTEGER DEFAULT 0,
+            max_id INTEGER DEFAULT 0,
+            pruned_seq INTEGER DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(lancedb_sync)")]
+    for name, decl in (("pruned_seq", "INTEGER DEFAULT 0"), ("lease_owner", "TEXT"), ("lease_expires", "REAL")):
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE lancedb_sync ADD COLUMN {name} {decl}")
+    conn.commit()
+    conn.close()
+
+def _chunks(items, size=ID_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _vectors(blobs, dim):
+    """
+    Fixed-size float32 vectors from embedding blobs; missing or
+    wrong-sized embeddings become nulls.
+    """
+    valid = np.fromiter((b is not None and len(b) == dim * 4 for b in blobs), dtype=bool, count=len(blobs))
+    matrix = np.zeros((len(blobs), dim), dtype=np.float32)
+    if valid.any():
+        matrix[valid] = np.frombuffer(b"".join(b for b, ok in zip(blobs, valid) if ok), dtype=np.float32).reshape(-1, dim)
+    mask = None if valid.all() else pa.array(~valid)
+    return pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), dim, mask=mask)
+
+def _to_arrow(rows, schema, dim):
+    """
+    One Arrow table from SQLite row dicts, in the LanceDB table's schema.
+    """
+    arrays = []
+    for field in schema:
+        if field.name == "vector":
+            arrays.append(_vectors([row["embedding"] for row in rows], dim))
+        else:
+            arrays.append(pa.array([row[field.name] for row in rows], type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def _read_rows(conn, table_name, ids=None, after_id=0, until_id=None, limit=None):
+    """
+    Row dicts by id (or the next `limit` rows in (after_id, until_id]), with
+    linked action items and sources filled in.
+    """
+    columns = SYNC_COLUMNS[table_name]
+    select = f"SELECT {', '.join(columns)} FROM {table_name}"
+    if ids is None:
+        cursor = conn.execute(f"{select} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?", (after_id, until_id, limit))
+        rows = [dict(zip(columns, row)) for row in cursor]
+    else:
+        rows = []
+        for chunk in _chunks(ids):
+            cursor = conn.execute(f"{select} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            rows.extend(dict(zip(columns, row)) for row in cursor)
+    if table_name == "structured_hazards":
+        fill_link_columns(conn, rows)
+    return rows
+
+class LanceDBSync:
+    """
+    Replays SQLite changes into LanceDB. New rows (ids above anything synced
+    so far) are appended in large batches, changed rows are merged by id and
+    deleted rows removed. A table is rebuilt from a full snapshot on first
+    sync, when it predates the id column, or when a re-embedding pass
+    switched it to a new physical table.
+    Syncers in other processes (queue workers, --watch) wait for the
+    table's lease in lancedb_sync instead of replaying the same changes.
+    """
+
+    def __init__(self, db_name=DB_NAME, lancedb_uri=LANCEDB_URI, config_path=MODEL_CONFIG_PATH, batch_rows=SYNC_BATCH_ROWS,
+                 lease_seconds=SYNC_LEASE_SECONDS):
+        self.db_name = db_name
+        self.lancedb_uri = lancedb_uri
+        self.config_path = config_path
+        self.batch_rows = batch_rows
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        init_sync(db_name)
+
+    def _take_lease(self, table_name):
+        """
+        Claims the table's lease if it is free, expired or already ours.
+        """
+        conn = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO lancedb_sync (table_name) VALUES (?)", (table_name,))
+            now = time.time()
+            cursor = conn.execute('''
+                UPDATE lancedb_sync SET lease_owner = ?, lease_expires = ?
+                WHERE table_name = ? AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires < ?)
+            ''', (self.owner, now + self.lease_seconds, table_name, self.owner, now))
+            conn.execute("COMMIT")
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def acquire(self, table_name):
+        """
+        Blocks until this syncer holds the table's lease.
+        """
+        waiting = False
+        while not self._take_lease(table_name):
+            if not waiting:
+                print(f"Waiting for another LanceDB sync of {table_name} to finish...")
+                waiting = True
+            time.sleep(LEASE_POLL)
+
+    def renew(self, table_name):
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        with conn:
+            conn.execute("UPDATE lancedb_sync SET lease_expires = ? WHERE table_name = ? AND lease_owner = ?",
+                         (time.time() + self.lease_seconds, table_name, self.owner))
+        conn.close()
+
+    def release(self, table_name):
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        with conn:
+            conn.execute("UPDATE lancedb_sync SET lease_owner = NULL, lease_expires = NULL WHERE table_name = ? AND lease_owner = ?",
+                         (table_name, self.owner))
+        conn.close()
+
+    def _state(self, conn, table_name):
+        row = conn.execute("SELECT physical_table, last_seq, max_id FROM lancedb_sync WHERE table_name = ?", (table_name,)).fetchone()
+        return row or (None, 0, 0)
+
+    def _save_state(self, conn, table_name, physical, last_seq, max_id):
+        with conn:
+            conn.execute('''
+                INSERT INTO lancedb_sync (table_name, physical_table, last_seq, max_id, synced_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(table_name) DO UPDATE SET physical_table = excluded.physical_table,
+                    last_seq = excluded.last_seq, max_id = excluded.max_id, synced_at = excluded.synced_at
+            ''', (table_name, physical, last_seq, max_id))
+            # Changes up to the watermark are in LanceDB now; they are kept a while
+            # longer for export_delta, which reads the same log
+            cutoff = f"-{CHANGE_RETENTION_DAYS} days"
+            pruned = conn.execute('''
+                SELECT MAX(seq) FROM lancedb_changes
+                WHERE table_name = ? AND seq <= ? AND (changed_at IS NULL OR changed_at < datetime('now', ?))
+            ''', (table_name, last_seq, cutoff)).fetchone()[0]
+            if pruned:
+                conn.execute("DELETE FROM lancedb_changes WHERE table_name = ? AND seq <= ?", (table_name, pruned))
+                conn.execute("UPDATE lancedb_sync SET pruned_seq = MAX(pruned_seq, ?) WHERE table_name = ?", (pruned, table_name))
+
+    def snapshot(self, conn, db, table_name, physical, schema, dim):
+        """
+        Rewrites the whole LanceDB table from SQLite as one new table version,
+        so readers keep seeing the previous version until it is committed.
+        """
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM lancedb_changes WHERE table_name = ?", (table_name,)).fetchone()[0]
+        max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table_name}").fetchone()[0]
+        print(f"Snapshotting {table_name} into LanceDB table {physical}...")
+
+        # LanceDB pulls the batches from one of its own threads
+        reader = sqlite3.connect(self.db_name, check_same_thread=False)
+
+        def batches():
+            after_id = 0
+            while True:
+                rows = _read_rows(reader, table_name, after_id=after_id, until_id=max_id, limit=self.batch_rows)
+                if not rows:
+                    break
+                after_id = rows[-1]["id"]
+                self.renew(table_name)
+                yield from _to_arrow(rows, schema, dim).to_batches()
+
+        try:
+            db.create_table(physical, data=batches(), schema=schema, mode="overwrite")
+        finally:
+            reader.close()
+        # Rows written from here on have a higher seq and are replayed next time;
+        # rows above max_id are left to that replay so they are not appended twice
+        self._save_state(conn, table_name, physical, last_seq, max_id)
+        return db.open_table(physical).count_rows()
+
+    def sync_table(self, table_name, full=False):
+        """
+        Brings one LanceDB table up to date under its lease. Returns the
+        number of rows written or deleted.
+        """
+        self.acquire(table_name)
+        try:
+            return self._sync_table(table_name, full)
+        finally:
+            self.release(table_name)
+
+    def _sync_table(self, table_name, full):
+        config = load_model_config(self.config_path)
+        dim = config["dim"]
+        physical = config["tables"].get(table_name, table_name)
+        schema = table_schema(table_name, dim)
+        db = lancedb.connect(self.lancedb_uri)
+        conn = sqlite3.connect(self.db_name)
+        try:
+            synced_physical, last_seq, max_id = self._state(conn, table_name)
+            if physical in db.table_names():
+                tbl = db.open_table(physical)
+                stale = "id" not in tbl.schema.names or tbl.schema.field("vector").type != schema.field("vector").type
+            else:
+                tbl, stale = None, True
+            if full or stale or synced_physical != physical:
+                return self.snapshot(conn, db, table_name, physical, schema, dim)
+
+            # Rows appended by a sync that died before saving its state are
+            # already in LanceDB: count them as synced so they are not appended twice
+            appended = tbl.search().where(f"id > {max_id}").select(["id"]).limit(None).to_arrow()["id"]
+            if len(appended):
+                max_id = max(appended.to_pylist())
+                print(f"Found {len(appended)} rows of an interrupted sync of {table_name}.")
+
+            applied = 0
+            while True:
+                changes = conn.execute('''
+                    SELECT seq, row_id, op FROM lancedb_changes
+                    WHERE table_name = ? AND seq > ? ORDER BY seq LIMIT ?
+                ''', (table_name, last_seq, self.batch_rows)).fetchall()
+                if not changes:
+                    break
+                # Only the latest state of each row matters
+                latest = {}
+                for _, row_id, op in changes:
+                    latest[row_id] = op
+                upserts = [row_id for row_id, op in latest.items() if op != "D"]
+                rows = _read_rows(conn, table_name, ids=upserts)
+                found = {row["id"] for row in rows}
+                # Rows updated and then deleted since are gone from SQLite too
+                deletes = [row_id for row_id in latest if row_id not in found and row_id <= max_id]
+
+                for chunk in _chunks(deletes):
+                    tbl.delete(f"id IN ({', '.join(str(i) for i in chunk)})")
+                new_rows = [row for row in rows if row["id"] > max_id]
+                changed_rows = [row for row in rows if row["id"] <= max_id]
+                if new_rows:
+                    # Ids only grow: rows above the synced maximum cannot be in LanceDB yet
+                    tbl.add(_to_arrow(new_rows, schema, dim))
+                if changed_rows:
+                    (tbl.merge_insert("id").when_matched_update_all().when_not_matched_insert_all()
+                        .execute(_to_arrow(changed_rows, schema, dim)))
+
+                last_seq = changes[-1][0]
+                max_id = max([max_id] + [row["id"] for row in new_rows])
+                self._save_state(conn, table_name, physical, last_seq, max_id)
+                self.renew(table_name)
+                applied += len(rows) + len(deletes)
+            return applied
+        finally:
+            conn.close()
+
+    def sync(self, tables=TABLES, full=False, maintain=True):
+        """
+        Syncs every table once. Returns {table_name: rows applied}.
+        """
+        results = {}
+        for table_name in tables:
+            try:
+                results[table_name] = self.sync_table(table_name, full=full)
+            except Exception as e:
+                print(f"Error syncing {table_name} to LanceDB: {e}")
+                continue
+            if results[table_name]:
+                print(f"Synced {results[table_name]} row changes of {table_name} to LanceDB.")
+        if maintain:
+            # Large appends add few fragments, but compaction still pays off after big syncs
+            maybe_maintain(added_rows=sum(results.values()), lancedb_uri=self.lancedb_uri)
+        return results
+
+    def pending(self, tables=TABLES):
+        """
+        Logged changes not yet applied, per table.
+        """
+        conn = sqlite3.connect(self.db_name)
+        try:
+            return {t: conn.execute('''
+                SELECT COUNT(*) FROM lancedb_changes
+                WHERE table_name = ? AND seq > COALESCE((SELECT last_seq FROM lancedb_sync WHERE table_name = ?), 0)
+            ''', (t, t)).fetchone()[0] for t in tables}
+        finally:
+            conn.close()
+
+    def watch(self, interval=WATCH_INTERVAL, tables=TABLES):
+        """
+        Syncs continuously, polling the change log every `interval` seconds.
+        """
+        print(f"Watching SQLite for changes every {interval}s (Ctrl+C to stop)...")
+        try:
+            while True:
+                if any(self.pending(tables).values()):
+                    self.sync(tables)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+
+def sync_lancedb(tables=TABLES, full=False):
+    return LanceDBSync().sync(tables, full=full)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync SQLite changes into LanceDB")
+    parser.add_argument("--tables", nargs="+", choices=TABLES, default=list(TABLES), help="Tables to sync")
+    parser.add_argument("--full", action="store_true", help="Rebuild the LanceDB tables from a full snapshot")
+    parser.add_argument("--watch", action="store_true", help="Keep syncing as changes arrive")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="Seconds between polls with --watch")
+    parser.add_argument("--batch-rows", type=int, default=SYNC_BATCH_ROWS, help="Changes applied per LanceDB write")
+    args = parser.parse_args()
+
+    syncer = LanceDBSync(batch_rows=args.batch_rows)
+    syncer.sync(args.tables, full=args.full)
+    if args.watch:
+        syncer.watch(args.interval, args.tables)
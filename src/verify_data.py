@@ -1,76 +1,322 @@
+import os
+import sys
+import json
+import time
 import sqlite3
+import argparse
+import datetime
 import lancedb
-import json
+import numpy as np
 import pandas as pd
-from .store import DB_NAME
+from pandas.util import hash_array, hash_pandas_object
+from .store import DB_NAME, fill_link_columns
 from .store_lancedb import LANCEDB_URI
+from .model_config import MODEL_CONFIG_PATH, load_model_config, lancedb_table
+
+REPORT_PATH = "data/verify_report.json"
+
+VERIFY_BATCH_ROWS = 50000
+# Rows are bucketed by source_file; a per-bucket digest mismatch is then
+# narrowed down to files with a second pass over the mismatched buckets only
+PARTITIONS = 256
+MAX_EXAMPLES = 5
+MAX_MISMATCHED_FILES = 100
 
-def verify_sqlite():
-    print("\n--- Verifying SQLite ---")
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Check tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = [row[0] for row in cursor.fetchall()]
-    print(f"Tables: {tables}")
-    
-    if "structured_hazards" in tables:
-        cursor.execute("SELECT * FROM structured_hazards LIMIT 1")
-        columns = [description[0] for description in cursor.description]
-        print(f"Columns: {columns}")
-        
-        cursor.execute("SELECT COUNT(*) FROM structured_hazards")
-        count = cursor.fetchone()[0]
-        print(f"Records in 'structured_hazards': {count}")
-        
-        if count > 0:
-            cursor.execute("SELECT * FROM structured_hazards LIMIT 1")
-            row = cursor.fetchone()
-            print("\nSample Record (SQLite):")
-            for col, val in zip(columns, row):
-                if col == "embedding" and val:
-                    print(f"  {col}: <BLOB len={len(val)}>")
-                elif col == "action_items":
-                    print(f"  {col}: {val[:100]}...")
-                elif col == "sources":
-                    print(f"  {col}: {val[:100]}...")
-                elif col == "content_raw":
-                    print(f"  {col}: {val[:50]}...")
-                else:
-                    print(f"  {col}: {val}")
-    conn.close()
-
-def verify_lancedb():
-    print("\n--- Verifying LanceDB ---")
+TEXT_FIELDS = ["hazard_type", "phase", "audience", "topic", "content_raw",
+               "action_items", "sources", "source_file", "last_updated"]
+REQUIRED_FIELDS = ["hazard_type", "phase", "content_raw", "source_file", "page_ref"]
+
+_MASK64 = (1 << 64) - 1
+
+def _normalize(df):
+    """
+    Same canonical values from both stores: SQLite NULLs where LanceDB has
+    empty strings and zeros, and int32 vs int64 page numbers.
+    """
+    for field in TEXT_FIELDS:
+        df[field] = df[field].fillna("").astype(str)
+    df["page_ref"] = pd.to_numeric(df["page_ref"], errors="coerce")
+    return df
+
+def _sqlite_batches(db_name, batch_rows):
+    """
+    Yields (frame, vector blobs) batches of structured_hazards.
+    """
+    conn = sqlite3.connect(db_name)
     try:
-        db = lancedb.connect(LANCEDB_URI)
-        tables = db.table_names()
-        print(f"Tables: {tables}")
-        
-        if "structured_hazards" in tables:
-            tbl = db.open_table("structured_hazards")
-            df = tbl.to_pandas()
-            print(f"Records in 'structured_hazards': {len(df)}")
-            
-            if not df.empty:
-                print("\nSample Record (LanceDB):")
-                row = df.iloc[0]
-                for col in df.columns:
-                    val = row[col]
-                    if col == "vector":
-                        print(f"  {col}: <Vector len={len(val)}>")
-                    elif col == "action_items":
-                        print(f"  {col}: {str(val)[:100]}...")
-                    elif col == "sources":
-                        print(f"  {col}: {str(val)[:100]}...")
-                    elif col == "content_raw":
-                        print(f"  {col}: {str(val)[:50]}...")
-                    else:
-                        print(f"  {col}: {val}")
-    except Exception as e:
-        print(f"LanceDB Error: {e}")
+        columns = ["id"] + TEXT_FIELDS + ["page_ref", "embedding"]
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM structured_hazards")
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            # Linked action items and sources come back as the JSON LanceDB holds
+            rows = fill_link_columns(conn, [dict(zip(columns, row)) for row in rows])
+            df = pd.DataFrame.from_records(rows, columns=columns).drop(columns=["id"])
+            blobs = df.pop("embedding").to_numpy(dtype=object)
+            yield df, blobs
+    finally:
+        conn.close()
+
+def _lancedb_batches(tbl, batch_rows):
+    """
+    Yields (frame, vector blobs) batches, vectors as the float32 bytes SQLite stores.
+    """
+    query = tbl.search().select(TEXT_FIELDS + ["page_ref", "vector"]).limit(None)
+    for batch in query.to_batches(batch_rows):
+        vectors = batch.column("vector")
+        df = batch.drop_columns(["vector"]).to_pandas()
+        width = vectors.type.list_size
+        matrix = vectors.flatten().to_numpy(zero_copy_only=False).astype(np.float32).reshape(-1, width)
+        nulls = vectors.is_null().to_numpy(zero_copy_only=False)
+        if nulls.any():
+            # flatten() drops null entries, so realign the rows
+            full = np.zeros((len(df), width), dtype=np.float32)
+            full[~nulls] = matrix
+            matrix = full
+        blobs = np.empty(len(df), dtype=object)
+        blobs[:] = [None if null else row.tobytes() for row, null in zip(matrix, nulls)]
+        yield df, blobs
+
+def _row_hashes(df, blobs):
+    """
+    Order-independent 64-bit digest input: one hash per row over every stored field.
+    """
+    fields = hash_pandas_object(df[TEXT_FIELDS + ["page_ref"]], index=False, categorize=False).to_numpy()
+    return fields * np.uint64(31) + hash_array(blobs)
+
+def _key_hashes(df):
+    return hash_pandas_object(df[["source_file", "page_ref"]], index=False).to_numpy()
+
+def _partitions(df):
+    return (hash_array(df["source_file"].to_numpy(dtype=object)) % np.uint64(PARTITIONS)).astype(np.int64)
+
+class _StoreCheck:
+    """
+    Streaming checks for one store: per-row problems, duplicate keys, and
+    per-partition digests for parity.
+    """
+
+    def __init__(self, name, dim):
+        self.name = name
+        self.dim = dim
+        self.rows = 0
+        self.vectors = {"wrong_dim": 0, "missing": 0, "nan": 0, "zero": 0}
+        self.null_fields = {field: 0 for field in REQUIRED_FIELDS}
+        self.examples = {}
+        self.key_hashes = []
+        self.partition_rows = np.zeros(PARTITIONS, dtype=np.int64)
+        self.partition_digests = np.zeros(PARTITIONS, dtype=np.uint64)
+        self.duplicate_keys = 0
+
+    def _flag(self, check, df, mask):
+        n = int(mask.sum())
+        if n:
+            examples = self.examples.setdefault(check, [])
+            for source_file, page_ref in df.loc[mask, ["source_file", "page_ref"]].head(MAX_EXAMPLES - len(examples)).itertuples(index=False):
+                examples.append({"source_file": source_file, "page_ref": None if pd.isna(page_ref) else int(page_ref)})
+        return n
+
+    def add(self, df, blobs):
+        df = _normalize(df)
+        self.rows += len(df)
+
+        # Vectors: decode the well-formed ones in one go
+        lengths = np.fromiter((len(b) if b is not None else -1 for b in blobs), dtype=np.int64, count=len(blobs))
+        missing = lengths < 0
+        good = lengths == self.dim * 4
+        self.vectors["missing"] += self._flag("missing_vector", df, missing)
+        self.vectors["wrong_dim"] += self._flag("wrong_dim", df, ~missing & ~good)
+        if good.any():
+            matrix = np.frombuffer(b"".join(blobs[good]), dtype=np.float32).reshape(-1, self.dim)
+            nan = np.zeros(len(df), dtype=bool)
+            zero = np.zeros(len(df), dtype=bool)
+            nan[good] = np.isnan(matrix).any(axis=1)
+            zero[good] = ~np.any(matrix, axis=1)
+            self.vectors["nan"] += self._flag("nan_vector", df, nan)
+            self.vectors["zero"] += self._flag("zero_vector", df, zero)
+
+        for field in REQUIRED_FIELDS:
+            column = df[field]
+            null = column.isna() | (column == "") if field in TEXT_FIELDS else column.isna()
+            self.null_fields[field] += self._flag(f"null_{field}", df, null.to_numpy())
+
+        self.key_hashes.append(_key_hashes(df))
+        partitions = _partitions(df)
+        np.add.at(self.partition_rows, partitions, 1)
+        np.add.at(self.partition_digests, partitions, _row_hashes(df, blobs))
+
+    def finish(self):
+        """
+        Counts duplicate (source_file, page_ref) keys; returns their hashes
+        so examples can be collected in a second pass.
+        """
+        hashes = np.concatenate(self.key_hashes) if self.key_hashes else np.zeros(0, dtype=np.uint64)
+        self.key_hashes = []
+        unique, counts = np.unique(hashes, return_counts=True)
+        self.duplicate_keys = int((counts > 1).sum())
+        return unique[counts > 1]
+
+    def ok(self):
+        return not (any(self.vectors.values()) or any(self.null_fields.values()) or self.duplicate_keys)
+
+    def report(self):
+        return {
+            "rows": self.rows,
+            "dim": self.dim,
+            "vectors": self.vectors,
+            "null_fields": self.null_fields,
+            "duplicate_keys": self.duplicate_keys,
+            "examples": self.examples,
+            "ok": self.ok(),
+        }
+
+def _second_pass(batches, duplicate_hashes, partitions, examples):
+    """
+    Re-streams a store, collecting duplicate key examples and per-file
+    (rows, digest) for rows in the given partitions.
+    """
+    files = {}
+    duplicates = examples.setdefault("duplicate_key", [])
+    for df, blobs in batches:
+        df = _normalize(df)
+        if len(duplicate_hashes) and len(duplicates) < MAX_EXAMPLES:
+            mask = np.isin(_key_hashes(df), duplicate_hashes)
+            for source_file, page_ref in df.loc[mask, ["source_file", "page_ref"]].itertuples(index=False):
+                example = {"source_file": source_file, "page_ref": None if pd.isna(page_ref) else int(page_ref)}
+                if example not in duplicates and len(duplicates) < MAX_EXAMPLES:
+                    duplicates.append(example)
+        if partitions:
+            mask = np.isin(_partitions(df), list(partitions))
+            hashes = _row_hashes(df, blobs)[mask]
+            for source_file, h in zip(df["source_file"].to_numpy()[mask], hashes):
+                rows, digest = files.get(source_file, (0, 0))
+                files[source_file] = (rows + 1, (digest + int(h)) & _MASK64)
+    if not duplicates:
+        del examples["duplicate_key"]
+    return files
+
+def _compare_files(sqlite_files, lancedb_files):
+    mismatched = []
+    for source_file in sorted(set(sqlite_files) | set(lancedb_files)):
+        s_rows, s_digest = sqlite_files.get(source_file, (0, None))
+        l_rows, l_digest = lancedb_files.get(source_file, (0, None))
+        if s_digest == l_digest:
+            continue
+        if not s_rows:
+            status = "missing_in_sqlite"
+        elif not l_rows:
+            status = "missing_in_lancedb"
+        elif s_rows != l_rows:
+            status = "row_count"
+        else:
+            status = "content"
+        mismatched.append({"source_file": source_file, "sqlite_rows": s_rows, "lancedb_rows": l_rows, "status": status})
+    return mismatched
+
+def verify(db_name=DB_NAME, lancedb_uri=LANCEDB_URI, batch_rows=VERIFY_BATCH_ROWS, report_path=REPORT_PATH,
+           config_path=MODEL_CONFIG_PATH):
+    """
+    Streams structured_hazards from both stores in batches, checks vectors,
+    required fields and duplicate keys, and compares per-partition digests
+    to check the stores hold the same rows. Returns the report, also
+    written as JSON to `report_path`.
+    """
+    start = time.perf_counter()
+    config = load_model_config(config_path)
+    dim = config["dim"]
+    report = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "model": {"model": config["model"], "dim": dim, "version": config["version"]},
+        "stores": {},
+    }
+
+    sqlite_check = _StoreCheck("sqlite", dim)
+    for df, blobs in _sqlite_batches(db_name, batch_rows):
+        sqlite_check.add(df, blobs)
+    sqlite_dups = sqlite_check.finish()
+
+    db = lancedb.connect(lancedb_uri)
+    lancedb_check = _StoreCheck("lancedb", dim)
+    tbl = None
+    schema_dim = None
+    table_name = lancedb_table("structured_hazards", config_path)
+    if table_name in db.table_names():
+        tbl = db.open_table(table_name)
+        schema_dim = tbl.schema.field("vector").type.list_size
+        for df, blobs in _lancedb_batches(tbl, batch_rows):
+            lancedb_check.add(df, blobs)
+    else:
+        print("LanceDB table structured_hazards not found.")
+    lancedb_dups = lancedb_check.finish()
+
+    # Parity: equal digests mean equal multisets of rows within a partition
+    mismatched = np.nonzero((sqlite_check.partition_rows != lancedb_check.partition_rows)
+                            | (sqlite_check.partition_digests != lancedb_check.partition_digests))[0]
+    partitions = set(int(p) for p in mismatched)
+
+    sqlite_files = {}
+    lancedb_files = {}
+    if partitions or len(sqlite_dups):
+        sqlite_files = _second_pass(_sqlite_batches(db_name, batch_rows), sqlite_dups, partitions, sqlite_check.examples)
+    if tbl is not None and (partitions or len(lancedb_dups)):
+        lancedb_files = _second_pass(_lancedb_batches(tbl, batch_rows), lancedb_dups, partitions, lancedb_check.examples)
+    files = _compare_files(sqlite_files, lancedb_files)
+
+    report["stores"]["sqlite"] = sqlite_check.report()
+    report["stores"]["lancedb"] = lancedb_check.report()
+    report["stores"]["lancedb"]["schema_dim"] = schema_dim
+    if schema_dim is not None and schema_dim != dim:
+        report["stores"]["lancedb"]["ok"] = False
+    report["parity"] = {
+        "partitions": PARTITIONS,
+        "mismatched_partitions": [
+            {"partition": int(p), "sqlite_rows": int(sqlite_check.partition_rows[p]),
+             "lancedb_rows": int(lancedb_check.partition_rows[p])}
+            for p in mismatched
+        ],
+        "mismatched_files": files[:MAX_MISMATCHED_FILES],
+        "mismatched_file_count": len(files),
+        "ok": not partitions,
+    }
+    report["ok"] = report["parity"]["ok"] and all(store["ok"] for store in report["stores"].values())
+    report["seconds"] = round(time.perf_counter() - start, 3)
+
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def print_report(report):
+    for name, store in report["stores"].items():
+        status = "OK" if store["ok"] else "FAILED"
+        print(f"{name}: {store['rows']} rows, {status}")
+        problems = {f"vector {k}": v for k, v in store["vectors"].items()}
+        problems.update({f"null {k}": v for k, v in store["null_fields"].items()})
+        problems["duplicate keys"] = store["duplicate_keys"]
+        for problem, n in problems.items():
+            if n:
+                print(f"  {problem}: {n}")
+        if store.get("schema_dim") not in (None, store["dim"]):
+            print(f"  vector dimension {store['schema_dim']}, model expects {store['dim']}")
+    parity = report["parity"]
+    if parity["ok"]:
+        print(f"Parity: all {parity['partitions']} partitions match")
+    else:
+        print(f"Parity: {len(parity['mismatched_partitions'])} of {parity['partitions']} partitions differ, "
+              f"{parity['mismatched_file_count']} file(s):")
+        for entry in parity["mismatched_files"][:10]:
+            print(f"  {entry['source_file']}: {entry['status']} (sqlite {entry['sqlite_rows']}, lancedb {entry['lancedb_rows']})")
+    print(f"Verification {'passed' if report['ok'] else 'FAILED'} in {report['seconds']}s")
 
 if __name__ == "__main__":
-    verify_sqlite()
-    verify_lancedb()
+    parser = argparse.ArgumentParser(description="Verify structured_hazards in SQLite and LanceDB")
+    parser.add_argument("--batch-rows", type=int, default=VERIFY_BATCH_ROWS, help="Rows read per batch")
+    parser.add_argument("--report", default=REPORT_PATH, help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    report = verify(batch_rows=args.batch_rows, report_path=args.report)
+    print_report(report)
+    print(f"Report written to {args.report}")
+    sys.exit(0 if report["ok"] else 1)
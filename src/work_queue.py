@@ -0,0 +1,398 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+from .fetch import backoff_delay
+
+# Kept apart from hazards.db so the queue can live on a filesystem shared by
+# several nodes. SQLite there needs working POSIX locks (NFSv4, not NFSv3 with
+# nolock), and the default rollback journal: WAL does not work across hosts.
+QUEUE_DB = os.environ.get("HAZARDS_QUEUE_DB", "data/queue.db")
+
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+IDLE_SLEEP = 2.0 # seconds between polls of an empty queue
+RETRY_BASE = 30.0 # seconds; doubled per attempt
+RETRY_MAX = 3600.0
+
+def _connect(db_name):
+    # Autocommit: every transaction is an explicit BEGIN IMMEDIATE
+    conn = sqlite3.connect(db_name, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_queue(db_name=QUEUE_DB):
+    os.makedirs(os.path.dirname(db_name) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+
+    # status: queued -> leased -> done, or back to queued on retry, or failed.
+    # Finished (done or failed) jobs drop their dedupe_key.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            dedupe_key TEXT UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            available_at REAL NOT NULL,
+            lease_owner TEXT,
+            lease_expires REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+    # Lease scans: runnable queued jobs and expired leases
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_available
+        ON jobs (status, available_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_lease
+        ON jobs (status, lease_expires)
+    ''')
+
+    conn.commit()
+    conn.close()
+
+def default_dedupe_key(kind, payload):
+    return kind + ":" + json.dumps(payload, sort_keys=True)
+
+def _job(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    return job
+
+class WorkQueue:
+    """
+    Durable job table shared by any number of worker processes or nodes.
+    A worker leases a job for `lease_seconds` and must heartbeat to keep it;
+    leases of crashed workers expire and the job is handed to the next
+    worker, counting as a failed attempt. Failed jobs are retried with
+    exponential backoff until `max_attempts` is reached.
+    """
+
+    def __init__(self, db_name=QUEUE_DB, lease_seconds=LEASE_SECONDS, clock=time.time):
+        self.db_name = db_name
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        init_queue(db_name)
+
+    def enqueue(self, kind, payload, dedupe_key=None, max_attempts=MAX_ATTEMPTS, delay=0):
+        """
+        Adds a job and returns its id, or None if a queued or leased job with
+        the same dedupe key (by default kind + payload) already exists.
+        """
+        return self.enqueue_many(kind, [payload], max_attempts, delay, dedupe_keys=[dedupe_key])[0]
+
+    def enqueue_many(self, kind, payloads, max_attempts=MAX_ATTEMPTS, delay=0, dedupe_keys=None):
+        now = self.clock()
+        keys = dedupe_keys or [None] * len(payloads)
+        ids = []
+        conn = _connect(self.db_name)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for payload, key in zip(payloads, keys):
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO jobs (kind, payload, dedupe_key, max_attempts, available_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (kind, json.dumps(payload), key or default_dedupe_key(kind, payload), max_attempts, now + delay, now))
+                ids.append(cursor.lastrowid if cursor.rowcount else None)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return ids
+
+    def lease(self, owner, kinds=None):
+        """
+        Claims the next runnable job for `owner` and returns it as a dict, or
+        None if nothing is runnable. Expired leases are reclaimed first;
+        those that used up their attempts are marked failed instead.
+        """
+        now = self.clock()
+        kind_filter = ""
+        params = []
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params = list(kinds)
+
+        conn = _connect(self.db_name)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute('''
+                UPDATE jobs SET status = 'failed', dedupe_key = NULL, finished_at = ?, lease_owner = NULL,
+                    last_error = 'lease expired (' || lease_owner || ')'
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts
+            ''', (now, now))
+            row = conn.execute(f'''
+                SELECT * FROM jobs
+                WHERE ((status = 'queued' AND available_at <= ?)
+                    OR (status = 'leased' AND lease_expires < ?)){kind_filter}
+                ORDER BY available_at, id
+                LIMIT 1
+            ''', [now, now] + params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["status"] == "leased":
+                print(f"Reclaiming job {row['id']} from expired lease of {row['lease_owner']}")
+            conn.execute('''
+                UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE id = ?
+            ''', (owner, now + self.lease_seconds, row["id"]))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        job = _job(row)
+        job.update(status="leased", lease_owner=owner, lease_expires=now + self.lease_seconds,
+                   attempts=row["attempts"] + 1)
+        return job
+
+    def _update_lease(self, job_id, owner, sql, params):
+        """
+        Runs `sql` against the job only while `owner` still holds its lease.
+        Returns False if the lease was lost (expired and reclaimed).
+        """
+        conn = _connect(self.db_name)
+        try:
+            cursor = conn.execute(sql + " WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                                  list(params) + [job_id, owner])
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, owner):
+        return self._update_lease(job_id, owner, "UPDATE jobs SET lease_expires = ?",
+                                  [self.clock() + self.lease_seconds])
+
+    def complete(self, job_id, owner):
+        # Clearing the dedupe key lets the same work be enqueued again later
+        return self._update_lease(job_id, owner,
+                                  "UPDATE jobs SET status = 'done', dedupe_key = NULL, lease_owner = NULL, lease_expires = NULL, finished_at = ?",
+                                  [self.clock()])
+
+    def fail(self, job_id, owner, error, retry=True):
+        """
+        Releases a job after an error: queued again after a backoff delay while
+        attempts remain (and `retry` is set), otherwise marked failed. A failed
+        job gives up its dedupe key, so the same work can be enqueued again.
+        Returns False if `owner` no longer holds the lease.
+        """
+        now = self.clock()
+        conn = _connect(self.db_name)
+        try:
+            # Attempts are read under the same lock as the lease check and the update
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute('''
+                SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'leased'
+            ''', (job_id, owner)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+            if retry and row["attempts"] < row["max_attempts"]:
+                delay = backoff_delay(row["attempts"] - 1, base=RETRY_BASE, cap=RETRY_MAX)
+                conn.execute('''
+                    UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL,
+                        available_at = ?, last_error = ?
+                    WHERE id = ?
+                ''', (now + delay, str(error), job_id))
+            else:
+                conn.execute('''
+                    UPDATE jobs SET status = 'failed', dedupe_key = NULL, lease_owner = NULL, lease_expires = NULL,
+                        finished_at = ?, last_error = ?
+                    WHERE id = ?
+                ''', (now, str(error), job_id))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def retry_failed(self, kinds=None):
+        """
+        Queues failed jobs again with a fresh set of attempts, except those
+        whose kind and payload were enqueued again and are still pending.
+        """
+        kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})" if kinds else ""
+        conn = _connect(self.db_name)
+        try:
+            cursor = conn.execute(f'''
+                UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, finished_at = NULL
+                WHERE status = 'failed'{kind_filter}
+                    AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.kind = jobs.kind AND j.payload = jobs.payload
+                                    AND j.status IN ('queued', 'leased'))
+            ''', [self.clock()] + list(kinds or []))
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def counts(self):
+        conn = _connect(self.db_name)
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {status: n for status, n in rows}
+
+    def pending(self):
+        """
+        Jobs not yet finished: queued, or leased (possibly by a crashed worker).
+        """
+        counts = self.counts()
+        return counts.get("queued", 0) + counts.get("leased", 0)
+
+# Job handlers. Pipeline modules are imported lazily: they open the stores on import.
+
+def _run_pdf(payload):
+    from .process_pdfs import process_pdf
+    process_pdf(payload["path"], force=payload.get("force", False))
+
+def _run_url(payload):
+    from .ingest import process_url
+    # SQLite only: the worker syncs LanceDB once the queue drains
+    if not process_url(payload["url"]):
+        # Raised so the job is retried with backoff instead of marked done
+        raise RuntimeError(f"nothing stored for {payload['url']}")
+
+def _run_ingest(payload):
+    from .ingest_universal import ingest_universal
+    if not ingest_universal(payload["source"], crawl_depth=payload.get("crawl_depth", 0),
+                            max_pages=payload.get("max_pages", 100)):
+        raise RuntimeError(f"nothing stored for {payload['source']}")
+
+HANDLERS = {"pdf": _run_pdf, "url": _run_url, "ingest": _run_ingest}
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+class Worker:
+    """
+    Leases jobs one at a time and runs the handler registered for their kind,
+    heartbeating from a background thread while the handler runs.
+    `on_idle` is called whenever the queue runs dry after jobs have run.
+    """
+
+    def __init__(self, queue, handlers=None, worker_id=None, kinds=None, idle_sleep=IDLE_SLEEP, heartbeat_interval=None,
+                 on_idle=None):
+        self.queue = queue
+        self.on_idle = on_idle
+        self.handlers = handlers or HANDLERS
+        self.worker_id = worker_id or default_worker_id()
+        self.kinds = kinds or list(self.handlers)
+        self.idle_sleep = idle_sleep
+        self.heartbeat_interval = heartbeat_interval or queue.lease_seconds / 3
+
+    def _heartbeat_loop(self, job_id, stop):
+        while not stop.wait(self.heartbeat_interval):
+            if not self.queue.heartbeat(job_id, self.worker_id):
+                print(f"[{self.worker_id}] Lost lease on job {job_id}")
+                return
+
+    def run_job(self, job):
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat_loop, args=(job["id"], stop), daemon=True)
+        beat.start()
+        try:
+            self.handlers[job["kind"]](job["payload"])
+        except Exception as e:
+            print(f"[{self.worker_id}] Job {job['id']} ({job['kind']}) failed: {e}")
+            return self.queue.fail(job["id"], self.worker_id, e)
+        finally:
+            stop.set()
+            beat.join()
+        return self.queue.complete(job["id"], self.worker_id)
+
+    def run(self, max_jobs=None, exit_when_empty=False):
+        """
+        Processes jobs until `max_jobs` have run or, with `exit_when_empty`,
+        nothing is left pending. Returns the number of jobs run.
+        """
+        done = 0
+        ran_since_idle = False
+        while max_jobs is None or done < max_jobs:
+            job = self.queue.lease(self.worker_id, self.kinds)
+            if job is None:
+                if ran_since_idle and self.on_idle:
+                    self.on_idle()
+                ran_since_idle = False
+                if exit_when_empty and self.queue.pending() == 0:
+                    break
+                # Leased elsewhere, or waiting out a retry delay or an expired lease
+                time.sleep(self.idle_sleep)
+                continue
+            print(f"[{self.worker_id}] Job {job['id']}: {job['kind']} {json.dumps(job['payload'])} (attempt {job['attempts']})")
+            self.run_job(job)
+            done += 1
+            ran_since_idle = True
+        if ran_since_idle and self.on_idle:
+            self.on_idle()
+        return done
+
+def run_worker(queue, kinds=None, max_jobs=None, exit_when_empty=False, sync=True):
+    """
+    Runs a Worker; handlers only write SQLite, so each time the queue
+    drains (and on exit) the post-write hook brings the derived stores up to
+    date, once for all jobs run since.
+    """
+    from .post_write import after_writes
+    return Worker(queue, kinds=kinds, on_idle=lambda: after_writes(sync=sync)).run(max_jobs=max_jobs, exit_when_empty=exit_when_empty)
+
+def enqueue_pdfs(pdf_dir=None, force=False, db_name=QUEUE_DB):
+    """
+    Enqueues one "pdf" job per PDF in `pdf_dir` (PDF_DIR by default).
+    """
+    if pdf_dir is None:
+        from .process_pdfs import PDF_DIR
+        pdf_dir = PDF_DIR
+    if not os.path.exists(pdf_dir):
+        print(f"Directory not found: {pdf_dir}")
+        return []
+    paths = sorted(os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith('.pdf'))
+    ids = WorkQueue(db_name).enqueue_many("pdf", [{"path": path, "force": force} for path in paths])
+    print(f"Enqueued {sum(1 for i in ids if i)} of {len(paths)} PDFs.")
+    return ids
+
+def enqueue_urls(urls, db_name=QUEUE_DB):
+    ids = WorkQueue(db_name).enqueue_many("url", [{"url": url} for url in urls])
+    print(f"Enqueued {sum(1 for i in ids if i)} of {len(urls)} URLs.")
+    return ids
+
+def print_counts(queue):
+    counts = queue.counts()
+    print("Queue: " + ", ".join(f"{status} {counts.get(status, 0)}" for status in ("queued", "leased", "done", "failed")))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared work queue for PDF processing and URL ingestion")
+    parser.add_argument("command", choices=["worker", "enqueue-pdfs", "enqueue-urls", "status", "retry-failed"])
+    parser.add_argument("urls", nargs="*", help="URLs for enqueue-urls")
+    parser.add_argument("--queue-db", default=QUEUE_DB, help="Queue database (put it on a shared filesystem for several nodes)")
+    parser.add_argument("--file", help="File containing URLs (one per line) for enqueue-urls")
+    parser.add_argument("--force", action="store_true", help="PDF jobs reprocess already processed content")
+    parser.add_argument("--kinds", nargs="+", choices=sorted(HANDLERS), help="Job kinds this worker takes")
+    parser.add_argument("--max-jobs", type=int, help="Stop after this many jobs")
+    parser.add_argument("--exit-when-empty", action="store_true", help="Stop once no jobs are pending")
+    parser.add_argument("--no-sync", action="store_true", help="Don't sync LanceDB when the queue drains (python -m src.sync_lancedb)")
+    parser.add_argument("--lease", type=int, default=LEASE_SECONDS, help="Lease duration in seconds")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue_db, lease_seconds=args.lease)
+    if args.command == "worker":
+        run_worker(queue, kinds=args.kinds, max_jobs=args.max_jobs, exit_when_empty=args.exit_when_empty, sync=not args.no_sync)
+    elif args.command == "enqueue-pdfs":
+        enqueue_pdfs(force=args.force, db_name=args.queue_db)
+    elif args.command == "enqueue-urls":
+        urls = list(args.urls)
+        if args.file:
+            with open(args.file, "r") as f:
+                urls += [line.strip() for line in f if line.strip()]
+        enqueue_urls(urls, db_name=args.queue_db)
+    elif args.command == "retry-failed":
+        print(f"Requeued {queue.retry_failed(args.kinds)} failed jobs.")
+    print_counts(queue)
@@ -0,0 +1,65 @@
+import os
+import sqlite3
+from src.blob_store import (
+    init_blob_store, put_file, put_stream, lookup, release_ref,
+    stage_done, mark_stage_done, materialize
+)
+
+def test_same_content_stored_once(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    blob_dir = os.path.join(tmp_path, "blobs")
+    init_blob_store(db_name)
+
+    path = os.path.join(tmp_path, "flood.pdf")
+    with open(path, "wb") as f:
+        f.write(b"%PDF flood guide")
+
+    h1, p1 = put_file(path, ref="raw/flood.pdf", db_name=db_name, blob_dir=blob_dir)
+    h2, p2 = put_stream([b"%PDF ", b"flood guide"], ref="https://example.org/flood.pdf", db_name=db_name, blob_dir=blob_dir)
+
+    assert h1 == h2 and p1 == p2
+    assert lookup("https://example.org/flood.pdf", db_name=db_name) == h1
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*), SUM(refcount) FROM blobs").fetchone() == (1, 2)
+    conn.close()
+
+    mark_stage_done(h1, "process_pdfs", ref="flood.pdf", db_name=db_name)
+    assert stage_done(h1, "process_pdfs", db_name=db_name) == "flood.pdf"
+    assert stage_done(h1, "ingest", db_name=db_name) is None
+
+    dest = materialize(h1, os.path.join(tmp_path, "raw", "flood.pdf"), db_name=db_name, blob_dir=blob_dir)
+    with open(dest, "rb") as f:
+        assert f.read() == b"%PDF flood guide"
+
+def test_blob_removed_when_unreferenced(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    blob_dir = os.path.join(tmp_path, "blobs")
+    init_blob_store(db_name)
+
+    old_hash, old_path = put_stream([b"v1"], ref="u", db_name=db_name, blob_dir=blob_dir)
+    mark_stage_done(old_hash, "ingest", ref="u", db_name=db_name)
+
+    # Pointing the ref at new content releases the old blob
+    new_hash, new_path = put_stream([b"v2"], ref="u", db_name=db_name, blob_dir=blob_dir)
+    assert not os.path.exists(old_path)
+    assert stage_done(old_hash, "ingest", db_name=db_name) is None
+
+    release_ref("u", db_name=db_name, blob_dir=blob_dir)
+    assert not os.path.exists(new_path)
+    assert lookup("u", db_name=db_name) is None
+
+def test_same_content_under_another_extension_shares_the_file(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    blob_dir = os.path.join(tmp_path, "blobs")
+    init_blob_store(db_name)
+
+    h1, p1 = put_stream([b"%PDF guide"], ref="https://example.org/guide.pdf", ext=".pdf", db_name=db_name, blob_dir=blob_dir)
+    h2, p2 = put_stream([b"%PDF guide"], ref="https://example.org/download?id=1", ext=".bin", db_name=db_name, blob_dir=blob_dir)
+    assert h1 == h2 and p1 == p2 and p1.endswith(".pdf")
+    assert os.listdir(os.path.dirname(p1)) == [os.path.basename(p1)]
+
+    # Released by both refs: nothing is left behind
+    release_ref("https://example.org/guide.pdf", db_name=db_name, blob_dir=blob_dir)
+    assert os.path.exists(p1)
+    release_ref("https://example.org/download?id=1", db_name=db_name, blob_dir=blob_dir)
+    assert os.listdir(os.path.dirname(p1)) == []
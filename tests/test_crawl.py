@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from src.fetch import FetchScheduler
+from src.crawl import crawl, canonicalize_url, mark_pdf_done, init_crawl, url_key, REVISIT_SECONDS
+
+SITE = {
+    "index.html": '<a href="a.html">A</a> <a href="b.html?utm_source=x">B</a> '
+                  '<a href="guide.pdf">Guide</a> <a href="https://example.org/x">External</a>',
+    "a.html": '<a href="deep.html">Deep</a> <a href="./guide.pdf">Guide again</a> '
+              '<a href="index.html#top">Home</a>',
+    "b.html": '<a href="/docs/../a.html">A again</a> <a href="b-guide.pdf">B guide</a>',
+    "deep.html": '<a href="deeper.pdf">Too deep</a>',
+    "guide.pdf": "%PDF-1.4",
+    "b-guide.pdf": "%PDF-1.4",
+}
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def _serve(root):
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _site(tmp_path):
+    root = tmp_path / "site"
+    root.mkdir()
+    for name, body in SITE.items():
+        (root / name).write_text(body)
+    return root
+
+def test_canonicalize_url():
+    assert canonicalize_url("HTTP://Example.COM:80/a/./b/../c?b=2&a=1&utm_source=x#frag") == \
+        "http://example.com/a/c?a=1&b=2"
+    assert canonicalize_url("mailto:someone@example.com") is None
+    assert canonicalize_url("b.html", "https://www.ready.gov/kit/") == "https://www.ready.gov/kit/b.html"
+
+def test_crawl_local_site(tmp_path):
+    server = _serve(_site(tmp_path))
+    base = f"http://127.0.0.1:{server.server_port}/"
+    db_name = os.path.join(tmp_path, "hazards.db")
+    scheduler = FetchScheduler(rate=100.0, burst=100)
+
+    # Left over from an interrupted crawl of another site
+    init_crawl(db_name)
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute("INSERT INTO crawl_frontier (url_hash, url, depth, site) VALUES (?, ?, 1, 'example.org')",
+                     (url_key("https://example.org/x"), "https://example.org/x"))
+    conn.close()
+
+    try:
+        found = crawl([base + "index.html"], max_depth=1, max_pages=10, workers=3,
+                      scheduler=scheduler, db_name=db_name)
+        assert sorted(found["pages"]) == sorted([base + "index.html", base + "a.html", base + "b.html"])
+        assert sorted(found["pdfs"]) == sorted([base + "guide.pdf", base + "b-guide.pdf"])
+
+        # Recrawl: only the seed is refetched; the PDF whose ingest failed is reported again
+        mark_pdf_done(base + "guide.pdf", db_name=db_name)
+        again = crawl([base + "index.html"], max_depth=1, max_pages=10,
+                      scheduler=scheduler, db_name=db_name)
+        assert again == {"pages": [base + "index.html"], "pdfs": [base + "b-guide.pdf"]}
+
+        # Pages beyond the old depth limit were never marked seen, so a deeper crawl finds them
+        deeper = crawl([base + "a.html"], max_depth=2, max_pages=10,
+                       scheduler=scheduler, db_name=db_name)
+        assert deeper == {"pages": [base + "a.html", base + "deep.html"],
+                          "pdfs": [base + "b-guide.pdf", base + "deeper.pdf"]}
+
+        # Once pages are older than the revisit TTL they are fetched again and new links found
+        (tmp_path / "site" / "b.html").write_text(SITE["b.html"] + '<a href="new.pdf">New</a>')
+        conn = sqlite3.connect(db_name)
+        with conn:
+            conn.execute("UPDATE crawl_seen SET fetched_at = fetched_at - ?", (REVISIT_SECONDS + 1,))
+            other = conn.execute("SELECT url FROM crawl_frontier WHERE site = 'example.org'").fetchall()
+        conn.close()
+        assert other == [("https://example.org/x",)]
+        revisit = crawl([base + "index.html"], max_depth=1, max_pages=10,
+                        scheduler=scheduler, db_name=db_name)
+        assert sorted(revisit["pages"]) == sorted([base + "index.html", base + "a.html", base + "b.html"])
+        assert base + "new.pdf" in revisit["pdfs"]
+    finally:
+        server.shutdown()
+
+def test_page_budget_leaves_frontier_for_next_run(tmp_path):
+    server = _serve(_site(tmp_path))
+    base = f"http://127.0.0.1:{server.server_port}/"
+    db_name = os.path.join(tmp_path, "hazards.db")
+    scheduler = FetchScheduler(rate=100.0, burst=100)
+
+    try:
+        first = crawl([base + "index.html"], max_depth=2, max_pages=1, scheduler=scheduler, db_name=db_name)
+        assert first["pages"] == [base + "index.html"]
+
+        conn = sqlite3.connect(db_name)
+        pending = {row[0] for row in conn.execute("SELECT url FROM crawl_frontier")}
+        conn.close()
+        assert pending == {base + "a.html", base + "b.html"}
+
+        rest = crawl([], max_depth=2, max_pages=10, scheduler=scheduler, db_name=db_name)
+        assert sorted(rest["pages"]) == sorted([base + "a.html", base + "b.html", base + "deep.html"])
+        assert base + "deeper.pdf" in rest["pdfs"]
+    finally:
+        server.shutdown()
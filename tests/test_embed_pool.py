@@ -0,0 +1,30 @@
+import os
+import numpy as np
+from src.embed_pool import EmbeddingPool, benchmark, best_layout, candidate_layouts
+
+class FakeModel:
+    def encode(self, texts, batch_size=32):
+        # Deterministic per text, and reports the worker's pinned thread count
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), float(os.environ["OMP_NUM_THREADS"])] for t in texts]
+
+def load_fake_model():
+    return FakeModel()
+
+def test_pool_preserves_order():
+    texts = [f"text number {i}" * (i % 5 + 1) for i in range(50)]
+    with EmbeddingPool(workers=3, threads=2, chunk_size=4, loader=load_fake_model) as pool:
+        vectors = pool.encode(texts)
+
+    expected = np.asarray([[float(len(t)), float(sum(map(ord, t)) % 97), 2.0] for t in texts], dtype=np.float32)
+    assert vectors.shape == (50, 3)
+    assert np.array_equal(vectors, expected)
+
+def test_benchmark_saves_best_layout(tmp_path):
+    save_path = os.path.join(tmp_path, "embed_pool.json")
+    results = benchmark(["a", "bb", "ccc"] * 4, layouts=[(1, 1), (2, 1)], chunk_size=2,
+                        loader=load_fake_model, save_path=save_path)
+
+    assert len(results) == 2
+    best = results[0]
+    assert best_layout(save_path) == (best["workers"], best["threads"])
+    assert (os.cpu_count() // 1, 1) in candidate_layouts()
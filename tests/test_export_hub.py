@@ -0,0 +1,255 @@
+import os
+import json
+import sqlite3
+import pandas as pd
+import pyarrow.parquet as pq
+from src.store import init_db, save_structured_document, upsert_document
+from src import export
+from src.export import export_delta, export_sharded, export_to_hf_dataset, load_manifest, sharded_manifest_path
+from src.model_config import save_model_config
+from src.sync_lancedb import LanceDBSync
+
+class FakeHubApi:
+    """
+    Local stand-in for huggingface_hub.HfApi that keeps uploaded files in memory.
+    """
+    def __init__(self, fail_paths=None):
+        self.files = {}
+        self.uploads = []
+        self.commits = []
+        self.fail_paths = set(fail_paths or [])
+
+    def create_repo(self, repo_id, repo_type=None, exist_ok=False):
+        pass
+
+    def upload_file(self, path_or_fileobj, path_in_repo, repo_id, repo_type=None):
+        if path_in_repo in self.fail_paths:
+            self.fail_paths.discard(path_in_repo)
+            raise ConnectionError("upload failed")
+        with open(path_or_fileobj, "rb") as f:
+            self.files[path_in_repo] = f.read()
+        self.uploads.append(path_in_repo)
+
+    def delete_file(self, path_in_repo, repo_id, repo_type=None):
+        self.files.pop(path_in_repo, None)
+
+    def preupload_lfs_files(self, repo_id, additions, repo_type=None):
+        for op in additions:
+            if op.path_in_repo in self.fail_paths:
+                self.fail_paths.discard(op.path_in_repo)
+                raise ConnectionError("upload failed")
+            self.uploads.append(op.path_in_repo)
+
+    def list_repo_files(self, repo_id, repo_type=None):
+        return list(self.files)
+
+    def create_commit(self, repo_id, operations, commit_message, repo_type=None):
+        for op in operations:
+            if hasattr(op, "path_or_fileobj"):
+                with open(op.path_or_fileobj, "rb") as f:
+                    self.files[op.path_in_repo] = f.read()
+            else:
+                self.files.pop(op.path_in_repo, None)
+        self.commits.append(commit_message)
+
+def _add_rows(db_name, start, count):
+    for i in range(start, start + count):
+        record = {
+            "hazard_type": "Flood",
+            "phase": "Prepare",
+            "audience": "General",
+            "content_raw": f"page {i}",
+            "source_file": "flood.pdf",
+            "page_ref": i,
+        }
+        save_structured_document(record, [0.5, 0.25], db_name=db_name)
+
+def _shard_rows(output_path, shards):
+    frames = [pd.read_parquet(os.path.join(output_path, s["path"])) for s in shards]
+    return pd.concat(frames)["page_ref"].tolist()
+
+def test_full_export_streams_chunks_with_varying_metadata(tmp_path, monkeypatch):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_db(db_name)
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 2)
+    for i in range(5):
+        # Later chunks add a metadata key the first chunk does not have
+        metadata = {"n": i, "content_hash": f"h{i}"} if i >= 3 else {"n": i}
+        upsert_document(f"https://example.com/{i}", "text/html", f"text {i}", [0.5, 0.25], metadata, db_name=db_name)
+
+    ds = export_to_hf_dataset(output_path=os.path.join(tmp_path, "hf"), db_name=db_name)
+    assert ds.num_rows == 5
+    assert ds[0]["metadata"] == {"n": 0, "content_hash": None}
+    assert ds[4]["metadata"] == {"n": 4, "content_hash": "h4"}
+    assert ds[4]["embedding"] == [0.5, 0.25]
+
+    _add_rows(db_name, 0, 3)
+    ds = export_to_hf_dataset(output_path=os.path.join(tmp_path, "hf_structured"), structured=True,
+                              where=["page_ref=1,2"], columns=["page_ref", "action_items"], db_name=db_name)
+    assert ds.column_names == ["page_ref", "action_items"]
+    assert ds["page_ref"] == [1, 2]
+    assert export_to_hf_dataset(output_path=os.path.join(tmp_path, "none"), structured=True,
+                                where=["page_ref=9"], db_name=db_name) is None
+
+    # The LanceDB copy streams in batches the same way
+    uri = os.path.join(tmp_path, "lancedb")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "fake", "dim": 2, "version": 0, "tables": {}}, config_path)
+    LanceDBSync(db_name, uri, config_path).sync(maintain=False)
+    kwargs = dict(use_lancedb=True, db_name=db_name, lancedb_uri=uri, config_path=config_path)
+    ds = export_to_hf_dataset(output_path=os.path.join(tmp_path, "hf_lancedb"), **kwargs)
+    assert ds.num_rows == 5
+    assert sorted(ds["metadata"], key=lambda m: m["n"])[4] == {"n": 4, "content_hash": "h4"}
+    assert ds[0]["embedding"] == [0.5, 0.25]
+    ds = export_to_hf_dataset(output_path=os.path.join(tmp_path, "hf_lancedb_structured"), structured=True,
+                              where=["hazard_type=Flood"], columns=["page_ref", "embedding"], **kwargs)
+    assert ds.column_names == ["page_ref", "embedding"]
+    assert sorted(ds["page_ref"]) == [0, 1, 2]
+    assert export_to_hf_dataset(output_path=os.path.join(tmp_path, "none_lancedb"), structured=True,
+                                where=["hazard_type=Heat"], **kwargs) is None
+
+def test_delta_export_and_push(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    output_path = os.path.join(tmp_path, "hf_dataset_delta")
+    init_db(db_name)
+    api = FakeHubApi()
+
+    _add_rows(db_name, 1, 5)
+    first = export_delta(output_path, structured=True, push_to_hub=True, repo_id="user/hazards",
+                         api=api, db_name=db_name, shard_rows=2)
+    assert len(first) == 3
+    assert _shard_rows(output_path, first) == [1, 2, 3, 4, 5]
+    assert sorted(api.uploads) == sorted([s["path"] for s in first] + ["manifest.json"])
+
+    # Nothing new: no shards, only the manifest is re-uploaded
+    api.uploads.clear()
+    assert export_delta(output_path, structured=True, push_to_hub=True, repo_id="user/hazards",
+                        api=api, db_name=db_name) == []
+    assert api.uploads == ["manifest.json"]
+
+    _add_rows(db_name, 6, 2)
+    api.uploads.clear()
+    second = export_delta(output_path, structured=True, push_to_hub=True, repo_id="user/hazards",
+                          api=api, db_name=db_name)
+    assert _shard_rows(output_path, second) == [6, 7]
+    assert api.uploads == [second[0]["path"], "manifest.json"]
+
+    manifest = load_manifest(output_path)
+    shards = manifest["tables"]["sqlite/structured_hazards"]["shards"]
+    assert len(shards) == 4 and all(s["pushed"] for s in shards)
+    assert embedding_roundtrip(output_path, shards[0])
+
+def embedding_roundtrip(output_path, shard):
+    df = pd.read_parquet(os.path.join(output_path, shard["path"]))
+    return list(df["embedding"].iloc[0]) == [0.5, 0.25]
+
+def test_failed_upload_is_retried(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    output_path = os.path.join(tmp_path, "hf_dataset_delta")
+    init_db(db_name)
+
+    _add_rows(db_name, 1, 2)
+    api = FakeHubApi()
+    shards = export_delta(output_path, structured=True, db_name=db_name)
+    api.fail_paths.add(shards[0]["path"])
+
+    from src.export import push_delta
+    assert push_delta(output_path, "user/hazards", api=api) == 0
+    assert push_delta(output_path, "user/hazards", api=api) == 1
+    assert shards[0]["path"] in api.files
+
+def test_lancedb_delta_exports_updates_and_deletes(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    uri = os.path.join(tmp_path, "lancedb")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    output_path = os.path.join(tmp_path, "hf_dataset_delta")
+    save_model_config({"model": "fake", "dim": 2, "version": 0, "tables": {}}, config_path)
+    init_db(db_name)
+    syncer = LanceDBSync(db_name, uri, config_path)
+    kwargs = dict(use_lancedb=True, structured=True, db_name=db_name, lancedb_uri=uri, config_path=config_path)
+
+    _add_rows(db_name, 1, 3)
+    syncer.sync(maintain=False)
+    base = export_delta(output_path, **kwargs)
+    assert _shard_rows(output_path, base) == [1, 2, 3]
+
+    # Same row count, different content: an update and a delete plus an insert
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute("UPDATE structured_hazards SET topic = 'Sandbags' WHERE page_ref = 2")
+        conn.execute("DELETE FROM structured_hazards WHERE page_ref = 3")
+    conn.close()
+    _add_rows(db_name, 4, 1)
+    # Not synced yet: LanceDB still serves the old rows, nothing to export
+    assert export_delta(output_path, **kwargs) == []
+    syncer.sync(maintain=False)
+
+    delta = export_delta(output_path, **kwargs)
+    df = pd.concat([pd.read_parquet(os.path.join(output_path, s["path"])) for s in delta])
+    assert df["page_ref"].tolist() == [2, 4]
+    assert df["topic"].tolist()[0] == "Sandbags"
+    state = load_manifest(output_path)["tables"]["lancedb/structured_hazards"]
+    assert [d["ids"] for d in state["deletes"]] == [[3]]
+    assert state["deletes"][0]["seq"] == delta[0]["seq"] > base[0]["seq"]
+    assert export_delta(output_path, **kwargs) == []
+
+def test_sharded_export_uploads_every_shard(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    output_path = os.path.join(tmp_path, "hf_dataset_sharded")
+    init_db(db_name)
+    _add_rows(db_name, 1, 7)
+    record = {"hazard_type": "Wildfire", "phase": "Prepare", "audience": "General", "content_raw": "fire",
+              "source_file": "fire.pdf", "page_ref": 100, "action_items": ["Clear brush"]}
+    save_structured_document(record, [1.0, 0.0], db_name=db_name)
+
+    # Every shard fails once and is retried within the same push
+    api = FakeHubApi(fail_paths=[f"sharded/structured_hazards/part-{i:05d}.parquet" for i in range(3)])
+    # Files of the delta export live next to the shards and are left alone
+    api.files = {"manifest.json": b"{}", "data/structured_hazards/sqlite-1-00000.parquet": b"delta"}
+    shards = export_sharded(output_path, structured=True, push_to_hub=True, repo_id="user/hazards", api=api,
+                            db_name=db_name, shard_rows=3, row_group_rows=2, workers=2, backoff=0)
+    assert [s["rows"] for s in shards] == [3, 3, 2]
+    assert all(s["pushed"] for s in shards)
+    assert sorted(api.uploads) == [s["path"] for s in shards]
+    # Shards and manifest land in a single commit
+    assert len(api.commits) == 1
+    assert sorted(api.files) == sorted([s["path"] for s in shards] + [sharded_manifest_path("structured_hazards"), "manifest.json",
+                                                                     "data/structured_hazards/sqlite-1-00000.parquet"])
+    for s in shards:
+        with open(os.path.join(output_path, s["path"]), "rb") as f:
+            assert api.files[s["path"]] == f.read()
+        metadata = pq.ParquetFile(os.path.join(output_path, s["path"])).metadata
+        assert metadata.row_group(0).column(0).compression == "ZSTD"
+        assert metadata.num_row_groups == (s["rows"] + 1) // 2
+
+    df = pd.concat([pd.read_parquet(os.path.join(output_path, s["path"])) for s in shards])
+    assert df["page_ref"].tolist() == [1, 2, 3, 4, 5, 6, 7, 100]
+    assert list(df["embedding"].iloc[-1]) == [1.0, 0.0]
+    assert df["action_items"].iloc[-1] == '["Clear brush"]'
+
+    # Per-hazard partitions replace the previous shards, locally and on the Hub
+    shards = export_sharded(output_path, structured=True, partition_by="hazard_type", push_to_hub=True,
+                            repo_id="user/hazards", api=api, db_name=db_name, workers=2)
+    assert [s["path"] for s in shards] == ["sharded/structured_hazards/hazard_type=flood/part-00000.parquet",
+                                           "sharded/structured_hazards/hazard_type=wildfire/part-00000.parquet"]
+    assert [s["rows"] for s in shards] == [7, 1]
+    assert sorted(os.listdir(os.path.join(output_path, "sharded", "structured_hazards"))) == \
+        ["hazard_type=flood", "hazard_type=wildfire", "sharded_manifest.json"]
+    assert len(api.commits) == 2
+    assert sorted(api.files) == sorted([s["path"] for s in shards] + [sharded_manifest_path("structured_hazards"), "manifest.json",
+                                                                     "data/structured_hazards/sqlite-1-00000.parquet"])
+    assert api.files["manifest.json"] == b"{}"
+    manifest_path = sharded_manifest_path("structured_hazards")
+    with open(os.path.join(output_path, manifest_path), "rb") as f:
+        assert api.files[manifest_path] == f.read()
+    manifest = json.loads(api.files[manifest_path])
+    assert [s["path"] for s in manifest["shards"]] == [s["path"] for s in shards]
+    assert all("pushed" not in s for s in manifest["shards"])
+
+    # The documents export keeps its own manifest and leaves these shards alone
+    upsert_document("https://example.com/a", "text/html", "text", [0.5, 0.25], {}, db_name=db_name)
+    docs = export_sharded(output_path, push_to_hub=True, repo_id="user/hazards", api=api, db_name=db_name)
+    assert docs[0]["path"] == "sharded/documents/part-00000.parquet" and docs[0]["pushed"]
+    assert api.files[manifest_path] == json.dumps(manifest, indent=2).encode()
+    assert sharded_manifest_path("documents") in api.files
+    assert all(s["path"] in api.files for s in shards)
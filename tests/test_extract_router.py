@@ -0,0 +1,85 @@
+import os
+import pytest
+import pymupdf
+from src.extract_router import iter_markdown_pages, probe_pdf, choose_route, _page_to_markdown
+
+def _make_pdf(path, pages):
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Marker page {i + 1}", fontsize=11)
+    doc.save(path)
+    doc.close()
+
+def test_split_ranges_come_back_complete_and_in_order(tmp_path):
+    pdf_path = os.path.join(tmp_path, "large.pdf")
+    _make_pdf(pdf_path, 11)
+
+    pages = list(iter_markdown_pages(pdf_path, split_threshold=4, range_size=3, workers=2))
+    assert [p["metadata"]["page"] for p in pages] == list(range(1, 12))
+    assert all(f"Marker page {i + 1}" in p["text"] for i, p in enumerate(pages))
+
+def test_worker_failure_propagates(tmp_path):
+    pdf_path = os.path.join(tmp_path, "large.pdf")
+    _make_pdf(pdf_path, 12)
+
+    pages = iter_markdown_pages(pdf_path, split_threshold=4, range_size=3, workers=1)
+    assert next(pages)["metadata"]["page"] == 1
+    # Ranges submitted from now on fail to open the file
+    with open(pdf_path, "wb") as f:
+        f.write(b"not a pdf")
+    with pytest.raises(Exception):
+        list(pages)
+
+BODY = "Store water, food and medicine for at least three days before a flood warning. " * 4
+
+def _text_pdf(path, pages=3):
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), "Flood Preparedness", fontsize=20)
+        page.insert_textbox(pymupdf.Rect(72, 100, 540, 700), BODY, fontsize=11)
+    doc.save(path)
+    doc.close()
+
+def _scanned_pdf(path, pages=2):
+    doc = pymupdf.open()
+    pixmap = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 100, 130), 0)
+    pixmap.set_rect(pixmap.irect, (200, 200, 200))
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_image(page.rect, pixmap=pixmap)
+    doc.save(path)
+    doc.close()
+
+def test_probe_routes_text_layer_and_scanned_pdfs(tmp_path):
+    text_path = os.path.join(tmp_path, "text.pdf")
+    scanned_path = os.path.join(tmp_path, "scanned.pdf")
+    _text_pdf(text_path)
+    _scanned_pdf(scanned_path)
+
+    probe = probe_pdf(text_path)
+    assert probe["page_count"] == 3 and probe["sampled"] == 3
+    assert probe["chars_per_page"] > 200 and probe["image_coverage"] == 0
+    assert choose_route(probe) == ("text", "plain text layer")
+
+    probe = probe_pdf(scanned_path)
+    assert probe["chars_per_page"] == 0 and probe["image_coverage"] > 0.9
+    assert choose_route(probe)[0] == "layout"
+
+def test_choose_route_thresholds():
+    good = {"sampled": 5, "chars_per_page": 1500, "multi_column_pages": 0, "table_pages": 0, "image_coverage": 0}
+    assert choose_route(good)[0] == "text"
+    assert choose_route({"page_count": 0, "sampled": 0}) == ("layout", "empty document")
+    assert choose_route({**good, "multi_column_pages": 0.6}) == ("layout", "multi-column layout")
+    assert choose_route({**good, "table_pages": 0.4}) == ("layout", "tables")
+    assert choose_route({**good, "image_coverage": 0.5})[1].startswith("image heavy")
+
+def test_page_to_markdown_marks_large_lines_as_headers(tmp_path):
+    path = os.path.join(tmp_path, "text.pdf")
+    _text_pdf(path, pages=1)
+    with pymupdf.open(path) as doc:
+        markdown = _page_to_markdown(doc[0])
+    lines = [line for line in markdown.splitlines() if line]
+    assert lines[0] == "# Flood Preparedness"
+    assert lines[1].startswith("Store water") and not any(line.startswith("# Store") for line in lines)
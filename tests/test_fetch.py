@@ -0,0 +1,98 @@
+import requests
+from src.fetch import FetchScheduler, HostState, parse_retry_after
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeSession:
+    """
+    Replays a scripted list of responses / exceptions.
+    """
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url))
+        item = self.script.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+def test_retries_and_honors_retry_after():
+    sleeps = []
+    session = FakeSession([
+        FakeResponse(429, {"Retry-After": "1"}),
+        requests.ConnectionError("reset"),
+        FakeResponse(200),
+    ])
+    scheduler = FetchScheduler(session=session, sleep=sleeps.append, rate=100.0)
+
+    response = scheduler.get("https://www.ready.gov/floods")
+
+    assert response.status_code == 200
+    assert len(session.calls) == 3
+    assert sleeps[0] >= 1
+    host = scheduler.host("https://www.ready.gov/")
+    assert host.failures == 2 and host.successes == 1
+
+def test_long_retry_after_returns_the_response():
+    for value in ("3600", "Fri, 31 Dec 2100 23:59:59 GMT"):
+        sleeps = []
+        session = FakeSession([FakeResponse(503, {"Retry-After": value}), FakeResponse(200)])
+        scheduler = FetchScheduler(session=session, sleep=sleeps.append, rate=100.0, retry_after_max=300.0)
+
+        response = scheduler.get("https://www.fema.gov/")
+        assert response.status_code == 503
+        assert len(session.calls) == 1 and sleeps == []
+        # The host is not held either
+        assert scheduler.host("https://www.fema.gov/").blocked_until == 0.0
+
+def test_gives_up_after_max_retries():
+    session = FakeSession([FakeResponse(503)] * 3)
+    scheduler = FetchScheduler(session=session, max_retries=2, sleep=lambda s: None, rate=100.0)
+
+    response = scheduler.get("https://www.fema.gov/")
+    assert response.status_code == 503
+    assert len(session.calls) == 3
+
+    session = FakeSession([requests.Timeout("slow")] * 2)
+    scheduler = FetchScheduler(session=session, max_retries=1, sleep=lambda s: None, rate=100.0)
+    try:
+        scheduler.get("https://www.fema.gov/")
+        assert False, "expected Timeout"
+    except requests.Timeout:
+        pass
+
+def test_host_state_adapts():
+    host = HostState(rate=2.0, burst=20, concurrency=4)
+    host.acquire()
+    host.release(latency=0.1, ok=False)
+    assert host.limit == 2 and host.rate == 1.0
+
+    for _ in range(10):
+        host.acquire()
+        host.release(latency=0.1, ok=True)
+    assert host.limit > 2 and host.rate > 1.0
+
+def test_token_bucket_limits_rate():
+    now = [0.0]
+    host = HostState(rate=1.0, burst=2, concurrency=8, clock=lambda: now[0])
+    host.acquire()
+    host.acquire()
+    assert host._wait_time(now[0]) == 1.0
+    now[0] += 1.0
+    host._refill(now[0])
+    assert host._wait_time(now[0]) == 0
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,40 @@
+import os
+import pytest
+from src.markdown_cache import iter_cached_pages, has_pages, cache_path
+
+HASH = "ab" * 32
+
+def _pages(n, calls):
+    def convert():
+        calls.append(1)
+        for i in range(n):
+            yield {"text": f"page {i + 1}", "metadata": {"page": i + 1}}
+    return convert
+
+def test_miss_writes_through_and_hit_skips_conversion(tmp_path):
+    calls = []
+    assert not has_pages(HASH, "v1", tmp_path)
+    first = list(iter_cached_pages(HASH, "v1", _pages(3, calls), tmp_path))
+    assert [p["text"] for p in first] == ["page 1", "page 2", "page 3"]
+    assert has_pages(HASH, "v1", tmp_path) and len(calls) == 1
+
+    assert list(iter_cached_pages(HASH, "v1", _pages(3, calls), tmp_path)) == first
+    assert len(calls) == 1
+    # Another converter version is a separate entry
+    list(iter_cached_pages(HASH, "v2", _pages(1, calls), tmp_path))
+    assert len(calls) == 2
+
+def test_interrupted_iteration_leaves_no_entry(tmp_path):
+    calls = []
+    pages = iter_cached_pages(HASH, "v1", _pages(3, calls), tmp_path)
+    next(pages)
+    pages.close()
+    assert not has_pages(HASH, "v1", tmp_path)
+    assert os.listdir(os.path.dirname(cache_path(HASH, "v1", tmp_path))) == []
+
+    def failing():
+        yield {"text": "page 1", "metadata": {"page": 1}}
+        raise RuntimeError("conversion failed")
+    with pytest.raises(RuntimeError):
+        list(iter_cached_pages(HASH, "v1", failing, tmp_path))
+    assert os.listdir(os.path.dirname(cache_path(HASH, "v1", tmp_path))) == []
@@ -0,0 +1,38 @@
+from src.memory import MemoryBudget, parse_size, rss_bytes
+
+def test_parse_size():
+    assert parse_size("512M") == 512 * 1024 ** 2
+    assert parse_size("2G") == 2 * 1024 ** 3
+    assert parse_size("1.5GB") == int(1.5 * 1024 ** 3)
+    try:
+        parse_size("lots")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+def test_adapt_shrinks_under_pressure_and_recovers():
+    unlimited = MemoryBudget()
+    assert unlimited.adapt("embed", 32) == 32
+
+    # Budget already exceeded: every call halves, down to the minimum
+    tight = MemoryBudget(limit=rss_bytes() // 2)
+    sizes = [tight.adapt("embed", 32, minimum=4) for _ in range(5)]
+    assert sizes == [16, 8, 4, 4, 4]
+
+    # Plenty of headroom: sizes double back to the default
+    tight.limit = rss_bytes() * 10
+    assert [tight.adapt("embed", 32) for _ in range(4)] == [8, 16, 32, 32]
+
+def test_stage_records_peaks():
+    budget = MemoryBudget(limit=rss_bytes() * 10).start()
+    try:
+        with budget.stage("export"):
+            with budget.stage("embed"):
+                data = [bytes(1024) for _ in range(2000)]
+            del data
+    finally:
+        budget.stop()
+
+    assert budget.stages["export"]["peak_rss"] > 0
+    assert budget.stages["embed"]["peak_traced"] >= 2000 * 1024
+    assert budget.stages["export"]["peak_traced"] >= budget.stages["embed"]["peak_traced"]
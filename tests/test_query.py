@@ -0,0 +1,139 @@
+import os
+import json
+import sqlite3
+from src.store import init_db, save_structured_document, save_structured_documents, delete_structured_by_source, normalize_links
+from src.query import parse_where, facet_counts, iter_rows, hazards_citing
+
+def _populate(db_name):
+    init_db(db_name)
+    rows = [
+        ("Flood", "Prepare", "General", "flood.pdf", 1),
+        ("Flood", "React", "Kids", "flood.pdf", 2),
+        ("Flood", "Prepare", "Pets", "flood.pdf", 3),
+        ("Wildfire", "Recover", "General", "wildfire.pdf", 1),
+    ]
+    for hazard_type, phase, audience, source_file, page_ref in rows:
+        record = {
+            "hazard_type": hazard_type,
+            "phase": phase,
+            "audience": audience,
+            "content_raw": f"{hazard_type} page {page_ref}",
+            "source_file": source_file,
+            "page_ref": page_ref,
+        }
+        save_structured_document(record, [0.1, 0.2], db_name=db_name)
+
+def test_indexes_created(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_db(db_name)
+
+    conn = sqlite3.connect(db_name)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM structured_hazards WHERE hazard_type = ? AND phase = ?",
+        ("Flood", "Prepare")
+    ).fetchall()
+    conn.close()
+
+    assert "idx_structured_hazards_facets" in indexes
+    assert "idx_structured_hazards_source" in indexes
+    assert any("idx_structured_hazards_facets" in row[-1] for row in plan)
+
+def test_facet_counts(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    _populate(db_name)
+
+    facets = facet_counts(db_name=db_name)
+    assert facets["hazard_type"] == {"Flood": 3, "Wildfire": 1}
+    assert facets["phase"]["Prepare"] == 2
+
+    flood = facet_counts(filters={"hazard_type": ["Flood"]}, db_name=db_name)
+    assert flood["audience"] == {"General": 1, "Kids": 1, "Pets": 1}
+
+def test_iter_rows_filters_and_projection(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    _populate(db_name)
+
+    filters = parse_where(["hazard_type=Flood", "phase=Prepare,React"])
+    rows = list(iter_rows(filters, columns=["hazard_type", "page_ref"], batch_size=1, db_name=db_name))
+
+    rows.sort(key=lambda r: r["page_ref"])
+    assert rows == [
+        {"hazard_type": "Flood", "page_ref": 1},
+        {"hazard_type": "Flood", "page_ref": 2},
+        {"hazard_type": "Flood", "page_ref": 3},
+    ]
+
+def test_rejects_unknown_columns(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    _populate(db_name)
+
+    try:
+        list(iter_rows({"hazard_type; DROP TABLE x": ["a"]}, db_name=db_name))
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+    try:
+        parse_where(["phase"])
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+def test_sources_and_action_items_are_shared(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_db(db_name)
+    fema = {"title": "FEMA", "url": "https://www.fema.gov/flood"}
+    records = [
+        {"hazard_type": "Flood", "phase": "Prepare", "content_raw": "a", "source_file": "flood.pdf", "page_ref": 1,
+         "action_items": ["Build a kit", "Make a plan"],
+         "sources": [{"title": "Ready", "url": "https://www.ready.gov/floods"}, fema]},
+        {"hazard_type": "Wildfire", "phase": "Prepare", "content_raw": "b", "source_file": "fire.pdf", "page_ref": 1,
+         "action_items": ["Build a kit"],
+         "sources": [{"title": "ready.gov", "url": "https://www.ready.gov/floods"},
+                     {"title": "Kids", "url": "https://kids.ready.gov/"}]},
+        {"hazard_type": "Heat", "phase": "React", "content_raw": "c", "source_file": "heat.pdf", "page_ref": 1,
+         "action_items": [], "sources": [fema]},
+    ]
+    save_structured_documents(records, [[0.1, 0.2]] * 3, db_name=db_name)
+
+    conn = sqlite3.connect(db_name)
+    counts = [conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("sources", "action_items")]
+    inline = conn.execute("SELECT COUNT(*) FROM structured_hazards WHERE sources IS NOT NULL").fetchone()[0]
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM sources WHERE domain_rev > ? AND domain_rev < ?",
+                        ("gov.ready.", "gov.ready/")).fetchall()
+    conn.close()
+    assert counts == [3, 2] and inline == 0
+    assert any("idx_sources_domain_rev" in row[-1] for row in plan)
+
+    assert hazards_citing("ready.gov", db_name=db_name) == {"Flood": 1, "Wildfire": 1}
+    assert hazards_citing("www.fema.gov", db_name=db_name) == {"Flood": 1, "Heat": 1}
+    assert hazards_citing("kids.ready.gov", db_name=db_name) == {"Wildfire": 1}
+    assert hazards_citing("ready.gov", include_subdomains=False, db_name=db_name) == {"Flood": 1, "Wildfire": 1}
+
+    # Rows read back carry the same JSON that was saved, per-page titles included
+    rows = {r["hazard_type"]: r for r in iter_rows(columns=["hazard_type", "action_items", "sources"], db_name=db_name)}
+    for record in records:
+        row = rows[record["hazard_type"]]
+        assert set(row) == {"hazard_type", "action_items", "sources"}
+        assert row["action_items"] == json.dumps(record["action_items"])
+        assert row["sources"] == json.dumps(record["sources"])
+
+    delete_structured_by_source("flood.pdf", db_name=db_name)
+    assert hazards_citing("ready.gov", db_name=db_name) == {"Wildfire": 1}
+
+def test_normalize_links_migrates_inline_json(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_db(db_name)
+    sources = [{"title": "CDC", "url": "https://www.cdc.gov/heat"}]
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute("INSERT INTO structured_hazards (hazard_type, action_items, sources) VALUES (?, ?, ?)",
+                     ("Heat", json.dumps(["Drink water"]), json.dumps(sources)))
+    conn.close()
+
+    assert normalize_links(db_name) == 1
+    assert normalize_links(db_name) == 0
+    assert hazards_citing("cdc.gov", db_name=db_name) == {"Heat": 1}
+    row = next(iter_rows(db_name=db_name))
+    assert row["action_items"] == json.dumps(["Drink water"]) and row["sources"] == json.dumps(sources)
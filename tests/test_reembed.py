@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import lancedb
+import numpy as np
+import pytest
+from src import embed, reembed
+from src.store import init_db, save_structured_documents
+from src.model_config import load_model_config, save_model_config
+from src.sync_lancedb import LanceDBSync
+from src.reembed import Reembedder
+
+def fake_embed(texts):
+    # 4-dim "model": length and checksum of the text
+    return [np.array([len(t), sum(map(ord, t)) % 101, 1, 0], dtype=np.float32) for t in texts]
+
+def _setup(tmp_path, rows=5):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    uri = os.path.join(tmp_path, "lancedb")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "old-model", "dim": 3, "version": 0, "tables": {}}, config_path)
+    init_db(db_name)
+    records = [{"hazard_type": "Flood", "phase": "Prepare", "topic": "Kits", "content_raw": f"page {i}",
+                "source_file": "flood.pdf", "page_ref": i} for i in range(rows)]
+    save_structured_documents(records, [[0.5] * 3] * rows, db_name=db_name)
+    LanceDBSync(db_name, uri, config_path).sync(("structured_hazards",), maintain=False)
+    return db_name, uri, config_path, records
+
+def _reembedder(db_name, uri, config_path):
+    return Reembedder("fake-model", tables=("structured_hazards",), batch_rows=2, embed_fn=fake_embed,
+                      db_name=db_name, lancedb_uri=uri, config_path=config_path)
+
+def _sqlite_vectors(db_name):
+    conn = sqlite3.connect(db_name)
+    rows = conn.execute("SELECT content_raw, embedding FROM structured_hazards ORDER BY id").fetchall()
+    conn.close()
+    return [(text, np.frombuffer(blob, dtype=np.float32)) for text, blob in rows]
+
+def test_reembed_resumes_and_switches(tmp_path):
+    db_name, uri, config_path, records = _setup(tmp_path)
+
+    # Stage only: the old model and vectors stay active
+    assert _reembedder(db_name, uri, config_path).run(switch=False) is False
+    assert load_model_config(config_path)["model"] == "old-model"
+    assert all(len(v) == 3 for _, v in _sqlite_vectors(db_name))
+
+    # A row added after staging is picked up by the resumed pass
+    save_structured_documents([dict(records[0], content_raw="late page", page_ref=99)], [[0.5] * 3], db_name=db_name)
+    job = _reembedder(db_name, uri, config_path)
+    assert job.version == 1
+    assert job.run() is True
+
+    config = load_model_config(config_path)
+    assert config["model"] == "fake-model"
+    assert config["dim"] == 4
+    assert config["tables"] == {"structured_hazards": "structured_hazards_v1"}
+
+    rows = _sqlite_vectors(db_name)
+    conn = sqlite3.connect(db_name)
+    staging = conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%_embedding_v%'").fetchall()
+    conn.close()
+    assert len(rows) == 6 and staging == []
+    assert rows[-1][1][0] == len("Flood Prepare Kits late page")
+
+    # LanceDB is rebuilt from SQLite under the new physical table, the old one dropped
+    db = lancedb.connect(uri)
+    assert "structured_hazards" not in db.table_names()
+    new = db.open_table("structured_hazards_v1").to_pandas()
+    assert len(new) == 6 and len(new["vector"][0]) == 4
+
+def test_interrupted_switch_finishes_with_the_config(tmp_path, monkeypatch):
+    db_name, uri, config_path, _ = _setup(tmp_path)
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    # Killed after the SQLite swap committed, before the config rename
+    monkeypatch.setattr(reembed, "save_model_config", crash)
+    with pytest.raises(KeyboardInterrupt):
+        _reembedder(db_name, uri, config_path).run()
+    assert load_model_config(config_path)["model"] == "old-model"
+    swapped = _sqlite_vectors(db_name)
+    assert all(len(v) == 4 for _, v in swapped)
+
+    # The rerun finds the vectors swapped and only writes the config
+    monkeypatch.undo()
+    embedded = []
+    job = _reembedder(db_name, uri, config_path)
+    job.embed_fn = lambda texts: embedded.extend(texts) or fake_embed(texts)
+    assert job.version == 1 and job.run() is True
+    assert embedded == []
+    config = load_model_config(config_path)
+    assert (config["model"], config["dim"], config["version"]) == ("fake-model", 4, 1)
+    assert [v.tolist() for _, v in _sqlite_vectors(db_name)] == [v.tolist() for _, v in swapped]
+
+def test_active_model_is_reread_only_when_the_config_changes(tmp_path, monkeypatch):
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "old-model", "dim": 3, "version": 0, "tables": {}}, config_path)
+    reads = []
+    monkeypatch.setattr(embed, "load_model_config", lambda path: reads.append(path) or load_model_config(path))
+
+    assert embed.active_model_name(config_path) == "old-model"
+    assert embed.active_model_name(config_path) == "old-model"
+    assert len(reads) == 1
+
+    save_model_config({"model": "fake-model", "dim": 4, "version": 1, "tables": {}}, config_path)
+    os.utime(config_path, ns=(0, 1))
+    assert embed.active_model_name(config_path) == "fake-model"
+    assert len(reads) == 2
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from src.replay_cache import ReplayCache
+
+class FakeRequest:
+    def __init__(self, url, method="GET", headers=None):
+        self.url = url
+        self.method = method
+        self.headers = headers or {}
+        self.post_data_buffer = None
+
+class FakeResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    async def body(self):
+        return self._body
+
+class FakeRoute:
+    """
+    Stands in for a Playwright Route; `server` answers route.fetch().
+    """
+    def __init__(self, request, server=None):
+        self.request = request
+        self.server = server
+        self.fulfilled = None
+        self.aborted = False
+        self.fetch_headers = None
+
+    async def fetch(self, headers=None):
+        if self.server is None:
+            raise ConnectionError("network disabled")
+        self.fetch_headers = headers
+        return self.server(self.request, headers or {})
+
+    async def fulfill(self, status=None, headers=None, body=None, response=None):
+        self.fulfilled = {"status": status, "headers": headers, "body": body}
+
+    async def abort(self):
+        self.aborted = True
+
+def _server(calls):
+    def serve(request, headers):
+        calls.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304, {}, b"")
+        return FakeResponse(200, {"content-type": "application/javascript", "etag": '"v1"',
+                                  "content-encoding": "gzip"}, b"console.log(1)")
+    return serve
+
+def _run(cache, route):
+    asyncio.run(cache.handle(route))
+    return route
+
+def test_records_then_replays(tmp_path):
+    calls = []
+    cache = ReplayCache(str(tmp_path), ttl=60)
+    url = "https://app.hazadapt.com/static/main.js"
+
+    first = _run(cache, FakeRoute(FakeRequest(url), _server(calls)))
+    assert first.fulfilled["body"] == b"console.log(1)"
+    assert "content-encoding" not in first.fulfilled["headers"]
+
+    second = _run(cache, FakeRoute(FakeRequest(url), _server(calls)))
+    assert second.fulfilled["body"] == b"console.log(1)"
+    assert len(calls) == 1
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+def test_method_is_part_of_key(tmp_path):
+    calls = []
+    cache = ReplayCache(str(tmp_path), ttl=60)
+    url = "https://app.hazadapt.com/api/hazards"
+
+    _run(cache, FakeRoute(FakeRequest(url, "GET"), _server(calls)))
+    _run(cache, FakeRoute(FakeRequest(url, "HEAD"), _server(calls)))
+    assert len(calls) == 2
+
+def test_stale_entry_is_revalidated(tmp_path):
+    calls = []
+    cache = ReplayCache(str(tmp_path), ttl=60)
+    url = "https://app.hazadapt.com/static/font.woff2"
+    _run(cache, FakeRoute(FakeRequest(url), _server(calls)))
+
+    # Expire the entry
+    cache.ttl = 0
+    time.sleep(0.01)
+    route = _run(cache, FakeRoute(FakeRequest(url), _server(calls)))
+
+    assert route.fetch_headers["If-None-Match"] == '"v1"'
+    assert route.fulfilled["body"] == b"console.log(1)"
+    assert cache.stats["revalidated"] == 1
+
+def test_offline_mode(tmp_path):
+    calls = []
+    url = "https://app.hazadapt.com/hazards/flood"
+    _run(ReplayCache(str(tmp_path), ttl=0), FakeRoute(FakeRequest(url), _server(calls)))
+
+    offline = ReplayCache(str(tmp_path), mode="offline")
+    hit = _run(offline, FakeRoute(FakeRequest(url)))
+    miss = _run(offline, FakeRoute(FakeRequest(url + "/other")))
+
+    assert hit.fulfilled["status"] == 200
+    assert miss.aborted
+    assert offline.stats["aborted"] == 1
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import numpy as np
+from src.store import init_db, save_structured_documents, delete_structured_by_source
+from src.model_config import save_model_config
+from src.routing_index import RoutingIndex, update_routing_index
+
+DIM = 8
+HAZARDS = ["Flood", "Wildfire", "Earthquake"]
+PHASES = ["Prepare", "Respond"]
+
+def _records(hazard_type, phase, source_file, pages):
+    return [{"hazard_type": hazard_type, "phase": phase, "audience": "General", "topic": "Kits",
+             "content_raw": f"{source_file} page {i}", "source_file": source_file, "page_ref": i,
+             "last_updated": "2024-01-01", "action_items": [], "sources": []} for i in range(pages)]
+
+def _save(rng, hazard_type, phase, source_file, pages, db_name):
+    # Vectors cluster around one direction per (hazard, phase)
+    center = np.zeros(DIM, dtype=np.float32)
+    center[HAZARDS.index(hazard_type) * 2 + PHASES.index(phase)] = 1.0
+    vectors = center + 0.05 * rng.standard_normal((pages, DIM)).astype(np.float32)
+    save_structured_documents(_records(hazard_type, phase, source_file, pages), vectors.tolist(), db_name=db_name)
+
+def test_routed_search_matches_exhaustive_and_rebuilds_incrementally(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    index_dir = os.path.join(tmp_path, "routing_index")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "fake", "dim": DIM, "version": 0, "tables": {}}, config_path)
+    init_db(db_name)
+    rng = np.random.default_rng(0)
+    for hazard_type in HAZARDS:
+        for phase in PHASES:
+            _save(rng, hazard_type, phase, f"{hazard_type}-{phase}.pdf", 20, db_name)
+
+    assert update_routing_index(db_name, index_dir, config_path) == {"rebuilt": 6, "removed": 0, "kept": 0}
+    index = RoutingIndex(index_dir)
+    assert index.rows() == 120 and len(index.hazards) == 3
+
+    # A wildfire query only touches wildfire partitions and still finds the exact neighbours
+    query = np.zeros(DIM, dtype=np.float32)
+    query[2] = 1.0
+    routed = [index.manifest["partitions"][i]["hazard_type"] for i in index.route(query, fan_out=1)]
+    assert routed == ["Wildfire", "Wildfire"]
+    assert index.search(query, k=5, fan_out=1) == index.exhaustive_search(query, k=5)
+    report = index.recall(index.sample_queries(30), k=5, fan_out=1)
+    assert report["recall"] == 1.0
+
+    # Nothing changed: nothing rebuilt
+    assert update_routing_index(db_name, index_dir, config_path)["rebuilt"] == 0
+    # New pages for one partition, a removed partition
+    _save(rng, "Flood", "Prepare", "Flood-Prepare-2.pdf", 5, db_name)
+    delete_structured_by_source("Earthquake-Respond.pdf", db_name=db_name)
+    assert update_routing_index(db_name, index_dir, config_path) == {"rebuilt": 1, "removed": 1, "kept": 4}
+    index = RoutingIndex(index_dir)
+    assert index.rows() == 105
+    assert len(os.listdir(index_dir)) == 6
+
+    # A model change rebuilds everything
+    save_model_config({"model": "fake", "dim": DIM, "version": 1, "tables": {}}, config_path)
+    assert update_routing_index(db_name, index_dir, config_path)["rebuilt"] == 5
+
+def test_signatures_read_only_the_facets_index(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_db(db_name)
+    conn = sqlite3.connect(db_name)
+    plan = " ".join(row[-1] for row in conn.execute('''
+        EXPLAIN QUERY PLAN SELECT hazard_type, phase, COUNT(*), MAX(id), TOTAL(id)
+        FROM structured_hazards GROUP BY hazard_type, phase
+    '''))
+    conn.close()
+    assert "COVERING INDEX idx_structured_hazards_facets" in plan
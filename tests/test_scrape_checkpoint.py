@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import asyncio
+from src.store import init_db
+from src.scrape_checkpoint import init_checkpoints, start_run, finish_run, save_checkpoint, get_checkpoint
+from src.blob_store import init_blob_store
+from src.sections import init_sections, ACTIVE_PANEL_JS
+
+HAZARDS = {
+    "https://app.hazadapt.com/hazards/flood": {"Prepare": "Build a kit", "React": "Move uphill", "Recover": "Boil water"},
+    "https://app.hazadapt.com/hazards/heat": {"Prepare": "Find shade", "React": "Drink water", "Recover": "Rest"},
+}
+
+class FakeLocator:
+    def __init__(self, page, text):
+        self.page = page
+        self.text = text
+
+    async def click(self):
+        # Tabs of the current hazard; there is no PDF button
+        if self.text not in self.page.site.get(self.page.url, {}):
+            raise TimeoutError(f"no element for {self.text}")
+        self.page.tab = self.text
+
+class NoDownload:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakePage:
+    """
+    Stands in for the Playwright page, browser and context scrape_hazards_async drives.
+    """
+    def __init__(self, site):
+        self.site = site
+        self.url = None
+        self.tab = None
+        self.chromium = self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def launch(self, headless=True):
+        return self
+
+    async def new_context(self, accept_downloads=False):
+        return self
+
+    async def new_page(self):
+        return self
+
+    async def close(self):
+        pass
+
+    async def goto(self, url):
+        self.url = url
+
+    async def wait_for_load_state(self, state):
+        pass
+
+    async def wait_for_timeout(self, ms):
+        pass
+
+    def get_by_text(self, text, exact=False):
+        return FakeLocator(self, text)
+
+    def get_by_label(self, text):
+        return FakeLocator(self, text)
+
+    def expect_download(self, timeout=None):
+        return NoDownload()
+
+    async def evaluate(self, script):
+        if script == ACTIVE_PANEL_JS:
+            return {"text": self.site[self.url][self.tab], "scope": "tabpanel"}
+        # The hazard list
+        return [{"href": url, "text": url.rsplit("/", 1)[-1].title()} for url in self.site]
+
+def test_scrape_skips_unchanged_resumes_and_forces(tmp_path, monkeypatch):
+    # scrape_hazards stores under data/ relative to the working directory, and opens the stores on import
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    from src import scrape_hazards
+    for init in (init_db, init_checkpoints, init_blob_store, init_sections):
+        init()
+
+    site = {url: dict(sections) for url, sections in HAZARDS.items()}
+    stored = []
+    replace = scrape_hazards.replace_section_documents
+    monkeypatch.setattr(scrape_hazards, "async_playwright", lambda: FakePage(site))
+    monkeypatch.setattr(scrape_hazards, "generate_embedding", lambda text: [0.5, 0.5])
+    monkeypatch.setattr(scrape_hazards, "replace_section_documents",
+                        lambda url, records: stored.append(url) or replace(url, records))
+    flood, heat = HAZARDS
+
+    def scrape(**kwargs):
+        stored.clear()
+        asyncio.run(scrape_hazards.scrape_hazards_async(**kwargs))
+        return stored
+
+    # Stopped after one hazard: the next run resumes with the other
+    assert scrape(limit=1) == [flood]
+    assert scrape() == [heat]
+
+    # A new run skips hazards whose content matches the checkpoint
+    assert scrape() == []
+    site[heat]["React"] = "Drink more water"
+    assert scrape() == [heat]
+    assert scrape(force=True) == [flood, heat]
+
+    # Re-storing replaced the hazard's rows instead of appending
+    conn = sqlite3.connect(os.path.join("data", "hazards.db"))
+    rows = conn.execute("SELECT source_url, extracted_text FROM documents WHERE source_url LIKE ? ORDER BY id",
+                        (heat + "%",)).fetchall()
+    conn.close()
+    assert [text for _, text in rows] == ["Find shade", "Drink more water", "Rest"]
+
+def test_interrupted_run_resumes_after_completed_hazards(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_db(db_name)
+    init_checkpoints(db_name)
+    run_id, completed = start_run(db_name)
+    assert completed == set()
+    save_checkpoint("https://a", "A", {}, None, run_id, db_name=db_name)
+    save_checkpoint("https://b", "B", {}, None, run_id, db_name=db_name)
+
+    # Crash before finish_run: the next start resumes the same run
+    resumed_id, completed = start_run(db_name)
+    assert resumed_id == run_id
+    assert completed == {"https://a", "https://b"}
+
+    finish_run(run_id, db_name)
+    new_id, completed = start_run(db_name)
+    assert new_id != run_id and completed == set()
+    # Checkpoints of the finished run still drive unchanged-skips
+    assert get_checkpoint("https://a", db_name)["run_id"] == run_id
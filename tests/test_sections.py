@@ -0,0 +1,76 @@
+import os
+import sqlite3
+from src.store import init_db, replace_section_documents
+from src.sections import init_sections, clean_sections, record_lines, learn_boilerplate, learned_boilerplate, line_hash
+
+NAV = "Home\nHazards\nAbout HazAdapt"
+FOOTER = "© HazAdapt, Inc. All rights reserved."
+
+def _hazard_texts(i):
+    return {
+        "Prepare": f"Was this helpful?\nStock water for hazard {i}.",
+        "React": f"Was this helpful?\nMove to high ground {i}.",
+    }
+
+def test_strips_lines_shared_across_hazards(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_sections(db_name)
+    assert learned_boilerplate(db_name) is None
+
+    # Pre-pass over a sample: nothing is stored yet, the chrome set is frozen
+    sample = [f"https://example.org/hazards/h{i}" for i in range(5)]
+    for i, url in enumerate(sample):
+        record_lines(url, _hazard_texts(i), db_name)
+    learn_boilerplate(sample, db_name)
+    assert learned_boilerplate(db_name) == {line_hash("Was this helpful?")}
+
+    # The first hazard stored is cleaned like every later one
+    cleaned = clean_sections("https://example.org/hazards/h0", _hazard_texts(0), db_name=db_name)
+    assert cleaned == {"Prepare": "Stock water for hazard 0.", "React": "Move to high ground 0."}
+
+    # Lines that become common later do not change cleaning until relearned,
+    # so section hashes stay stable across runs
+    for i in range(5, 20):
+        clean_sections(f"https://example.org/hazards/h{i}", {"Prepare": f"Share this page\nTip {i}."}, db_name=db_name)
+    again = clean_sections("https://example.org/hazards/h19", {"Prepare": "Share this page\nTip 19."}, db_name=db_name)
+    assert again == {"Prepare": "Share this page\nTip 19."}
+    # Relearning reads only the new sample, not every hazard recorded so far
+    relearn = [f"https://example.org/hazards/h{i}" for i in range(10, 18)]
+    assert learn_boilerplate(relearn, db_name) == {line_hash("Share this page")}
+    assert learn_boilerplate(sample + relearn[:1], db_name) == {line_hash("Was this helpful?")}
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT hazards FROM scrape_boilerplate_learned").fetchone() == (6,)
+    conn.close()
+
+def test_unscoped_pages_drop_lines_shared_by_all_tabs(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_sections(db_name)
+
+    texts = {
+        "Prepare": f"{NAV}\nMake a kit.\n{FOOTER}",
+        "React": f"{NAV}\nStay indoors.\n{FOOTER}",
+        "Recover": f"{NAV}\n{FOOTER}",
+    }
+    cleaned = clean_sections("https://example.org/hazards/flood", texts, panel_scoped=False, db_name=db_name)
+    assert cleaned == {"Prepare": "Make a kit.", "React": "Stay indoors."}
+
+def test_replace_section_documents(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    init_db(db_name)
+    url = "https://example.org/hazards/flood"
+
+    replace_section_documents(url, [("Prepare", "text/html+section", "old", [0.0], {})], db_name=db_name)
+    replace_section_documents(url, [
+        ("Prepare", "text/html+section", "Make a kit.", [0.1], {"phase": "Prepare"}),
+        ("React", "text/html+section", "Stay indoors.", [0.2], {"phase": "React"}),
+    ], db_name=db_name)
+    replace_section_documents(url + "-2", [("Prepare", "text/html+section", "other", [0.3], {})], db_name=db_name)
+
+    conn = sqlite3.connect(db_name)
+    rows = conn.execute("SELECT source_url, extracted_text FROM documents ORDER BY source_url").fetchall()
+    conn.close()
+    assert rows == [
+        (url + "#prepare", "Make a kit."),
+        (url + "#react", "Stay indoors."),
+        (url + "-2#prepare", "other"),
+    ]
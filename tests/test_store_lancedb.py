@@ -0,0 +1,47 @@
+import os
+import lancedb
+import pyarrow as pa
+from src.store_lancedb import count_fragments, maintain_table, maybe_maintain, table_schema
+
+DIM = 4
+
+def _add(tbl, start, count):
+    tbl.add(pa.table({
+        "id": list(range(start, start + count)),
+        "source_url": [f"https://example.com/{i}" for i in range(start, start + count)],
+        "content_type": ["text/html"] * count,
+        "extracted_text": ["text"] * count,
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array([0.5] * DIM * count, pa.float32()), DIM),
+        "metadata": ["{}"] * count,
+    }, schema=table_schema("documents", DIM)))
+
+def test_maintain_table_compacts_current_fragments(tmp_path):
+    db = lancedb.connect(os.path.join(tmp_path, "lancedb"))
+    tbl = db.create_table("documents", schema=table_schema("documents", DIM))
+    for i in range(10):
+        _add(tbl, i * 2, 2)
+    assert count_fragments(tbl) == 10
+
+    report = maintain_table(db, "documents")
+    assert report["rows"] == 20
+    assert (report["fragments_before"], report["fragments_after"]) == (10, 1)
+    # Files of the pre-compaction versions are still on disk but no longer counted
+    assert count_fragments(db.open_table("documents")) == 1
+    assert {"id", "source_url", "content_type"} <= {c for idx in db.open_table("documents").list_indices() for c in idx.columns}
+
+def test_maybe_maintain_runs_only_past_threshold(tmp_path):
+    uri = os.path.join(tmp_path, "lancedb")
+    db = lancedb.connect(uri)
+    tbl = db.create_table("documents", schema=table_schema("documents", DIM))
+    for i in range(3):
+        _add(tbl, i, 1)
+
+    assert maybe_maintain(threshold=4, lancedb_uri=uri) == []
+    _add(tbl, 3, 1)
+    reports = maybe_maintain(threshold=4, lancedb_uri=uri)
+    assert [(r["table"], r["fragments_after"]) for r in reports] == [("documents", 1)]
+    # Compacted: the next ingest does not trigger maintenance again
+    _add(tbl, 4, 1)
+    assert maybe_maintain(threshold=4, lancedb_uri=uri) == []
+    # A large ingest maintains regardless of fragment count
+    assert len(maybe_maintain(threshold=4, added_rows=4, lancedb_uri=uri)) == 1
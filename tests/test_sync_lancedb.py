@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import lancedb
+from src.store import init_db, save_structured_documents, delete_structured_by_source, upsert_document
+from src.model_config import save_model_config
+from src.sync_lancedb import LanceDBSync
+from src.verify_data import verify
+
+DIM = 4
+
+def _records(source_file, pages, topic="Kits"):
+    return [{"hazard_type": "Flood", "phase": "Prepare", "audience": "General", "topic": topic,
+             "content_raw": f"{source_file} page {i}", "source_file": source_file, "page_ref": i,
+             "last_updated": "2024-01-01", "action_items": ["Build a kit"],
+             "sources": [{"title": "Ready", "url": "https://www.ready.gov/floods"}]} for i in range(pages)]
+
+def _lancedb_ids(uri, table_name):
+    tbl = lancedb.connect(uri).open_table(table_name)
+    return sorted(tbl.search().select(["id"]).limit(None).to_arrow().column("id").to_pylist())
+
+def _sqlite_ids(db_name, table_name):
+    conn = sqlite3.connect(db_name)
+    ids = [row[0] for row in conn.execute(f"SELECT id FROM {table_name} ORDER BY id")]
+    conn.close()
+    return ids
+
+def test_sync_replays_inserts_updates_and_deletes(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    uri = os.path.join(tmp_path, "lancedb")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "fake", "dim": DIM, "version": 0, "tables": {}}, config_path)
+    init_db(db_name)
+    syncer = LanceDBSync(db_name, uri, config_path, batch_rows=3)
+
+    save_structured_documents(_records("a.pdf", 4) + _records("b.pdf", 3), [[1.0] * DIM] * 7, db_name=db_name)
+    upsert_document("https://example.com", "text/html", "hello", [0.5] * DIM, {"k": 1}, db_name=db_name)
+    # First sync takes a snapshot
+    assert syncer.sync(maintain=False) == {"documents": 1, "structured_hazards": 7}
+    assert syncer.pending() == {"documents": 0, "structured_hazards": 0}
+
+    # Reprocess a.pdf, edit a page of b.pdf, replace the document
+    delete_structured_by_source("a.pdf", db_name=db_name)
+    save_structured_documents(_records("a.pdf", 2, topic="Sandbags"), [[2.0] * DIM] * 2, db_name=db_name)
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.execute("UPDATE structured_hazards SET topic = 'Evacuation' WHERE source_file = 'b.pdf' AND page_ref = 1")
+    conn.close()
+    upsert_document("https://example.com", "text/html", "hello again", [0.5] * DIM, {"k": 2}, db_name=db_name)
+    assert syncer.pending() == {"documents": 2, "structured_hazards": 7}
+
+    applied = syncer.sync(maintain=False)
+    assert applied == {"documents": 2, "structured_hazards": 7}
+    assert syncer.pending() == {"documents": 0, "structured_hazards": 0}
+    for table_name in ("documents", "structured_hazards"):
+        assert _lancedb_ids(uri, table_name) == _sqlite_ids(db_name, table_name)
+
+    tbl = lancedb.connect(uri).open_table("structured_hazards")
+    assert tbl.search().where("topic = 'Evacuation'").limit(None).to_arrow().num_rows == 1
+    report = verify(db_name, uri, batch_rows=4, report_path=None, config_path=config_path)
+    assert report["parity"]["ok"] and report["ok"]
+
+    # Nothing new: no writes
+    version = tbl.version
+    assert syncer.sync(maintain=False) == {"documents": 0, "structured_hazards": 0}
+    assert lancedb.connect(uri).open_table("structured_hazards").version == version
+
+def test_applied_changes_are_pruned_after_retention(tmp_path):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "fake", "dim": DIM, "version": 0, "tables": {}}, config_path)
+    init_db(db_name)
+    syncer = LanceDBSync(db_name, os.path.join(tmp_path, "lancedb"), config_path)
+    syncer.sync(maintain=False)
+
+    save_structured_documents(_records("a.pdf", 3), [[1.0] * DIM] * 3, db_name=db_name)
+    syncer.sync(maintain=False)
+    conn = sqlite3.connect(db_name)
+    # Applied but recent: kept for delta exports
+    assert conn.execute("SELECT COUNT(*) FROM lancedb_changes").fetchone()[0] == 3
+    with conn:
+        conn.execute("UPDATE lancedb_changes SET changed_at = datetime('now', '-8 days')")
+    save_structured_documents(_records("b.pdf", 1), [[1.0] * DIM], db_name=db_name)
+    syncer.sync(maintain=False)
+    assert [row[0] for row in conn.execute("SELECT seq FROM lancedb_changes")] == [4]
+    assert conn.execute("SELECT pruned_seq FROM lancedb_sync WHERE table_name = 'structured_hazards'").fetchone()[0] == 3
+    conn.close()
+
+def test_sync_waits_for_the_lease_and_skips_appends_of_a_crashed_sync(tmp_path, monkeypatch):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    uri = os.path.join(tmp_path, "lancedb")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "fake", "dim": DIM, "version": 0, "tables": {}}, config_path)
+    init_db(db_name)
+    syncer = LanceDBSync(db_name, uri, config_path)
+    syncer.sync(("structured_hazards",), maintain=False)
+
+    # Killed after appending to LanceDB, before saving the sync state
+    save_structured_documents(_records("a.pdf", 3), [[1.0] * DIM] * 3, db_name=db_name)
+    monkeypatch.setattr(syncer, "_save_state", lambda *args: (_ for _ in ()).throw(KeyboardInterrupt()))
+    try:
+        syncer.sync_table("structured_hazards")
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.undo()
+    assert len(_lancedb_ids(uri, "structured_hazards")) == 3
+
+    # Another process holds the lease; its expiry lets the next syncer take over
+    other = LanceDBSync(db_name, uri, config_path, lease_seconds=0.5)
+    assert other._take_lease("structured_hazards")
+    assert not syncer._take_lease("structured_hazards")
+    save_structured_documents(_records("b.pdf", 1), [[1.0] * DIM], db_name=db_name)
+    syncer.sync(("structured_hazards",), maintain=False)
+    assert _lancedb_ids(uri, "structured_hazards") == _sqlite_ids(db_name, "structured_hazards")
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT lease_owner FROM lancedb_sync WHERE table_name = 'structured_hazards'").fetchone()[0] is None
+    conn.close()
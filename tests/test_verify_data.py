@@ -0,0 +1,66 @@
+import os
+import json
+import lancedb
+import pyarrow as pa
+import numpy as np
+from src.store import init_db, save_structured_documents
+from src.model_config import save_model_config
+from src.verify_data import verify
+
+DIM = 4
+
+def _records(source_file, pages):
+    return [{"hazard_type": "Flood", "phase": "Prepare", "audience": "General", "topic": "Kits",
+             "content_raw": f"{source_file} page {i}", "source_file": source_file, "page_ref": i,
+             "last_updated": "2024-01-01"} for i in range(pages)]
+
+def _lance_row(data, vector):
+    # Rows as the pre-sync LanceDB writers stored them: no id column
+    return {"hazard_type": data["hazard_type"], "phase": data["phase"], "audience": data["audience"],
+            "topic": data["topic"], "content_raw": data["content_raw"], "action_items": json.dumps([]),
+            "sources": json.dumps([]), "source_file": data["source_file"], "page_ref": data["page_ref"],
+            "last_updated": data["last_updated"], "vector": vector}
+
+def _setup(tmp_path, sqlite_rows, lancedb_rows):
+    db_name = os.path.join(tmp_path, "hazards.db")
+    uri = os.path.join(tmp_path, "lancedb")
+    config_path = os.path.join(tmp_path, "embedding_model.json")
+    save_model_config({"model": "fake", "dim": DIM, "version": 0, "tables": {}}, config_path)
+
+    init_db(db_name)
+    save_structured_documents([r for r, _ in sqlite_rows], [v for _, v in sqlite_rows], db_name=db_name)
+    rows = [_lance_row(r, list(v)) for r, v in lancedb_rows]
+    schema = pa.schema([(k, pa.int32() if k == "page_ref" else pa.string()) for k in rows[0] if k != "vector"]
+                       + [("vector", pa.list_(pa.float32(), DIM))])
+    lancedb.connect(uri).create_table("structured_hazards", data=rows, schema=schema)
+    return dict(db_name=db_name, lancedb_uri=uri, config_path=config_path,
+                report_path=os.path.join(tmp_path, "report.json"), batch_rows=3)
+
+def test_verify_clean_stores(tmp_path):
+    rows = [(r, np.full(DIM, i + 1, dtype=np.float32)) for i, r in enumerate(_records("a.pdf", 4) + _records("b.pdf", 3))]
+    report = verify(**_setup(tmp_path, rows, rows))
+
+    assert report["ok"]
+    assert report["stores"]["sqlite"]["rows"] == report["stores"]["lancedb"]["rows"] == 7
+    with open(os.path.join(tmp_path, "report.json")) as f:
+        assert json.load(f)["ok"]
+
+def test_verify_locates_problems(tmp_path):
+    rows = [(r, np.full(DIM, i + 1, dtype=np.float32)) for i, r in enumerate(_records("a.pdf", 4) + _records("b.pdf", 3))]
+    sqlite_rows = list(rows)
+    sqlite_rows[0] = (rows[0][0], np.array([np.nan] * DIM, dtype=np.float32))
+    # LanceDB lost a page of b.pdf and holds a page of a.pdf twice
+    lancedb_rows = rows[:6] + [rows[1]]
+    report = verify(**_setup(tmp_path, sqlite_rows, lancedb_rows))
+
+    assert not report["ok"]
+    sqlite = report["stores"]["sqlite"]
+    assert sqlite["vectors"]["nan"] == 1
+    assert sqlite["examples"]["nan_vector"] == [{"source_file": "a.pdf", "page_ref": 0}]
+    lance = report["stores"]["lancedb"]
+    assert lance["duplicate_keys"] == 1
+    assert lance["examples"]["duplicate_key"] == [{"source_file": "a.pdf", "page_ref": 1}]
+
+    files = {f["source_file"]: f["status"] for f in report["parity"]["mismatched_files"]}
+    # a.pdf differs in content (NaN vector) and row count (duplicate); b.pdf is short a row
+    assert files == {"a.pdf": "row_count", "b.pdf": "row_count"}
@@ -0,0 +1,142 @@
+import os
+import sys
+import types
+import multiprocessing
+from src import post_write, work_queue
+from src.work_queue import WorkQueue, Worker
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def record_job(payload):
+    # O_APPEND writes of one short line are atomic across processes
+    with open(payload["log"], "a") as f:
+        f.write(f"{payload['n']}\n")
+
+def crash_once(payload):
+    # The first worker to run this dies mid-job without releasing its lease
+    if not os.path.exists(payload["marker"]):
+        open(payload["marker"], "w").close()
+        os._exit(1)
+    record_job(payload)
+
+def run_worker(db_name):
+    queue = WorkQueue(db_name, lease_seconds=1)
+    Worker(queue, {"record": record_job, "crash": crash_once}, idle_sleep=0.1).run(exit_when_empty=True)
+
+def test_lease_expiry_and_retry(tmp_path):
+    clock = FakeClock()
+    queue = WorkQueue(os.path.join(tmp_path, "queue.db"), lease_seconds=10, clock=clock)
+    job_id = queue.enqueue("pdf", {"path": "a.pdf"})
+    assert queue.enqueue("pdf", {"path": "a.pdf"}) is None
+
+    job = queue.lease("a")
+    assert job["id"] == job_id and job["attempts"] == 1
+    assert queue.lease("b") is None
+
+    # a stops heartbeating; b takes over once the lease expires
+    clock.now += 11
+    job = queue.lease("b")
+    assert job["id"] == job_id and job["attempts"] == 2
+    assert not queue.heartbeat(job_id, "a")
+    assert not queue.complete(job_id, "a")
+
+    # A failure is retried after a backoff, until attempts run out
+    assert queue.fail(job_id, "b", "boom")
+    clock.now += 3600
+    job = queue.lease("b")
+    assert job["attempts"] == 3
+    assert queue.fail(job_id, "b", "boom again")
+    assert queue.counts() == {"failed": 1}
+
+    assert queue.retry_failed() == 1
+    assert queue.complete(queue.lease("b")["id"], "b")
+    assert queue.counts() == {"done": 1}
+    # Finished work can be enqueued again
+    assert queue.enqueue("pdf", {"path": "a.pdf"}) is not None
+
+def test_fail_checks_lease_and_releases_dedupe_key(tmp_path):
+    clock = FakeClock()
+    queue = WorkQueue(os.path.join(tmp_path, "queue.db"), lease_seconds=10, clock=clock)
+    job_id = queue.enqueue("pdf", {"path": "a.pdf"}, max_attempts=2)
+    queue.lease("a")
+    clock.now += 11
+    assert queue.lease("b")["id"] == job_id
+
+    # a lost the lease: its failure report changes nothing
+    assert not queue.fail(job_id, "a", "stale")
+    assert queue.counts() == {"leased": 1}
+
+    assert queue.fail(job_id, "b", "boom")
+    assert queue.counts() == {"failed": 1}
+    # The failed job no longer blocks the same work
+    again = queue.enqueue("pdf", {"path": "a.pdf"})
+    assert again is not None
+    # ...and is not requeued next to it
+    assert queue.retry_failed() == 0
+    assert queue.complete(queue.lease("b")["id"], "b")
+    assert queue.retry_failed() == 1
+
+def test_worker_runs_idle_hook_once_per_drain(tmp_path):
+    queue = WorkQueue(os.path.join(tmp_path, "queue.db"))
+    log = os.path.join(tmp_path, "log.txt")
+    queue.enqueue_many("record", [{"n": n, "log": log} for n in range(3)])
+    drained = []
+    worker = Worker(queue, {"record": record_job}, idle_sleep=0, on_idle=lambda: drained.append(queue.pending()))
+    assert worker.run(exit_when_empty=True) == 3
+    # Once for all three jobs, with nothing left pending; not again while idle
+    assert drained == [0]
+    assert worker.run(exit_when_empty=True) == 0 and drained == [0]
+
+def test_worker_updates_routing_index_without_sync(tmp_path, monkeypatch):
+    queue = WorkQueue(os.path.join(tmp_path, "queue.db"))
+    log = os.path.join(tmp_path, "log.txt")
+    queue.enqueue("record", {"n": 0, "log": log})
+    calls = []
+    monkeypatch.setattr(post_write, "LanceDBSync", lambda: calls.append("sync"))
+    monkeypatch.setattr(post_write, "update_routing_index", lambda: calls.append("routing"))
+    monkeypatch.setitem(work_queue.HANDLERS, "record", record_job)
+    # Rows can change (or only be deleted) with syncing left for later
+    assert work_queue.run_worker(queue, exit_when_empty=True, sync=False) == 1
+    assert calls == ["routing"]
+
+def test_failed_url_job_is_queued_again(tmp_path, monkeypatch):
+    clock = FakeClock()
+    queue = WorkQueue(os.path.join(tmp_path, "queue.db"), clock=clock)
+    queue.enqueue("url", {"url": "https://example.com/gone"})
+    # process_url reports a failed fetch by returning False, not raising
+    monkeypatch.setitem(sys.modules, "src.ingest", types.SimpleNamespace(process_url=lambda url: False))
+    worker = Worker(queue, idle_sleep=0)
+    assert worker.run(max_jobs=1) == 1
+    assert queue.counts() == {"queued": 1}
+    assert queue.lease("b") is None
+
+    clock.now += 3600
+    monkeypatch.setitem(sys.modules, "src.ingest", types.SimpleNamespace(process_url=lambda url: True))
+    assert worker.run(max_jobs=1) == 1
+    assert queue.counts() == {"done": 1}
+
+def test_workers_share_queue(tmp_path):
+    db_name = os.path.join(tmp_path, "queue.db")
+    log = os.path.join(tmp_path, "log.txt")
+    queue = WorkQueue(db_name, lease_seconds=1)
+    queue.enqueue_many("record", [{"n": n, "log": log} for n in range(30)])
+    queue.enqueue("crash", {"n": 30, "log": log, "marker": os.path.join(tmp_path, "crashed")})
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=run_worker, args=(db_name,)) for _ in range(3)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(timeout=60)
+
+    assert sorted(p.exitcode for p in workers) == [0, 0, 1]
+    with open(log) as f:
+        done = sorted(int(line) for line in f)
+    # Every job ran exactly once, the crashed one after its lease was reclaimed
+    assert done == list(range(31))
+    assert queue.counts() == {"done": 31}